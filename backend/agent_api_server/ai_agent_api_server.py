@@ -30,12 +30,17 @@ from azure.ai.agents.aio import AgentsClient
 
 from azure.ai.agents.models import (AgentStreamEvent,
                                     MessageDeltaChunk, 
+                                    ThreadMessage,
+                                    ThreadRun,
+                                    RunStep,
+                                    ListSortOrder,
                                     McpTool, 
                                     SubmitToolApprovalAction, 
                                     RequiredMcpToolCall,
                                     ToolApproval)
 from azure.identity.aio import DefaultAzureCredential
 import asyncio
+from state_store import STATE
 
 load_dotenv()
 
@@ -70,7 +75,7 @@ _AGENT = None  # cache the agent object; no global agent_id
 
 
 agents_client: AgentsClient | None = None
-SESSION_THREADS: dict[str, str] = {}
+# ui_session -> thread_id lives in STATE ("thread" namespace) so any replica can resume a thread
 
 # Cache the actual agent object (so we don't expose or manage agent_id globally)
 _cached_agent = None
@@ -162,6 +167,7 @@ async def lifespan(app: FastAPI):
     try:
         yield
     finally:
+        await STATE.aclose()
         if agents_client:
             await agents_client.close()
 
@@ -251,52 +257,60 @@ def _extract_message_text(msg) -> str:
     return "\n".join(chunks).strip()
 
 
-async def _fetch_last_assistant_with_retry(agents_client, thread_id: str,
-                                           attempts: int = 12, delay_s: float = 0.25) -> Optional[str]:
+async def _fetch_newest_assistant(agents_client, thread_id: str, run_id: Optional[str] = None,
+                                  attempts: int = 12, delay_s: float = 0.25) -> Optional[str]:
     """
-    After DONE, the assistant message may not be visible immediately.
-    Poll a few times with small delays; return the newest assistant text found.
+    Fallback when the stream carried no assistant text: ask only for the newest
+    message (descending, limit 1) so the cost doesn't grow with thread length.
     """
-    for i in range(attempts):
-        last_assistant_msg = None
-        last_ts = None
-
-        # Do not assume pager order; scan all messages we get in this page.
-        async for m in agents_client.messages.list(thread_id=thread_id):
+    for _ in range(attempts):
+        async for m in agents_client.messages.list(
+            thread_id=thread_id, run_id=run_id, order=ListSortOrder.DESCENDING, limit=1
+        ):
             if getattr(m, "role", None) == "assistant":
-                # Prefer the latest by created time if available; else keep the last encountered
-                ts = getattr(m, "created_at", None) or getattr(m, "timestamp", None)
-                if last_ts is None or (ts is not None and ts >= last_ts):
-                    last_assistant_msg = m
-                    last_ts = ts
-
-        if last_assistant_msg:
-            text = _extract_message_text(last_assistant_msg)
-            if text:  # found usable text
-                return text
-
-        # Not found yet; brief backoff
+                text = _extract_message_text(m)
+                if text:
+                    return text
+            break
+
+        # Not visible yet; brief backoff
         await asyncio.sleep(delay_s)
 
     return None
 
-async def handle_user_query(user_id: str, user_query: str, ui_session: str):
+def _tool_step_event(step) -> Optional[str]:
+    """SSE `tool` frame for a tool_calls run step, or None for other steps."""
+    details = getattr(step, "step_details", None)
+    if getattr(step, "type", None) != "tool_calls" or details is None:
+        return None
+    names = []
+    for tc in getattr(details, "tool_calls", None) or []:
+        names.append(getattr(tc, "name", None) or getattr(getattr(tc, "function", None), "name", None) or getattr(tc, "type", "tool"))
+    status = getattr(step, "status", None)
+    payload = {"id": step.id, "tools": names, "status": getattr(status, "value", status)}
+    return "event: tool\n" + f"data: {json.dumps(payload)}\n\n"
+
+
+async def handle_user_query(user_id: str, user_query: str, ui_session: str, stream_tokens: bool = False):
     assert agents_client is not None and _AGENT is not None
 
     # per-session thread
-    thread_id = SESSION_THREADS.get(ui_session)
+    thread_id = await STATE.get("thread", ui_session)
     if not thread_id:
         thread = await agents_client.threads.create()
         thread_id = thread.id
-        SESSION_THREADS[ui_session] = thread_id
+        STATE.set("thread", ui_session, thread_id)
 
     await agents_client.messages.create(thread_id, role="user", content=user_query)
 
     async def sse_generator():
         """
-        Start a streaming run but do NOT emit partial tokens.
+        Start a streaming run. By default partial tokens are NOT emitted.
         - Auto-approve MCP tool calls when the run requires action.
-        - After the run completes, fetch the latest assistant message and emit it once.
+        - With `stream_tokens`, forward text deltas as they arrive and `tool` frames
+          for tool-call run steps, then a final `done` event.
+        - Otherwise, emit the run's final assistant text once, taken from the
+          message-completed / delta events (newest-message fetch only as fallback).
         - On errors, emit a single 'error' event.
         """
         assert agents_client is not None and _AGENT is not None
@@ -307,9 +321,51 @@ async def handle_user_query(user_id: str, user_query: str, ui_session: str):
                 agent_id=_AGENT.id,
             )
 
+            # Final text is assembled from the run's own events; no post-DONE polling
+            run_id: Optional[str] = None
+            # after a tool approval the resumed run streams through this same handler;
+            # a DONE seen before the run reaches a terminal state isn't the end
+            resumed = False
+            run_finished = False
+            completed_text: Optional[str] = None
+            delta_msg_id: Optional[str] = None
+            delta_parts: list[str] = []
+
             async with stream_cm as stream:
-                # We suppress partial token deltas entirely.
                 async for event_type, event_data, _ in stream:
+                    if isinstance(event_data, ThreadRun):
+                        run_id = event_data.id
+                        if event_type in (AgentStreamEvent.THREAD_RUN_COMPLETED, AgentStreamEvent.THREAD_RUN_FAILED,
+                                          AgentStreamEvent.THREAD_RUN_CANCELLED, AgentStreamEvent.THREAD_RUN_EXPIRED):
+                            run_finished = True
+
+                    if isinstance(event_data, MessageDeltaChunk):
+                        # keep only the deltas of the newest message
+                        if event_data.id != delta_msg_id:
+                            delta_msg_id, delta_parts = event_data.id, []
+                        if event_data.text:
+                            delta_parts.append(event_data.text)
+                            # Opt-in token streaming: forward deltas as they arrive
+                            if stream_tokens:
+                                yield "data: " + json.dumps({"text": event_data.text}) + "\n\n"
+                        continue
+
+                    if event_type == AgentStreamEvent.THREAD_MESSAGE_COMPLETED and isinstance(event_data, ThreadMessage):
+                        if getattr(event_data, "role", None) == "assistant":
+                            completed_text = _extract_message_text(event_data) or completed_text
+                        continue
+
+                    # Opt-in token streaming: forward tool progress as it happens
+                    if stream_tokens:
+                        if isinstance(event_data, RunStep) and event_type in (
+                            AgentStreamEvent.THREAD_RUN_STEP_CREATED,
+                            AgentStreamEvent.THREAD_RUN_STEP_COMPLETED,
+                        ):
+                            frame = _tool_step_event(event_data)
+                            if frame:
+                                yield frame
+                            continue
+
                     # Handle tool approval when required
                     if event_type == AgentStreamEvent.THREAD_RUN_REQUIRES_ACTION:
                         try:
@@ -328,11 +384,15 @@ async def handle_user_query(user_id: str, user_query: str, ui_session: str):
                                             )
                                         )
                                 if approvals:
-                                    await agents_client.runs.submit_tool_outputs(
+                                    # the resumed run's events (tool steps, deltas, completion)
+                                    # continue in this `async for` via the same handler
+                                    await agents_client.runs.submit_tool_outputs_stream(
                                         thread_id=thread_id,
                                         run_id=event_data.id,
                                         tool_approvals=approvals,
+                                        event_handler=stream,
                                     )
+                                    resumed = True
                         except Exception as tool_err:
                             # Single error event; no further streaming
                             yield "event: error\n"
@@ -345,24 +405,30 @@ async def handle_user_query(user_id: str, user_query: str, ui_session: str):
                         yield f"data: {json.dumps({'error': str(event_data)})}\n\n"
                         return
 
-                    # Normal completion: fetch final assistant message and emit once
                     if event_type == AgentStreamEvent.DONE:
-                        try:
-                            final_text = await _fetch_last_assistant_with_retry(agents_client, thread_id)
-                            if not final_text:
-                                final_text = "[No assistant text content returned.]"
-                        except Exception as fetch_err:
-                            yield "event: error\n"
-                            yield f"data: {json.dumps({'error': f'final_fetch_failed: {str(fetch_err)}'})}\n\n"
-                            return
+                        if resumed and not run_finished:
+                            continue
+                        break
 
-                        # Emit exactly one payload (no token streaming)
-                        yield "data: " + json.dumps({"text": final_text}) + "\n\n"
-                        return
+            if stream_tokens:
+                # deltas already delivered the text
+                yield "event: done\ndata: {}\n\n"
+                return
 
-
-
-                        
+            # Normal completion: emit the run's final assistant message once
+            try:
+                final_text = completed_text or "".join(delta_parts).strip()
+                if not final_text:
+                    final_text = await _fetch_newest_assistant(agents_client, thread_id, run_id)
+                if not final_text:
+                    final_text = "[No assistant text content returned.]"
+            except Exception as fetch_err:
+                yield "event: error\n"
+                yield f"data: {json.dumps({'error': f'final_fetch_failed: {str(fetch_err)}'})}\n\n"
+                return
+
+            # Emit exactly one payload (no token streaming)
+            yield "data: " + json.dumps({"text": final_text}) + "\n\n"
 
         except Exception as e:
             # Single terminal error
@@ -381,4 +447,6 @@ async def handle_user_query(user_id: str, user_query: str, ui_session: str):
 async def start_conversation(user_id: str, convo: ConversationIn, request: Request):
     sid = request.query_params.get("sid")
     ui_session = _normalize_session_id(sid)
-    return await handle_user_query(user_id, convo.user_query, ui_session)
+    # opt-in token streaming: POST /conversation/{user_id}?stream=true
+    stream_tokens = request.query_params.get("stream", "").lower() in ("1", "true", "yes")
+    return await handle_user_query(user_id, convo.user_query, ui_session, stream_tokens=stream_tokens)
@@ -0,0 +1,141 @@
+import os, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))      # cosine similarity for a hit
+ANSWER_CACHE_FRESHNESS = float(os.getenv("ANSWER_CACHE_FRESHNESS", "300"))       # answer returned as-is this long
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))                 # plan (tool calls) reused this long
+ANSWER_CACHE_MAX_PER_USER = int(os.getenv("ANSWER_CACHE_MAX_PER_USER", "200"))
+ANSWER_CACHE_MAX_USERS = int(os.getenv("ANSWER_CACHE_MAX_USERS", "1000"))       # LRU cap on users held
+# read-only tools whose calls are safe to replay for a similar question
+ANSWER_CACHE_TOOLS = {t.strip() for t in os.getenv(
+    "ANSWER_CACHE_TOOLS", "query_salesforce,aggregate_records,query_local_mirror,describe_object").split(",") if t.strip()}
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+class _UserIndex:
+    """One user's cached questions: unit vectors stacked row-wise, entries in the same order."""
+    def __init__(self) -> None:
+        self.vectors: Optional[np.ndarray] = None
+        self.entries: List[Dict[str, Any]] = []
+
+    def prune(self, now: float, ttl: float) -> int:
+        keep = [i for i, e in enumerate(self.entries) if now - e["created"] <= ttl]
+        dropped = len(self.entries) - len(keep)
+        if dropped:
+            self.entries = [self.entries[i] for i in keep]
+            self.vectors = self.vectors[keep] if keep else None
+        return dropped
+
+    def best(self, vec: np.ndarray) -> tuple:
+        if self.vectors is None:
+            return -1, -1.0
+        # brute force: one matrix-vector product over at most ANSWER_CACHE_MAX_PER_USER rows
+        scores = self.vectors @ vec
+        i = int(np.argmax(scores))
+        return i, float(scores[i])
+
+    def remove(self, i: int) -> None:
+        del self.entries[i]
+        self.vectors = np.delete(self.vectors, i, axis=0) if self.entries else None
+
+    def add(self, vec: np.ndarray, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+        self.vectors = vec[None, :] if self.vectors is None else np.vstack([self.vectors, vec])
+
+
+class AnswerCache:
+    """
+    Semantic cache of answered questions, per user, searched by embedding similarity.
+    A match younger than the freshness window returns its answer; an older one (up to
+    the TTL) returns its tool calls so only the query is re-run, not the planning call.
+    """
+    def __init__(self, embed: Optional[Embedder], threshold: float = ANSWER_CACHE_THRESHOLD,
+                 freshness: float = ANSWER_CACHE_FRESHNESS, ttl: float = ANSWER_CACHE_TTL,
+                 max_per_user: int = ANSWER_CACHE_MAX_PER_USER, max_users: int = ANSWER_CACHE_MAX_USERS) -> None:
+        self.embed = embed
+        self.threshold = threshold
+        self.freshness = freshness
+        self.ttl = ttl
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self._users: "OrderedDict[str, _UserIndex]" = OrderedDict()
+        self.counters = {"lookups": 0, "answer_hits": 0, "plan_hits": 0, "misses": 0, "stores": 0,
+                         "evictions": 0, "embed_errors": 0}
+        self._embeds = 0
+        self._embed_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.embed is not None
+
+    async def vector(self, question: str) -> Optional[np.ndarray]:
+        """Normalized embedding of `question`, or None when embedding fails (the turn runs uncached)."""
+        started = time.perf_counter()
+        try:
+            vec = np.asarray(await self.embed(question.strip().lower()), dtype=np.float32)
+        except Exception as e:
+            self.counters["embed_errors"] += 1
+            print(f"[answer-cache] embedding failed: {e}", flush=True)
+            return None
+        self._embeds += 1
+        self._embed_ms += (time.perf_counter() - started) * 1000
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def lookup(self, user_id: str, vec: np.ndarray) -> Optional[Dict[str, Any]]:
+        """{"kind": "answer" | "plan", "entry": …, "score": …} for the closest fresh match, else None."""
+        self.counters["lookups"] += 1
+        index = self._users.get(user_id)
+        now = time.time()
+        if index is not None:
+            self._users.move_to_end(user_id)
+            self.counters["evictions"] += index.prune(now, self.ttl)
+            i, score = index.best(vec)
+            if i >= 0 and score >= self.threshold:
+                entry = index.entries[i]
+                kind = "answer" if now - entry["created"] <= self.freshness else "plan"
+                self.counters[f"{kind}_hits"] += 1
+                return {"kind": kind, "entry": entry, "score": score}
+        self.counters["misses"] += 1
+        return None
+
+    def store(self, user_id: str, vec: np.ndarray, question: str, calls: List[Dict[str, Any]], answer: List[str]) -> None:
+        """Remember a turn answered by replayable tool calls; a near-duplicate question replaces its older entry."""
+        if not calls or not answer or any(c["name"] not in ANSWER_CACHE_TOOLS or c["failed"] for c in calls):
+            return
+        index = self._users.get(user_id)
+        if index is None:
+            index = self._users[user_id] = _UserIndex()
+            while len(self._users) > self.max_users:
+                _, old = self._users.popitem(last=False)
+                self.counters["evictions"] += len(old.entries)
+        self._users.move_to_end(user_id)
+        i, score = index.best(vec)
+        if i >= 0 and score >= self.threshold:
+            index.remove(i)
+        elif len(index.entries) >= self.max_per_user:
+            index.remove(0)                                 # oldest first
+            self.counters["evictions"] += 1
+        index.add(vec, {
+            "question": question,
+            "calls": [{"name": c["name"], "arguments": c["arguments"]} for c in calls],
+            "answer": answer,
+            "created": time.time(),
+        })
+        self.counters["stores"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["answer_hits"] + self.counters["plan_hits"]
+        lookups = self.counters["lookups"]
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "embed_ms_avg": round(self._embed_ms / self._embeds, 1) if self._embeds else 0.0,
+            "users": len(self._users),
+            "entries": sum(len(ix.entries) for ix in self._users.values()),
+        }
@@ -0,0 +1,167 @@
+import os, time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from state_store import StateStore
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))       # per session/user conversation
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "1000"))       # LRU cap on conversations held
+HISTORY_IDLE_SECONDS = float(os.getenv("HISTORY_IDLE_SECONDS", "3600"))     # evict conversations idle this long
+
+Summarizer = Callable[[List[Dict[str, Any]]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 chars per token for English); good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class _Conversation:
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, Any]] = []
+        self.summary: Optional[str] = None
+        self.tokens = 0
+        self.chars = 0
+        self.last_used = time.monotonic()
+        self.updated = 0.0  # wall clock of the last change, compared across replicas
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> "_Conversation":
+        convo = cls()
+        for msg in record.get("messages", []):
+            convo.add(msg)
+        convo.set_summary(record.get("summary"))
+        convo.updated = record.get("updated", 0.0)
+        return convo
+
+    def to_record(self) -> Dict[str, Any]:
+        return {"messages": self.messages, "summary": self.summary, "updated": self.updated}
+
+    def add(self, msg: Dict[str, Any]) -> None:
+        self.messages.append(msg)
+        self.tokens += estimate_tokens(msg["content"])
+        self.chars += len(msg["content"])
+
+    def pop_oldest(self) -> Dict[str, Any]:
+        msg = self.messages.pop(0)
+        self.tokens -= estimate_tokens(msg["content"])
+        self.chars -= len(msg["content"])
+        return msg
+
+    def set_summary(self, summary: Optional[str]) -> None:
+        if self.summary:
+            self.tokens -= estimate_tokens(self.summary)
+            self.chars -= len(self.summary)
+        self.summary = summary or None
+        if self.summary:
+            self.tokens += estimate_tokens(self.summary)
+            self.chars += len(self.summary)
+
+
+class HistoryStore:
+    """
+    Bounded per-session, per-user chat histories.
+    - each conversation is held to `token_budget`; `compact()` folds the oldest
+      turns into a rolling summary (or drops them when no summarizer is set)
+    - `append()` hard-truncates at twice the budget in case compact() is skipped
+    - conversations are evicted LRU beyond `max_sessions` and after `idle_ttl`
+    - with a shared `store`, this is a local cache: changes are written through
+      and a newer copy written by another replica replaces the local one
+    """
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, max_sessions: int = HISTORY_MAX_SESSIONS,
+                 idle_ttl: float = HISTORY_IDLE_SECONDS, summarizer: Optional[Summarizer] = None,
+                 store: Optional[StateStore] = None) -> None:
+        self.store = store
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.summarizer = summarizer
+        self._convos: "OrderedDict[Tuple[str, str], _Conversation]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self.counters: Dict[str, int] = {"evicted": 0, "truncated": 0, "summarized": 0}
+
+    async def _convo(self, session_id: str, user_id: str) -> _Conversation:
+        key = (session_id, user_id)
+        convo = self._convos.get(key)
+        if self.store is not None:
+            record = await self.store.get("history", f"{session_id}/{user_id}")
+            if record and (convo is None or record.get("updated", 0.0) > convo.updated):
+                convo = self._convos[key] = _Conversation.from_record(record)
+        if convo is None:
+            convo = self._convos[key] = _Conversation()
+        self._convos.move_to_end(key)
+        convo.last_used = time.monotonic()
+        self._evict()
+        return convo
+
+    def _evict(self) -> None:
+        while len(self._convos) > self.max_sessions:
+            self._convos.popitem(last=False)
+            self.counters["evicted"] += 1
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        # LRU order: idle conversations are at the front
+        while self._convos:
+            key, convo = next(iter(self._convos.items()))
+            if now - convo.last_used <= self.idle_ttl:
+                break
+            del self._convos[key]
+            self.counters["evicted"] += 1
+
+    def _persist(self, session_id: str, user_id: str, convo: _Conversation) -> None:
+        convo.updated = time.time()
+        if self.store is not None:
+            self.store.set("history", f"{session_id}/{user_id}", convo.to_record())
+
+    async def get_history(self, session_id: str, user_id: str) -> List[Dict[str, Any]]:
+        convo = await self._convo(session_id, user_id)
+        if convo.summary:
+            head = {"role": "system", "content": f"Summary of the earlier conversation: {convo.summary}"}
+            return [head, *convo.messages]
+        return list(convo.messages)
+
+    async def append(self, session_id: str, user_id: str, role: str, content: str) -> None:
+        convo = await self._convo(session_id, user_id)
+        convo.add({"role": role, "content": content})
+        while convo.tokens > 2 * self.token_budget and len(convo.messages) > 1:
+            convo.pop_oldest()
+            self.counters["truncated"] += 1
+        self._persist(session_id, user_id, convo)
+
+    async def compact(self, session_id: str, user_id: str) -> None:
+        """Bring a conversation back under budget, summarizing the oldest turns when possible."""
+        convo = self._convos.get((session_id, user_id))
+        if convo is None or convo.tokens <= self.token_budget:
+            return
+        # drop down to half the budget so compaction doesn't run every turn
+        dropped: List[Dict[str, Any]] = []
+        while convo.tokens > self.token_budget // 2 and len(convo.messages) > 2:
+            dropped.append(convo.pop_oldest())
+        if not dropped:
+            return
+        if self.summarizer is None:
+            self.counters["truncated"] += len(dropped)
+        else:
+            prior = [{"role": "system", "content": convo.summary}] if convo.summary else []
+            try:
+                convo.set_summary(await self.summarizer(prior + dropped))
+                self.counters["summarized"] += len(dropped)
+            except Exception as e:
+                print(f"[history] summarization failed, dropped {len(dropped)} messages: {e}", flush=True)
+                self.counters["truncated"] += len(dropped)
+        self._persist(session_id, user_id, convo)
+
+    def delete(self, session_id: str, user_id: str) -> None:
+        self._convos.pop((session_id, user_id), None)
+        if self.store is not None:
+            self.store.delete("history", f"{session_id}/{user_id}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "conversations": len(self._convos),
+            "messages": sum(len(c.messages) for c in self._convos.values()),
+            "tokens": sum(c.tokens for c in self._convos.values()),
+            "content_chars": sum(c.chars for c in self._convos.values()),
+            **self.counters,
+        }
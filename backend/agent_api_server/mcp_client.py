@@ -1,13 +1,15 @@
 
 
 import asyncio
+import contextlib
 import uuid
 import re
 import json
 import sys
 import os
-from contextlib import AsyncExitStack
-from typing import Optional
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from fastapi import params
 import httpx
@@ -16,15 +18,83 @@ from mcp.client.streamable_http import streamablehttp_client
 from collections import defaultdict
 from sse_bus import SESSIONS, sse_event, JSONRPC, publish_progress, publish_message, associate_user_session, session_for_user
 
+TOOLS_LIST_CHANGED = "notifications/tools/list_changed"
+
+
+def to_openai_tools(mcp_tools: ListToolsResult) -> List[Dict[str, Any]]:
+    """MCP tool list → Chat Completions `tools` parameter."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": t.name,
+                "description": t.description,
+                "parameters": t.inputSchema,
+            },
+        }
+        for t in mcp_tools.tools
+    ]
+
+
+class ToolCatalog:
+    """
+    Versioned cache of the MCP server's tool list, shared by all sessions.
+    Holds the OpenAI-format tool list built once per version; refreshed after
+    `ttl` seconds or when the server sends notifications/tools/list_changed.
+    """
+    def __init__(self, ttl: float = float(os.getenv("TOOL_CATALOG_TTL_SECONDS", "600"))) -> None:
+        self.ttl = ttl
+        self.version = 0
+        self.mcp_tools: Optional[ListToolsResult] = None
+        self.openai_tools: List[Dict[str, Any]] = []
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def fresh(self) -> bool:
+        return self.mcp_tools is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    def invalidate(self) -> None:
+        self.stats["invalidations"] += 1
+        self._fetched_at = 0.0
+
+    async def get(self, session: ClientSession) -> List[Dict[str, Any]]:
+        if self.fresh():
+            self.stats["hits"] += 1
+            return self.openai_tools
+        async with self._lock:
+            # another turn may have refreshed while we waited
+            if self.fresh():
+                self.stats["hits"] += 1
+                return self.openai_tools
+            self.stats["misses"] += 1
+            self.mcp_tools = await session.list_tools()
+            self.openai_tools = to_openai_tools(self.mcp_tools)
+            self.version += 1
+            self._fetched_at = time.monotonic()
+            print(f"[tool-catalog] v{self.version}: {[t['function']['name'] for t in self.openai_tools]}",
+                  file=sys.stderr, flush=True)
+            return self.openai_tools
+
+
 class MCPClient:
-    def __init__(self, mcp_endpoint: str):
+    def __init__(self, mcp_endpoint: str, catalog: Optional[ToolCatalog] = None):
         self.mcp_endpoint = mcp_endpoint
+        self.catalog = catalog
         self.exit_stack: Optional[AsyncExitStack] = None
         self.session: Optional[ClientSession] = None
         self.session_id: Optional[str] = None
         self.mcp_tools: Optional[ListToolsResult] = None
         self._sse_task: Optional[asyncio.Task] = None
         self._broadcast_session_id: str | None = None
+        # owner task: opens and closes the transport from one task (anyio requirement)
+        self._owner_task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._connect_error: Optional[BaseException] = None
+        self.last_used = time.monotonic()
+        self.last_ping = 0.0
+        self.lock = asyncio.Lock()
 
 
     async def _broadcast_progress(self, progress: float, target: Optional[str] = None, token: Optional[str] = None) -> None:
@@ -41,6 +111,20 @@ class MCPClient:
 
     def set_broadcast_session(self, session_id: str) -> None:
         self._broadcast_session_id = session_id
+
+    async def _on_server_message(self, message) -> None:
+        # ClientSession message_handler: only tool-list changes matter here
+        root = getattr(message, "root", None)
+        if getattr(root, "method", None) == TOOLS_LIST_CHANGED and self.catalog is not None:
+            self.catalog.invalidate()
+
+    async def list_openai_tools(self) -> List[Dict[str, Any]]:
+        """Tool list in OpenAI function format, served from the shared catalog when set."""
+        if self.catalog is not None:
+            return await self.catalog.get(self.session)
+        if self.mcp_tools is None:
+            self.mcp_tools = await self.session.list_tools()
+        return to_openai_tools(self.mcp_tools)
     
     
     async def progress_listener(self) -> None:
@@ -86,6 +170,12 @@ class MCPClient:
                                     method = root.get("method")
                                     params = root.get("params") or {}
 
+                                    if method == TOOLS_LIST_CHANGED:
+                                        if self.catalog is not None:
+                                            self.catalog.invalidate()
+                                        frame = reset_frame()
+                                        continue
+
                                     # PROGRESS
                                     if method == "notifications/progress" or (
                                         "progress" in root and "progressToken" in root
@@ -94,14 +184,14 @@ class MCPClient:
                                     ):
                                         pct = (params.get("progress") if params else root.get("progress"))
                                         token = (params.get("progressToken") if params else root.get("progressToken"))
-                                        target = session_for_user(root.get("user_id")) or self._broadcast_session_id
+                                        target = await session_for_user(root.get("user_id")) or self._broadcast_session_id
                                         if isinstance(pct, (int, float)) and target:
                                             print(f"session {self.session_id} << progress {pct:.0%}", file=sys.stderr, flush=True)
                                             await self._broadcast_progress(float(pct), target, token)
 
                                     # MESSAGE
                                     elif method == "notifications/message" and "params" in root:
-                                        target = session_for_user(root.get("user_id")) or self._broadcast_session_id
+                                        target = await session_for_user(root.get("user_id")) or self._broadcast_session_id
                                         data = params.get("data", [])
                                         texts = [d.get("text") for d in data if isinstance(d, dict) and d.get("type") == "text"]
                                         text = " ".join([t for t in texts if t]) or "(message)"
@@ -149,14 +239,17 @@ class MCPClient:
         read, write, _ = await self.exit_stack.enter_async_context(streamable_http_client)
 
         # Create the JSON-RPC session on the same exit stack
-        self.session = await self.exit_stack.enter_async_context(ClientSession(read, write))
+        self.session = await self.exit_stack.enter_async_context(
+            ClientSession(read, write, message_handler=self._on_server_message)
+        )
         await self.session.initialize()
         await self.session.send_ping()
 
         #self._sse_task = asyncio.create_task(self.progress_listener())
 
-        # Discover tools
-        self.mcp_tools = await self.session.list_tools()
+        # Discover tools (pooled clients read them lazily from the shared ToolCatalog)
+        if self.catalog is None:
+            self.mcp_tools = await self.session.list_tools()
 
     async def aclose(self) -> None:
         """
@@ -178,7 +271,180 @@ class MCPClient:
             await self.exit_stack.aclose()
             self.exit_stack = None
 
+    # ─── long-lived connection (used by MCPClientPool) ───
+    async def start(self, session_id: str) -> None:
+        """
+        Connect in a dedicated owner task so the connection can outlive the
+        request that opened it and still be closed from the task that entered it.
+        """
+        self.set_broadcast_session(session_id)
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._connect_error = None
+        self._owner_task = asyncio.create_task(self._own_connection(session_id))
+        await self._ready.wait()
+        if self._connect_error is not None:
+            raise self._connect_error
+        self.last_ping = time.monotonic()
+
+    async def _own_connection(self, session_id: str) -> None:
+        try:
+            await self.connect(session_id=session_id)
+        except BaseException as exc:
+            self._connect_error = exc
+            self._ready.set()
+            with contextlib.suppress(Exception):
+                await self.aclose()
+            return
+        self._ready.set()
+        try:
+            await self._stop.wait()
+        finally:
+            with contextlib.suppress(Exception):
+                await self.aclose()
+
+    @property
+    def alive(self) -> bool:
+        return self._owner_task is not None and not self._owner_task.done() and self.session is not None
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+        except Exception as exc:
+            print(f"[mcp-pool] ping failed for session {self.session_id}: {exc}", file=sys.stderr, flush=True)
+            return False
+        self.last_ping = time.monotonic()
+        return True
+
+    async def stop(self) -> None:
+        if self._stop is not None:
+            self._stop.set()
+        if self._owner_task is not None:
+            with contextlib.suppress(Exception, asyncio.CancelledError):
+                await self._owner_task
+            self._owner_task = None
+
+
+class MCPClientPool:
+    """
+    Live MCP ClientSessions keyed by UI session id.
+    - one MCPClient per session, so sessions never share `session` or broadcast target
+    - a per-session lock serializes turns of the same session
+    - idle connections are evicted after `idle_ttl`; LRU idle ones make room at `max_connections`
+    - connections idle for more than `ping_interval` are pinged before reuse
+    """
+    def __init__(self, mcp_endpoint: str,
+                 max_connections: int = int(os.getenv("MCP_POOL_MAX_CONNECTIONS", "100")),
+                 idle_ttl: float = float(os.getenv("MCP_POOL_IDLE_SECONDS", "300")),
+                 ping_interval: float = float(os.getenv("MCP_POOL_PING_SECONDS", "30"))) -> None:
+        self.mcp_endpoint = mcp_endpoint
+        self.max_connections = max_connections
+        self.idle_ttl = idle_ttl
+        self.ping_interval = ping_interval
+        self.catalog = ToolCatalog()
+        self._clients: Dict[str, MCPClient] = {}
+        self._cond = asyncio.Condition()
+        self._reaper: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"connects": 0, "reuses": 0, "evictions": 0, "reconnects": 0}
+
+    def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    @asynccontextmanager
+    async def lease(self, session_id: str) -> AsyncIterator[MCPClient]:
+        """Borrow the live client for `session_id`, connecting on first use."""
+        while True:
+            cli = await self._get_or_create(session_id)
+            await cli.lock.acquire()
+            if self._clients.get(session_id) is cli:
+                break
+            # evicted or failed to connect while we waited for the lock
+            cli.lock.release()
+        try:
+            if not cli.alive or (time.monotonic() - cli.last_ping > self.ping_interval and not await cli.ping()):
+                self.stats["reconnects"] += 1
+                await cli.stop()
+                await cli.start(session_id)
+            yield cli
+        finally:
+            cli.last_used = time.monotonic()
+            cli.lock.release()
+            async with self._cond:
+                self._cond.notify_all()
 
+    async def _get_or_create(self, session_id: str) -> MCPClient:
+        evicted = None
+        async with self._cond:
+            while True:
+                cli = self._clients.get(session_id)
+                if cli is not None:
+                    self.stats["reuses"] += 1
+                    return cli
+                if len(self._clients) < self.max_connections:
+                    break
+                victim = self._lru_idle()
+                if victim is not None:
+                    evicted = self._evict(victim)
+                    break
+                # every connection is mid-turn; wait for one to be released
+                await self._cond.wait()
+            cli = MCPClient(mcp_endpoint=self.mcp_endpoint, catalog=self.catalog)
+            # reserve the slot before connecting so concurrent turns share it; its lock is
+            # held until connected so _lru_idle and the reaper can't pick it meanwhile
+            await cli.lock.acquire()
+            self._clients[session_id] = cli
+        try:
+            if evicted is not None:
+                await self._stop([evicted])
+            await cli.start(session_id)
+        except BaseException:
+            async with self._cond:
+                if self._clients.get(session_id) is cli:
+                    del self._clients[session_id]
+                self._cond.notify_all()
+            raise
+        finally:
+            cli.lock.release()
+        self.stats["connects"] += 1
+        return cli
 
+    def _lru_idle(self) -> Optional[str]:
+        idle = [(c.last_used, sid) for sid, c in self._clients.items() if not c.lock.locked()]
+        return min(idle)[1] if idle else None
 
+    def _evict(self, session_id: str) -> Optional[MCPClient]:
+        """Drop `session_id` from the pool (caller holds `_cond`); stop the returned client after releasing it."""
+        cli = self._clients.pop(session_id, None)
+        if cli is not None:
+            self.stats["evictions"] += 1
+        return cli
 
+    @staticmethod
+    async def _stop(clients: List[MCPClient]) -> None:
+        for cli in clients:
+            await cli.stop()
+
+    async def _reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, min(self.idle_ttl, 60.0)))
+            now = time.monotonic()
+            async with self._cond:
+                expired = [sid for sid, c in self._clients.items()
+                           if not c.lock.locked() and now - c.last_used > self.idle_ttl]
+                evicted = [self._evict(sid) for sid in expired]
+                if expired:
+                    print(f"[mcp-pool] evicted {len(expired)} idle connection(s)", file=sys.stderr, flush=True)
+                    self._cond.notify_all()
+            # shut down outside the lock so leases don't wait on a slow close
+            await self._stop(evicted)
+
+    async def aclose(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+        async with self._cond:
+            evicted = [self._evict(sid) for sid in list(self._clients)]
+        await self._stop(evicted)
@@ -13,16 +13,22 @@ from pydantic import BaseModel
 import json
 import asyncio
 import os
+import time
 from dotenv import load_dotenv
 from azure.identity.aio import (AzureDeveloperCliCredential,
                                 DefaultAzureCredential,
                                 AzureCliCredential,
                                 get_bearer_token_provider)
 from openai import AzureOpenAI, AsyncAzureOpenAI   
-from mcp_client import MCPClient
+from mcp_client import MCPClientPool
+from history_store import HistoryStore
+from state_store import STATE, STATE_STORE
+from answer_cache import AnswerCache
+from plan_templates import PlanTemplates
 from sse_bus import SESSIONS, sse_event, JSONRPC, publish_progress, publish_message, associate_user_session
 from typing import Any, Dict, List
 import sys
+from types import SimpleNamespace
 from sse_starlette.sse import EventSourceResponse
 
 
@@ -36,6 +42,8 @@ if not aoai_deployment:
     sys.exit("Please set AZURE_OPENAI_DEPLOYMENT_NAME in .env. Supported model version is gpt-4o")
 
 aoai_api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+# optional: enables the semantic answer cache (e.g. text-embedding-3-small)
+aoai_embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT")
 
 mcp_endpoint = os.getenv("MCP_SERVER_ENDPOINT")
 if not mcp_endpoint:
@@ -47,8 +55,11 @@ aoai_client = AsyncAzureOpenAI(azure_endpoint=aoai_endpoint, azure_ad_token_prov
                                api_version=aoai_api_version)
 POD = socket.gethostname()
 REV = os.getenv("CONTAINER_APP_REVISION", "v0.1")
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "25"))
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+TOOL_CALL_TIMEOUT_SECONDS = float(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "60"))
  # Dapr endpoint
-mcp_cli = MCPClient(mcp_endpoint=mcp_endpoint)
+mcp_pool = MCPClientPool(mcp_endpoint=mcp_endpoint)
 
 print(f"Starting FastAPI server on {POD} with revision {REV}")
 print(f"Azure OpenAI Endpoint: {aoai_endpoint}")
@@ -56,15 +67,12 @@ print(f"Azure OpenAI Endpoint: {aoai_endpoint}")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Do any initialization tasks here
+    mcp_pool.start()
     try:
-        #mcp_cli.set_broadcast_session(session_id)
-        #await mcp_cli.connect(session_id=session_id)
-        pass
-    except Exception as e:
-        print(f"Error connecting to MCP: {e}")
-        raise e
-    finally:
         yield
+    finally:
+        await mcp_pool.aclose()
+        await STATE.aclose()
     
 app = FastAPI(lifespan=lifespan)
 
@@ -89,6 +97,10 @@ app.add_middleware(
 async def status(request: Request):
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    return {"mcp_pool": mcp_pool.stats, "history": session_manager.stats(), "state": STATE.stats, "answer_cache": answer_cache.stats(), "plan_templates": plan_templates.stats(), "tool_catalog": {**mcp_pool.catalog.stats, "version": mcp_pool.catalog.version}}
+
 def _normalize_session_id(raw: str | None, default: str = "default") -> str:
     if not raw:
         return default
@@ -105,28 +117,17 @@ async def sse_events(request: Request):
         # flush headers immediately (APIM/ACA friendly)
         yield "event: open\ndata: {}\n\n"
 
-        heartbeat_every = 1.0  # seconds
         while True:
             if await request.is_disconnected():
                 break
-            try:
-                # wait up to heartbeat interval for next message
-                #msg = await asyncio.wait_for(session.q.get(), timeout=heartbeat_every)
-                try:
-                    msg = session.q.get_nowait()
-                    print(f"[MCP CLIENT SSE YIELD] session={session_id} msg={msg}...", flush=True)
-                except asyncio.QueueEmpty:
-                    yield "event: noevent\ndata: {}\n\n"
-                    await asyncio.sleep(heartbeat_every)
-                    continue
-                #msg = sse_event(payload, event="assistant")
-                print(f"[SSE YIELD] {msg}")
-                yield msg
-                #await asyncio.sleep(5)
-                #session.q.task_done()
-            except asyncio.TimeoutError:
+            # block until a message is published or the heartbeat interval elapses
+            msg = await session.next_message(timeout=SSE_HEARTBEAT_SECONDS)
+            if msg is None:
                 # heartbeat (SSE comment doesn't disturb clients)
                 yield ": ping\n\n"
+                continue
+            print(f"[SSE YIELD] {msg}")
+            yield msg
 
     return StreamingResponse(
         event_stream(),
@@ -150,161 +151,334 @@ class ConversationIn(BaseModel):
     #client_id: str
 
 
-async def call_mcp_tool(mcp_client, message):
-    if getattr(message, "tool_calls", None):
-        for tc in message.tool_calls:
-            tool_name = tc.function.name
-            tool_args = json.loads(tc.function.arguments)
-            
-            print(f"Calling tool: {tool_name} with args: {tool_args}")
+def _result_failed(result) -> bool:
+    """
+    Whether an MCP CallToolResult is a failure: flagged `isError`, or a tool-level
+    error reply (our server's "Error: …" strings and {"error": …} dicts) as its text.
+    """
+    if getattr(result, "isError", False):
+        return True
+    parts = getattr(result, "content", None) or []
+    text = (getattr(parts[0], "text", "") or "").lstrip() if len(parts) == 1 else ""
+    return text.startswith(("Error:", "{'error':", '{"error":'))
 
-            result = await mcp_client.session.call_tool(tool_name, tool_args)
-            return result, tool_name, tool_args, tc.id
-    return None, None, None, None
+
+async def _call_one_tool(mcp_client, tc, limiter: asyncio.Semaphore) -> Dict[str, Any]:
+    tool_name = tc.function.name
+    # `failed` is what the loop, the answer cache and plan templates go by
+    call = {"id": tc.id, "name": tool_name, "arguments": tc.function.arguments, "failed": True}
+    try:
+        tool_args = json.loads(tc.function.arguments or "{}")
+    except json.JSONDecodeError as e:
+        call["content"] = f"Error: invalid JSON arguments for {tool_name}: {e}"
+        return call
+
+    async with limiter:
+        print(f"Calling tool: {tool_name} with args: {tool_args}")
+        try:
+            result = await asyncio.wait_for(
+                mcp_client.session.call_tool(tool_name, tool_args), timeout=TOOL_CALL_TIMEOUT_SECONDS
+            )
+            call["content"] = getattr(result, "content", str(result))
+            call["failed"] = _result_failed(result)
+        except asyncio.TimeoutError:
+            call["content"] = f"Error: {tool_name} timed out after {TOOL_CALL_TIMEOUT_SECONDS:.0f}s"
+        except Exception as e:
+            call["content"] = f"Error: {tool_name} failed: {e}"
+    return call
+
+
+async def call_mcp_tool(mcp_client, message) -> List[Dict[str, Any]]:
+    """Run every tool call of an assistant message concurrently; results keep the model's order."""
+    tool_calls = getattr(message, "tool_calls", None) or []
+    limiter = asyncio.Semaphore(TOOL_CALL_CONCURRENCY)
+    return list(await asyncio.gather(*(_call_one_tool(mcp_client, tc, limiter) for tc in tool_calls)))
+
+
+
+
+def _tool_round_messages(calls: List[Dict[str, Any]], content: str | None = None) -> List[Dict[str, Any]]:
+    """Assistant tool_calls message followed by one tool message per result."""
+    assistant = {
+        "role": "assistant",
+        "tool_calls": [
+            {
+                "id": c["id"],
+                "type": "function",
+                "function": {
+                    "name": c["name"],
+                    "arguments": c["arguments"],
+                },
+            }
+            for c in calls
+        ],
+    }
+    if content:
+        assistant["content"] = content
+    return [assistant, *({"role": "tool", "tool_call_id": c["id"], "content": c["content"]} for c in calls)]
+
+
+async def summarize_history(messages: List[Dict[str, Any]]) -> str:
+    """Rolling summary of older turns, used by the history store to stay under its token budget."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    response = await aoai_client.chat.completions.create(
+        model=aoai_deployment,
+        messages=[
+            {"role": "system", "content": "Summarize this sales-assistant conversation in a few sentences. "
+                                          "Keep account, contact and opportunity names, ids, amounts, dates "
+                                          "and any filters the user asked for."},
+            {"role": "user", "content": transcript},
+        ],
+        max_tokens=300,
+    )
+    return response.choices[0].message.content or ""
 
 
+# single, long-lived store you reuse (e.g., module-level or injected)
+session_manager = HistoryStore(
+    summarizer=summarize_history if os.getenv("HISTORY_SUMMARIZE", "true").lower() == "true" else None,
+    # a process-local STATE would only duplicate what HistoryStore already holds
+    store=STATE if STATE_STORE != "memory" else None,
+)
 
+async def embed_question(text: str) -> List[float]:
+    response = await aoai_client.embeddings.create(model=aoai_embedding_deployment, input=text)
+    return response.data[0].embedding
 
-class SessionManager:
-    """Keeps per-session, per-user chat histories."""
-    def __init__(self) -> None:
-        # sessions[session_id][user_id] -> list of messages (dicts or strings)
-        self.sessions: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
 
-    def get_history(self, session_id: str, user_id: str) -> List[Dict[str, Any]]:
-        return self.sessions.setdefault(session_id, {}).setdefault(user_id, [])
+# repeat questions per user: fresh answers come back as-is, older ones replay their tool calls
+answer_cache = AnswerCache(embed=embed_question if aoai_embedding_deployment else None)
+# question templates → SOQL: a trusted match skips the planning call, leaving only the summary
+plan_templates = PlanTemplates()
 
-    def append(self, session_id: str, user_id: str, role: str, content: str) -> None:
-        self.get_history(session_id, user_id).append({"role": role, "content": content})
 
+def _replayed_tool_calls(calls: List[Dict[str, Any]]) -> SimpleNamespace:
+    """Assistant message that issues a cached plan's tool calls, as if the model had planned them."""
+    return SimpleNamespace(content=None, tool_calls=[
+        SimpleNamespace(id=f"call_cached_{i}", function=SimpleNamespace(name=c["name"], arguments=c["arguments"]))
+        for i, c in enumerate(calls)
+    ])
 
-# single, long-lived manager you reuse (e.g., module-level or injected)
-session_manager = SessionManager()
 
 async def handle_user_query(user_id: str, user_query: str, session_id: str) -> Dict[str, Any]:
-    # Connect MCP
-    #mcp_cli = MCPClient(mcp_endpoint=mcp_endpoint)
-    mcp_cli.set_broadcast_session(session_id)
-    await mcp_cli.connect(session_id=session_id)
-    #with contextlib.suppress(Exception):
-    #    await mcp_cli.connect(session_id=session_id)
-
-    #try:
-    # Build available tool schema for the model
-    available_tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": t.name,
-                "description": t.description,
-                "parameters": t.inputSchema,
-            },
-        }
-        for t in mcp_cli.mcp_tools.tools
-    ]
-    print("Available tools:", available_tools)
+    # Borrow this session's live MCP connection (handshake only on the first turn)
+    async with mcp_pool.lease(session_id) as mcp_cli:
+        turn_started = time.perf_counter()
+        # Tool schema for the model, cached across turns and sessions
+        available_tools = await mcp_cli.list_openai_tools()
+        print(f"[turn] tool catalog v{mcp_pool.catalog.version} ready in "
+              f"{(time.perf_counter() - turn_started) * 1000:.1f} ms", flush=True)
+
+        # a follow-up ("show their contacts") means something different in every conversation:
+        # only opening questions are looked up in, or stored to, the answer cache
+        history = await session_manager.get_history(session_id, user_id)
+        question_vec = await answer_cache.vector(user_query) if answer_cache.enabled and not history else None
+        cached = answer_cache.lookup(user_id, question_vec) if question_vec is not None else None
+        if cached and cached["kind"] == "answer":
+            await session_manager.append(session_id, user_id, "user", user_query)
+            for content in cached["entry"]["answer"]:
+                await session_manager.append(session_id, user_id, "assistant", content)
+            await session_manager.compact(session_id, user_id)
+            print(f"[turn] session={session_id} answered from cache (similarity {cached['score']:.3f}) in "
+                  f"{(time.perf_counter() - turn_started) * 1000:.1f} ms", flush=True)
+            return {"llm_response": cached["entry"]["answer"]}
+
+        # Build message list from stored history + current user input
+        system_msg = {"role": "system", "content": system_message.format(user_id=user_id)}
+        msgs: List[Dict[str, Any]] = [system_msg, *history, {"role": "user", "content": user_query}]
+
+        template = plan_templates.match(user_query) if not cached else None
+        if cached:
+            # a similar question was answered before: re-run its queries, skip the planning call
+            message = _replayed_tool_calls(cached["entry"]["calls"])
+        elif template:
+            # the question fits a learned template: run its SOQL with this question's literals
+            message = _replayed_tool_calls([template[1]])
+        else:
+            # First LLM call
+            planning_started = time.perf_counter()
+            response = await aoai_client.chat.completions.create(
+                model=aoai_deployment,
+                messages=msgs,
+                tools=available_tools,
+                # Azure OpenAI Chat Completions uses `max_tokens`
+                max_tokens=4000,
+            )
+            plan_templates.observe_planning((time.perf_counter() - planning_started) * 1000)
+
+            choice = response.choices[0]
+            message = choice.message
+
+        # Persist the user message once
+        await session_manager.append(session_id, user_id, "user", user_query)
+
+        # Collect assistant text outputs (across potential tool call turns)
+        final_text: List[str] = []
+        # first tool round of this turn: the plan the answer cache replays
+        plan_calls: List[Dict[str, Any]] | None = None
+        tool_rounds = 0
+
+        # Safety: cap iterative tool-call loop
+        for _ in range(16):
+            # If no tool calls, this is a final assistant message; store and break
+            tool_calls = getattr(message, "tool_calls", None)
+            if not tool_calls:
+                # message may be a dict or an SDK object; normalize
+                content = (
+                    message.get("content")
+                    if isinstance(message, dict)
+                    else getattr(message, "content", None)
+                )
+                if content:
+                    final_text.append(content)
+                    await session_manager.append(session_id, user_id, "assistant", content)
+                break
 
-    # Build message list from stored history + current user input
-    history = session_manager.get_history(session_id, user_id)
-    system_msg = {"role": "system", "content": system_message.format(user_id=user_id)}
-    msgs: List[Dict[str, Any]] = [system_msg, *history, {"role": "user", "content": user_query}]
+            # Otherwise, execute all tool calls of this message concurrently
+            calls = await call_mcp_tool(mcp_cli, message)
+            if not calls:
+                # Model asked for a tool but we couldn’t execute; surface what we have and stop
+                content = (
+                    message.get("content")
+                    if isinstance(message, dict)
+                    else getattr(message, "content", None)
+                )
+                if content:
+                    final_text.append(content)
+                    await session_manager.append(session_id, user_id, "assistant", content)
+                break
 
-    # First LLM call
-    response = await aoai_client.chat.completions.create(
+            if plan_calls is None:
+                plan_calls = calls
+                if template and any(c["failed"] for c in calls):
+                    # the model sees the error and replans; don't offer this template again
+                    plan_templates.reject(template[0])
+            tool_rounds += 1
+
+            # Feed all tool results back in a single follow-up
+            # Ensure we keep using the same `msgs` list (not an undefined `messages`)
+            msgs.extend(_tool_round_messages(calls))
+
+            follow_up = await aoai_client.chat.completions.create(
+                model=aoai_deployment,
+                messages=msgs,
+                tools=available_tools,
+                max_tokens=4000,
+            )
+            follow_up_choice = follow_up.choices[0]
+            message = follow_up_choice.message
+
+        if question_vec is not None and plan_calls:
+            answer_cache.store(user_id, question_vec, user_query, plan_calls, final_text)
+        if plan_calls and final_text and tool_rounds == 1 and not cached and not template:
+            # question → one SOQL call → answer: the shape a template can replay
+            plan_templates.record(user_query, plan_calls, context_free=not history)
+        await session_manager.compact(session_id, user_id)
+        print(final_text)
+        print(f"[turn] session={session_id} completed in {(time.perf_counter() - turn_started) * 1000:.1f} ms", flush=True)
+        return {"llm_response": final_text}
+
+
+
+async def _stream_chat(msgs: List[Dict[str, Any]], tools: List[Dict[str, Any]], out: Dict[str, Any]):
+    """
+    Streamed chat completion: yields content deltas as they arrive and fills
+    `out` with the assembled `content` and `tool_calls` once the stream ends.
+    """
+    stream = await aoai_client.chat.completions.create(
         model=aoai_deployment,
         messages=msgs,
-        tools=available_tools,
-        # Azure OpenAI Chat Completions uses `max_tokens`
+        tools=tools,
         max_tokens=4000,
+        stream=True,
     )
+    content: List[str] = []
+    calls: Dict[int, Dict[str, str]] = {}
+    async for chunk in stream:
+        # Azure sends a leading chunk with content-filter results and no choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            yield delta.content
+        # tool calls arrive as fragments keyed by index
+        for tc in delta.tool_calls or []:
+            slot = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+            if tc.id:
+                slot["id"] = tc.id
+            if tc.function and tc.function.name:
+                slot["name"] += tc.function.name
+            if tc.function and tc.function.arguments:
+                slot["arguments"] += tc.function.arguments
+    out["content"] = "".join(content)
+    out["tool_calls"] = [
+        SimpleNamespace(id=c["id"], function=SimpleNamespace(name=c["name"], arguments=c["arguments"]))
+        for _, c in sorted(calls.items())
+    ]
 
-    choice = response.choices[0]
-    message = choice.message
-
-    # Persist the user message once
-    session_manager.append(session_id, user_id, "user", user_query)
-
-    # Collect assistant text outputs (across potential tool call turns)
-    final_text: List[str] = []
-
-    # Safety: cap iterative tool-call loop
-    for _ in range(16):
-        # If no tool calls, this is a final assistant message; store and break
-        tool_calls = getattr(message, "tool_calls", None)
-        if not tool_calls:
-            # message may be a dict or an SDK object; normalize
-            content = (
-                message.get("content")
-                if isinstance(message, dict)
-                else getattr(message, "content", None)
-            )
-            if content:
-                final_text.append(content)
-                session_manager.append(session_id, user_id, "assistant", content)
-            break
-
-        # Otherwise, execute the tool(s) one-by-one (or your call_mcp_tool batches them)
-        result, tool_name, tool_args, tc_id = await call_mcp_tool(mcp_cli, message)
-        if result is None:
-            # Model asked for a tool but we couldn’t execute; surface what we have and stop
-            content = (
-                message.get("content")
-                if isinstance(message, dict)
-                else getattr(message, "content", None)
-            )
-            if content:
-                final_text.append(content)
-                session_manager.append(session_id, user_id, "assistant", content)
-            break
-
-        # Feed the tool result back
-        # Ensure we keep using the same `msgs` list (not an undefined `messages`)
-        msgs.extend(
-            [
-                {
-                    "role": "assistant",
-                    "tool_calls": [
-                        {
-                            "id": tc_id,
-                            "type": "function",
-                            "function": {
-                                "name": tool_name,
-                                "arguments": json.dumps(tool_args),
-                            },
-                        }
-                    ],
-                },
-                {
-                    "role": "tool",
-                    "tool_call_id": tc_id,
-                    "content": getattr(result, "content", str(result)),
-                },
-            ]
-        )
-
-        follow_up = await aoai_client.chat.completions.create(
-            model=aoai_deployment,
-            messages=msgs,
-            tools=available_tools,
-            max_tokens=4000,
-        )
-        follow_up_choice = follow_up.choices[0]
-        message = follow_up_choice.message
 
-    print(final_text)
-    return {"llm_response": final_text}
+async def stream_user_query(user_id: str, user_query: str, session_id: str):
+    """
+    Streaming variant of handle_user_query: forwards text deltas as SSE `message`
+    frames, `tool` frames around each tool round, then a final `done` frame.
+    """
+    try:
+        async with mcp_pool.lease(session_id) as mcp_cli:
+            turn_started = time.perf_counter()
+            first_token_at = None
+            available_tools = await mcp_cli.list_openai_tools()
+
+            history = await session_manager.get_history(session_id, user_id)
+            system_msg = {"role": "system", "content": system_message.format(user_id=user_id)}
+            msgs: List[Dict[str, Any]] = [system_msg, *history, {"role": "user", "content": user_query}]
+            await session_manager.append(session_id, user_id, "user", user_query)
+
+            # Safety: cap iterative tool-call loop
+            for _ in range(16):
+                out: Dict[str, Any] = {}
+                async for text in _stream_chat(msgs, available_tools, out):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    yield sse_event({"text": text})
+
+                if not out["tool_calls"]:
+                    if out["content"]:
+                        await session_manager.append(session_id, user_id, "assistant", out["content"])
+                    break
+
+                for tc in out["tool_calls"]:
+                    yield sse_event({"id": tc.id, "name": tc.function.name, "status": "started"}, event="tool")
+                calls = await call_mcp_tool(mcp_cli, SimpleNamespace(tool_calls=out["tool_calls"]))
+                for c in calls:
+                    yield sse_event({"id": c["id"], "name": c["name"], "status": "failed" if c["failed"] else "completed"}, event="tool")
+                msgs.extend(_tool_round_messages(calls, out["content"]))
+
+            await session_manager.compact(session_id, user_id)
+            ttft = (first_token_at - turn_started) * 1000 if first_token_at else float("nan")
+            print(f"[turn] session={session_id} streamed: first token {ttft:.1f} ms, "
+                  f"total {(time.perf_counter() - turn_started) * 1000:.1f} ms", flush=True)
+            yield sse_event({}, event="done")
+    except Exception as e:
+        # Single terminal error
+        yield sse_event({"error": str(e)}, event="error")
 
-    #finally:
-        # Optional: close MCP connection if your client needs explicit cleanup
-        #with contextlib.suppress(Exception):
-        #    await mcp_cli.close()
-    
 
 @app.post("/conversation/{user_id}")
 async def start_conversation(user_id: str, convo: ConversationIn,  request: Request):
     sid = request.query_params.get("sid")  
     ui_session = _normalize_session_id(sid)
-    associate_user_session(user_id, ui_session)
+    await associate_user_session(user_id, ui_session)
+    # opt-in token streaming: POST /conversation/{user_id}?stream=true
+    if request.query_params.get("stream", "").lower() in ("1", "true", "yes"):
+        return StreamingResponse(
+            stream_user_query(user_id, convo.user_query, ui_session),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Content-Type-Options": "nosniff",
+            },
+        )
     result = await handle_user_query(user_id, convo.user_query, ui_session)
     return result
    
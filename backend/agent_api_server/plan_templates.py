@@ -0,0 +1,195 @@
+import json, os, re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+PLAN_TEMPLATES_ENABLED = os.getenv("PLAN_TEMPLATES_ENABLED", "true").lower() == "true"
+PLAN_TEMPLATE_MIN_SEEN = int(os.getenv("PLAN_TEMPLATE_MIN_SEEN", "2"))     # same mapping observed before it's trusted
+PLAN_TEMPLATE_MAX = int(os.getenv("PLAN_TEMPLATE_MAX", "500"))             # LRU cap on templates held
+PLAN_TEMPLATE_MIN_FIXED = int(os.getenv("PLAN_TEMPLATE_MIN_FIXED", "3"))   # literal words a template must keep
+# tools whose single `soql` argument is the whole plan
+PLAN_TEMPLATE_TOOLS = {t.strip() for t in os.getenv(
+    "PLAN_TEMPLATE_TOOLS", "query_salesforce,query_local_mirror").split(",") if t.strip()}
+
+_SOQL_LITERAL_RE = re.compile(r"""
+    '(?P<str>(?:[^'\\]|\\.)*)'
+  | (?<![\w.:-])(?P<date>\d{4}-\d{2}-\d{2}(?:T[\d:.]+(?:Z|[+-]\d{2}:?\d{2}))?)(?![\w:-])
+  | (?<![\w.-])(?P<num>-?\d+(?:\.\d+)?)(?![\w.:-])           # also the n of LAST_N_DAYS:n
+""", re.VERBOSE)
+# a string slot is a run of capitalized words (a name) or, between quotes in the question, the
+# quoted text; anything looser lets a slot swallow the rest of a different question
+_NAME = r"[A-Z0-9][\w&.'-]*(?: [A-Z0-9&][\w&.'-]*)*"
+_NAME_RE = re.compile(_NAME)
+_SLOT_PATTERNS = {"str": rf"((?-i:{_NAME}))", "quoted": r"""([^'"]+)""",
+                  "date": r"(\d{4}-\d{2}-\d{2}(?:T[\d:.]+(?:Z|[+-]\d{2}:?\d{2}))?)",
+                  "num": r"(-?\d+(?:\.\d+)?)"}
+_QUOTES = "'\""
+_SLOT_RE = re.compile(r"\{(\d+)\}")
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.split()).rstrip("?.! ")
+
+
+def _escape_soql(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
+def extract_template(question: str, soql: str) -> Optional[Tuple[str, str, List[str], int]]:
+    """
+    (question template, SOQL template, slot kinds, fixed literal count) with every SOQL
+    literal that also appears in the question replaced by a numbered slot; literals the
+    question doesn't mention stay fixed. None when nothing generalizes, the template
+    would be too loose, or a string value is neither quoted nor a capitalized name.
+    """
+    text = normalize_question(question)
+    if "{" in text or "{" in soql:
+        return None
+    kinds: List[str] = []
+    soql_parts: List[str] = []
+    last, fixed = 0, 0
+    for m in _SOQL_LITERAL_RE.finditer(soql):
+        kind = m.lastgroup
+        raw = m.group(kind)
+        core = raw.strip("%") if kind == "str" else raw
+        value = core.replace("\\'", "'").replace("\\\\", "\\")
+        if not value.strip():
+            continue
+        found = re.search(rf"(?<![\w{{]){re.escape(value)}(?![\w}}])", text, re.IGNORECASE)
+        if found is None:
+            fixed += 1
+            continue
+        if kind == "str" and not _quoted(text, found.start(), found.end()) and not _NAME_RE.fullmatch(found.group()):
+            return None
+        slot = f"{{{len(kinds)}}}"
+        kinds.append(kind)
+        text = text[:found.start()] + slot + text[found.end():]
+        literal = raw.replace(core, slot, 1)
+        soql_parts.append(soql[last:m.start()] + (f"'{literal}'" if kind == "str" else literal))
+        last = m.end()
+    if not kinds:
+        return None
+    fixed_words = re.findall(r"[a-z]+", _SLOT_RE.sub(" ", text.lower()))
+    if len(fixed_words) < PLAN_TEMPLATE_MIN_FIXED:
+        return None
+    soql_parts.append(soql[last:])
+    return text.lower(), "".join(soql_parts), kinds, fixed
+
+
+def _quoted(text: str, start: int, end: int) -> bool:
+    return 0 < start and end < len(text) and text[start - 1] in _QUOTES and text[end] == text[start - 1]
+
+
+class _Template:
+    def __init__(self, key: str, tool: str, soql: str, kinds: List[str]) -> None:
+        self.tool = tool
+        self.soql = soql
+        self.kinds = kinds
+        self.seen = 1
+        pattern, last = [], 0
+        for m in _SLOT_RE.finditer(key):
+            kind = kinds[int(m.group(1))]
+            if kind == "str" and _quoted(key, m.start(), m.end()):
+                kind = "quoted"
+            pattern.append(re.escape(key[last:m.start()]) + _SLOT_PATTERNS[kind])
+            last = m.end()
+        pattern.append(re.escape(key[last:]))
+        self.regex = re.compile("".join(pattern), re.IGNORECASE)
+        # slots appear in the question in order of discovery, not numerically
+        self.order = [int(m.group(1)) for m in _SLOT_RE.finditer(key)]
+
+    def fill(self, question: str) -> Optional[str]:
+        m = self.regex.fullmatch(question)
+        if m is None:
+            return None
+        values = dict(zip(self.order, m.groups()))
+        return _SLOT_RE.sub(lambda s: _escape_soql(values[int(s.group(1))]) if self.kinds[int(s.group(1))] == "str"
+                            else values[int(s.group(1))], self.soql)
+
+
+class PlanTemplates:
+    """
+    Question-template → SOQL mappings learned from turns that ran one query and then
+    answered. A trusted match lets the agent loop run the SOQL itself and make only the
+    summarization call.
+    """
+    def __init__(self, min_seen: int = PLAN_TEMPLATE_MIN_SEEN, max_templates: int = PLAN_TEMPLATE_MAX) -> None:
+        self.min_seen = min_seen
+        self.max_templates = max_templates
+        self._templates: "OrderedDict[str, _Template]" = OrderedDict()
+        self.counters = {"lookups": 0, "hits": 0, "recorded": 0, "rejected": 0}
+        self._planning_ms = 0.0         # moving average of the planning call a hit skips
+        self._saved_ms = 0.0
+
+    def match(self, question: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        (template key, tool call) for the first trusted template matching `question`, else None.
+        The filled-in SOQL must extract back to the same template from `question`, so a slot
+        that happened to match more than the learned literal doesn't replay.
+        """
+        if not PLAN_TEMPLATES_ENABLED:
+            return None
+        self.counters["lookups"] += 1
+        text = normalize_question(question)
+        for key, tpl in reversed(self._templates.items()):
+            if tpl.seen < self.min_seen:
+                continue
+            soql = tpl.fill(text)
+            if soql is not None and (extract_template(text, soql) or (None,))[0] == key:
+                self._templates.move_to_end(key)
+                self.counters["hits"] += 1
+                self._saved_ms += self._planning_ms
+                return key, {"name": tpl.tool, "arguments": json.dumps({"soql": soql})}
+        return None
+
+    def record(self, question: str, calls: List[Dict[str, Any]], context_free: bool) -> None:
+        """
+        Learn from a turn whose only tool round was a single successful SOQL call.
+        Templates are shared by every user, so a literal the question doesn't supply
+        is only kept when the turn had no earlier conversation (`context_free`) the
+        model could have taken it from, e.g. another account name.
+        """
+        if not PLAN_TEMPLATES_ENABLED or len(calls) != 1 or calls[0]["name"] not in PLAN_TEMPLATE_TOOLS:
+            return
+        call = calls[0]
+        if call["failed"]:
+            return
+        try:
+            soql = json.loads(call["arguments"] or "{}").get("soql", "")
+        except json.JSONDecodeError:
+            return
+        extracted = extract_template(question, soql) if soql else None
+        if extracted is None:
+            return
+        key, soql_template, kinds, fixed = extracted
+        if fixed and not context_free:
+            return
+        tpl = self._templates.get(key)
+        if tpl is not None and tpl.tool == call["name"] and tpl.soql == soql_template:
+            tpl.seen += 1
+        else:
+            # first sighting, or the model planned this question differently: start over
+            self._templates[key] = _Template(key, call["name"], soql_template, kinds)
+        self._templates.move_to_end(key)
+        while len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+        self.counters["recorded"] += 1
+
+    def reject(self, key: str) -> None:
+        """The filled-in SOQL failed: forget the template so the model plans the next one."""
+        if self._templates.pop(key, None) is not None:
+            self.counters["rejected"] += 1
+
+    def observe_planning(self, ms: float) -> None:
+        self._planning_ms = ms if not self._planning_ms else 0.9 * self._planning_ms + 0.1 * ms
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["lookups"]
+        return {
+            **self.counters,
+            "enabled": PLAN_TEMPLATES_ENABLED,
+            "templates": len(self._templates),
+            "trusted": sum(1 for t in self._templates.values() if t.seen >= self.min_seen),
+            "hit_rate": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            "planning_ms_avg": round(self._planning_ms, 1),
+            "latency_saved_ms": round(self._saved_ms, 1),
+        }
@@ -1,5 +1,6 @@
 import asyncio, json
 from typing import Dict, Optional
+from state_store import STATE
 
 JSONRPC = "2.0"
 
@@ -16,6 +17,13 @@ class Session:
         if not self.closed:
             await self.q.put(msg)
 
+    async def next_message(self, timeout: float) -> Optional[str]:
+        """Wait for the next queued message; None if the stream stayed idle for `timeout`."""
+        try:
+            return await asyncio.wait_for(self.q.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
     def close(self) -> None:
         self.closed = True
 
@@ -56,15 +64,15 @@ class SessionManager:
 
 SESSIONS = SessionManager()
 
-# Optional: map user_id -> session_id for actor lookups
-_USER_SESSION: Dict[str, str] = {}
-
-def associate_user_session(user_id: str, session_id: str) -> None:
-    if user_id and session_id:
-        _USER_SESSION[user_id] = session_id
+# Optional: map user_id -> session_id for actor lookups (shared across replicas via STATE)
+async def associate_user_session(user_id: str, session_id: str) -> None:
+    if user_id and session_id and await STATE.get("user_session", user_id) != session_id:
+        STATE.set("user_session", user_id, session_id)
 
-def session_for_user(user_id: str) -> Optional[str]:
-    return _USER_SESSION.get(user_id)
+async def session_for_user(user_id: str) -> Optional[str]:
+    if not user_id:
+        return None
+    return await STATE.get("user_session", user_id)
 
 # Convenience publishers
 async def publish_progress(session_id: str, token: str, progress: float) -> None:
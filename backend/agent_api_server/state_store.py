@@ -0,0 +1,230 @@
+"""
+Shared session state for the agent API servers.
+
+Backends (STATE_STORE): memory | sqlite | file. `USE_SQLLITE=True` selects sqlite
+when STATE_STORE is unset. Point STATE_STORE_PATH at a shared volume so uvicorn
+workers and Container Apps replicas see the same threads, histories and
+user→session mappings.
+"""
+import asyncio, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+STATE_STORE = os.getenv("STATE_STORE") or ("sqlite" if os.getenv("USE_SQLLITE", "False").lower() == "true" else "memory")
+STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "./state")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "0.2"))      # write-behind delay, seconds
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", "10000"))             # read-through cache entries
+STATE_CACHE_TTL = float(os.getenv("STATE_CACHE_TTL", "2"))                 # max staleness vs. other replicas
+STATE_FLUSH_MAX_BACKOFF = float(os.getenv("STATE_FLUSH_MAX_BACKOFF", "30"))  # retry ceiling after failed flushes
+
+# (namespace, key, json value or None for delete)
+Write = Tuple[str, str, Optional[str]]
+
+
+class MemoryBackend:
+    """Process-local; the default for single-worker dev runs."""
+    def __init__(self) -> None:
+        self._data: Dict[Tuple[str, str], str] = {}
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        return self._data.get((namespace, key))
+
+    def write_many(self, writes: Iterable[Write]) -> None:
+        for ns, key, value in writes:
+            if value is None:
+                self._data.pop((ns, key), None)
+            else:
+                self._data[(ns, key)] = value
+
+
+class SqliteBackend:
+    """
+    One table keyed by (namespace, key). Rollback-journal mode, not WAL: WAL's
+    shared-memory index only works for processes on one host, and this file may
+    sit on a network share used by several replicas.
+    """
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=DELETE")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, "
+                "updated REAL NOT NULL, PRIMARY KEY (ns, k))"
+            )
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT v FROM kv WHERE ns = ? AND k = ?", (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    def write_many(self, writes: Iterable[Write]) -> None:
+        now = time.time()
+        upserts = [(ns, k, v, now) for ns, k, v in writes if v is not None]
+        deletes = [(ns, k) for ns, k, v in writes if v is None]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT INTO kv (ns, k, v, updated) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (ns, k) DO UPDATE SET v = excluded.v, updated = excluded.updated",
+                        upserts,
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM kv WHERE ns = ? AND k = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class FileBackend:
+    """One JSON file per key under <root>/<namespace>/, replaced atomically."""
+    def __init__(self, root: str) -> None:
+        self.root = root
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.root, namespace, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        try:
+            with open(self._path(namespace, key), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_many(self, writes: Iterable[Write]) -> None:
+        for ns, key, value in writes:
+            path = self._path(ns, key)
+            if value is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(value)
+            os.replace(tmp, path)
+
+
+class StateStore:
+    """
+    Read-through LRU cache and write-behind batching over a backend.
+    Writes land in the cache and a pending map immediately; a background task
+    flushes the pending map to the backend every `flush_interval` in one batch.
+    """
+    def __init__(self, backend, flush_interval: float = STATE_FLUSH_INTERVAL,
+                 cache_size: int = STATE_CACHE_SIZE, cache_ttl: float = STATE_CACHE_TTL) -> None:
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "flushes": 0, "flush_errors": 0}
+
+    def _remember(self, ck: Tuple[str, str], value: Any) -> None:
+        self._cache[ck] = (time.monotonic(), value)
+        self._cache.move_to_end(ck)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        ck = (namespace, key)
+        hit = self._cache.get(ck)
+        if hit is not None and (ck in self._pending or time.monotonic() - hit[0] < self.cache_ttl):
+            self._cache.move_to_end(ck)
+            self.stats["hits"] += 1
+            return default if hit[1] is None else hit[1]
+        self.stats["misses"] += 1
+        # sqlite / file reads block; keep them off the event loop like writes
+        raw = await asyncio.to_thread(self.backend.get, namespace, key)
+        value = json.loads(raw) if raw is not None else None
+        self._remember(ck, value)
+        return default if value is None else value
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        ck = (namespace, key)
+        self._remember(ck, value)
+        self._pending[ck] = json.dumps(value)
+        self.stats["writes"] += 1
+        self._schedule_flush()
+
+    def delete(self, namespace: str, key: str) -> None:
+        ck = (namespace, key)
+        self._remember(ck, None)
+        self._pending[ck] = None
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (scripts, import time): write through
+            self.flush_sync()
+            return
+        self._flusher = loop.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        delay = self.flush_interval
+        while True:
+            await asyncio.sleep(delay)
+            ok = await self.flush()
+            if not self._pending:
+                return
+            # writes made while the batch was in flight, or put back after a failure:
+            # set()/delete() skip scheduling while this task runs, so keep going here
+            delay = self.flush_interval if ok else min(max(delay, self.flush_interval) * 2, STATE_FLUSH_MAX_BACKOFF)
+
+    def _take_pending(self) -> list[Write]:
+        batch, self._pending = self._pending, {}
+        return [(ns, k, v) for (ns, k), v in batch.items()]
+
+    def _restore_pending(self, writes: list[Write]) -> None:
+        # newer writes made during the failed flush win
+        for ns, k, v in writes:
+            self._pending.setdefault((ns, k), v)
+
+    async def flush(self) -> bool:
+        """Write the pending batch; False (and the batch put back) when the backend failed."""
+        writes = self._take_pending()
+        if not writes:
+            return True
+        try:
+            await asyncio.to_thread(self.backend.write_many, writes)
+            self.stats["flushes"] += 1
+            return True
+        except Exception as e:
+            self.stats["flush_errors"] += 1
+            print(f"[state] flush of {len(writes)} writes failed: {e}", flush=True)
+            self._restore_pending(writes)
+            return False
+
+    def flush_sync(self) -> None:
+        writes = self._take_pending()
+        if writes:
+            self.backend.write_many(writes)
+            self.stats["flushes"] += 1
+
+    async def aclose(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+
+def _backend_from_env():
+    if STATE_STORE == "sqlite":
+        return SqliteBackend(os.path.join(STATE_STORE_PATH, "agent_state.db"))
+    if STATE_STORE == "file":
+        return FileBackend(STATE_STORE_PATH)
+    return MemoryBackend()
+
+
+STATE = StateStore(_backend_from_env())
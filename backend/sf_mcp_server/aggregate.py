@@ -0,0 +1,169 @@
+# ─── aggregate.py ──────────────────────────────────────────────────────────
+import math, os, re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+AGGREGATE_MAX_ROWS = int(os.getenv("AGGREGATE_MAX_ROWS", "50000"))    # rows scanned when aggregating locally
+AGGREGATE_MAX_GROUPS = int(os.getenv("AGGREGATE_MAX_GROUPS", "200"))  # groups returned without top_k
+
+FUNCS = ("count", "sum", "avg", "min", "max")
+_FIELD_RE = re.compile(r"^[A-Za-z_][\w]*(\.[A-Za-z_][\w]*)*$")
+_METRIC_RE = re.compile(r"^(count|sum|avg|min|max)\(\s*([A-Za-z_][\w.]*)?\s*\)$", re.IGNORECASE)
+
+# (function, field or None for count(), output column name)
+Metric = Tuple[str, Optional[str], str]
+
+
+def parse_fields(spec: str) -> List[str]:
+    fields = [f.strip() for f in spec.split(",") if f.strip()]
+    for f in fields:
+        if not _FIELD_RE.match(f):
+            raise ValueError(f"invalid field name {f!r}")
+    return fields
+
+
+def parse_metrics(spec: str) -> List[Metric]:
+    """'count(), sum(Amount), avg(Amount)' → [("count", None, "count_all"), ("sum", "Amount", "sum_Amount"), …]"""
+    metrics: List[Metric] = []
+    for item in (m.strip() for m in (spec or "count()").split(",")):
+        if not item:
+            continue
+        m = _METRIC_RE.match(item)
+        if not m:
+            raise ValueError(f"invalid metric {item!r}; use {', '.join(f + '(Field)' for f in FUNCS)} or count()")
+        func, field = m.group(1).lower(), m.group(2)
+        if field is None and func != "count":
+            raise ValueError(f"{func}() needs a field")
+        if field is not None and not _FIELD_RE.match(field):
+            raise ValueError(f"invalid field name {field!r}")
+        alias = "count_all" if field is None else f"{func}_{field.replace('.', '_')}"
+        metrics.append((func, field, alias))
+    return metrics
+
+
+def aggregate_soql(sobject: str, group_by: List[str], metrics: List[Metric], where: str = "",
+                   order_by: Optional[str] = None, top_k: int = 0) -> str:
+    """The same aggregation as one SOQL GROUP BY query (Salesforce does the work)."""
+    # bare COUNT() can't be combined with GROUP BY or other aggregates; COUNT(Id) counts the same rows
+    exprs = {alias: f"{func.upper()}({field or 'Id'})" for func, field, alias in metrics}
+    select = [*group_by, *(f"{expr} {alias}" for alias, expr in exprs.items())]
+    soql = f"SELECT {', '.join(select)} FROM {sobject}"
+    if where:
+        soql += f" WHERE {where}"
+    if group_by:
+        soql += f" GROUP BY {', '.join(group_by)}"
+    if order_by:
+        soql += f" ORDER BY {exprs[order_by]} DESC NULLS LAST"
+    if top_k:
+        soql += f" LIMIT {int(top_k)}"
+    return soql
+
+
+def source_soql(sobject: str, group_by: List[str], metrics: List[Metric], where: str = "") -> str:
+    """Plain SELECT of just the columns a local aggregation needs."""
+    fields = list(dict.fromkeys([*group_by, *(f for _, f, _ in metrics if f)])) or ["Id"]
+    soql = f"SELECT {', '.join(fields)} FROM {sobject}"
+    if where:
+        soql += f" WHERE {where}"
+    return soql
+
+
+def normalize_aggregate_rows(records: Iterable[Dict[str, Any]], group_by: List[str],
+                             metrics: List[Metric]) -> List[Dict[str, Any]]:
+    """AggregateResult rows name grouped relationship fields by their last part; restore the requested names."""
+    rows = []
+    for rec in records:
+        row = {g: rec.get(g.rsplit(".", 1)[-1]) for g in group_by}
+        row.update({alias: rec.get(alias) for _, _, alias in metrics})
+        rows.append(row)
+    return rows
+
+
+def _factorize(values: Iterable[Any], n: int) -> Tuple[np.ndarray, List[Any]]:
+    uniques: Dict[Any, int] = {}
+    codes = np.fromiter((uniques.setdefault(v, len(uniques)) for v in values), dtype=np.int64, count=n)
+    return codes, list(uniques)
+
+
+def _numeric(values: Iterable[Any], n: int) -> np.ndarray:
+    def num(v: Any) -> float:
+        if v is None or isinstance(v, bool):
+            return math.nan
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            return math.nan
+    return np.fromiter((num(v) for v in values), dtype=np.float64, count=n)
+
+
+def _py(value: float) -> Any:
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 6)
+
+
+def aggregate_columns(rows: List[Dict[str, Any]], group_by: List[str], metrics: List[Metric],
+                      order_by: Optional[str] = None, top_k: int = 0,
+                      max_groups: int = AGGREGATE_MAX_GROUPS) -> List[Dict[str, Any]]:
+    """
+    Group-by aggregation over flat rows (dotted columns for parent fields).
+    Each column becomes one NumPy array; group keys are factorized into integer
+    codes and every metric is a single bincount / ufunc.at pass.
+    """
+    n = len(rows)
+    if group_by:
+        combined = np.zeros(n, dtype=np.int64)
+        for g in group_by:
+            codes, uniques = _factorize((r.get(g) for r in rows), n)
+            combined = combined * max(len(uniques), 1) + codes
+        group_codes, group_ids = np.unique(combined, return_inverse=True)
+        group_ids = group_ids.reshape(-1)
+        # representative row per group, to read its key values back
+        first = np.full(len(group_codes), n, dtype=np.int64)
+        np.minimum.at(first, group_ids, np.arange(n))
+    else:
+        group_ids = np.zeros(n, dtype=np.int64)
+        first = np.zeros(1 if n else 0, dtype=np.int64)
+    groups = len(first) if n else (0 if group_by else 1)
+
+    columns: Dict[str, np.ndarray] = {}
+    for func, field, alias in metrics:
+        if field is None:
+            columns[alias] = np.bincount(group_ids, minlength=groups).astype(np.float64)
+            continue
+        if func == "count":
+            # like SOQL COUNT(field): non-null values of any type
+            present = np.fromiter((r.get(field) is not None for r in rows), dtype=bool, count=n)
+            columns[alias] = np.bincount(group_ids, weights=present, minlength=groups)
+            continue
+        vals = _numeric((r.get(field) for r in rows), n)
+        present = ~np.isnan(vals)
+        if func in ("sum", "avg"):
+            sums = np.bincount(group_ids, weights=np.where(present, vals, 0.0), minlength=groups)
+            counts = np.bincount(group_ids, weights=present, minlength=groups)
+            if func == "sum":
+                columns[alias] = np.where(counts > 0, sums, np.nan)
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    columns[alias] = np.where(counts > 0, sums / counts, np.nan)
+        else:
+            out = np.full(groups, np.inf if func == "min" else -np.inf)
+            (np.fmin if func == "min" else np.fmax).at(out, group_ids, vals)
+            columns[alias] = out
+
+    order = np.arange(groups)
+    if order_by is not None and groups:
+        key = np.nan_to_num(columns[order_by], nan=-np.inf, posinf=-np.inf, neginf=-np.inf)
+        order = np.argsort(-key, kind="stable")
+    order = order[: (top_k or max_groups)]
+
+    result = []
+    for gi in order:
+        row: Dict[str, Any] = {}
+        if group_by:
+            src = rows[int(first[gi])]
+            row.update({g: src.get(g) for g in group_by})
+        row.update({alias: _py(float(columns[alias][gi])) for _, _, alias in metrics})
+        result.append(row)
+    return result
@@ -0,0 +1,103 @@
+# ─── describe_cache.py ─────────────────────────────────────────────────────
+import asyncio, json, os, re, time
+from email.utils import formatdate
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+SF_DESCRIBE_CACHE_DIR = os.getenv("SF_DESCRIBE_CACHE_DIR", "./.sf_describe_cache")
+# seconds a describe is served without asking Salesforce whether it changed
+SF_DESCRIBE_REVALIDATE = float(os.getenv("SF_DESCRIBE_REVALIDATE", "3600"))
+
+# fetch(sobject, if_modified_since) -> describe dict, or None when unchanged (304)
+DescribeFetch = Callable[[str, Optional[str]], Awaitable[Optional[Dict[str, Any]]]]
+
+_SAFE_NAME_RE = re.compile(r"[^\w]")
+
+
+class DescribeCache:
+    """
+    sObject describe cache in memory and on disk.
+    - a cold process reads describes from disk instead of calling Salesforce
+    - entries older than `revalidate_after` are re-checked with If-Modified-Since
+      in the background; a 304 only bumps the timestamp
+    - concurrent requests for the same object share one describe call
+    """
+    def __init__(self, cache_dir: str = SF_DESCRIBE_CACHE_DIR, revalidate_after: float = SF_DESCRIBE_REVALIDATE) -> None:
+        self.cache_dir = cache_dir
+        self.revalidate_after = revalidate_after
+        self._entries: Dict[str, Dict[str, Any]] = {}   # name -> {"checked": epoch, "describe": {...}}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._revalidating: Dict[str, asyncio.Task] = {}
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "fetches": 0, "not_modified": 0, "errors": 0}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, _SAFE_NAME_RE.sub("_", name) + ".json")
+
+    def _load(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, name: str, entry: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(name)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp, path)
+        except OSError as e:
+            # read-only filesystem: keep serving from memory
+            print(f"[describe] could not write cache for {name}: {e}", flush=True)
+
+    async def _fetch(self, name: str, fetch: DescribeFetch, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        since = formatdate(entry["checked"], usegmt=True) if entry else None
+        now = time.time()
+        desc = await fetch(name, since)
+        if desc is None and entry is not None:
+            self.stats["not_modified"] += 1
+            entry = {"checked": now, "describe": entry["describe"]}
+        elif desc is None:
+            raise RuntimeError(f"empty describe for {name}")
+        else:
+            self.stats["fetches"] += 1
+            entry = {"checked": now, "describe": desc}
+        self._entries[name] = entry
+        await asyncio.to_thread(self._save, name, entry)
+        return entry
+
+    async def _revalidate(self, name: str, fetch: DescribeFetch, entry: Dict[str, Any]) -> None:
+        try:
+            await self._fetch(name, fetch, entry)
+        except Exception as e:
+            # stale describe beats no describe; try again on the next access
+            self.stats["errors"] += 1
+            print(f"[describe] revalidation of {name} failed: {e}", flush=True)
+        finally:
+            self._revalidating.pop(name, None)
+
+    async def get(self, name: str, fetch: DescribeFetch) -> Dict[str, Any]:
+        entry = self._entries.get(name)
+        if entry is not None:
+            self.stats["memory_hits"] += 1
+        else:
+            entry = await asyncio.to_thread(self._load, name)
+            if entry is not None:
+                self.stats["disk_hits"] += 1
+                self._entries[name] = entry
+
+        if entry is not None:
+            if time.time() - entry["checked"] > self.revalidate_after and name not in self._revalidating:
+                self._revalidating[name] = asyncio.create_task(self._revalidate(name, fetch, entry))
+            return entry["describe"]
+
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.create_task(self._fetch(name, fetch, None))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(name, None))
+        return (await asyncio.shield(task))["describe"]
+
+
+DESCRIBE_CACHE = DescribeCache()
@@ -0,0 +1,621 @@
+# ─── mirror.py ─────────────────────────────────────────────────────────────
+"""
+Read-only SQLite mirror of Salesforce objects for offline reporting.
+
+A background job pulls MIRROR_OBJECTS incrementally: every run asks
+queryAll for rows with SystemModstamp at or after the stored watermark,
+upserts them (deleted rows are removed) and advances the watermark page by
+page. Its Salesforce calls draw on their own rate budget, separate from
+interactive queries. `SqliteMirror.query` translates the common SOQL subset
+(plain and one-level parent fields, aggregates, WHERE / GROUP BY / HAVING /
+ORDER BY / LIMIT, date literals) to SQL over the local tables.
+"""
+import asyncio, datetime as dt, os, sqlite3, threading, time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from soql_parser import KEYWORDS, SoqlSyntaxError, Token, tokenize
+
+def _names(value: str) -> List[str]:
+    return [n.strip() for n in value.split(",") if n.strip()]
+
+MIRROR_ENABLED = os.getenv("MIRROR_ENABLED", "false").lower() == "true"
+MIRROR_PATH = os.getenv("MIRROR_PATH", "./mirror/salesforce.db")
+MIRROR_OBJECTS = _names(os.getenv("MIRROR_OBJECTS", "Contact,Account,Opportunity"))
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "300"))      # seconds between incremental syncs
+MIRROR_RATE_PER_MINUTE = int(os.getenv("MIRROR_RATE_PER_MINUTE", "30"))     # sync job's own API call budget
+MIRROR_MAX_ROWS = int(os.getenv("MIRROR_MAX_ROWS", "2000"))                  # rows returned per local query
+
+_AGGREGATES = {"COUNT", "COUNT_DISTINCT", "SUM", "AVG", "MIN", "MAX"}
+_DATE_FUNCS = {
+    "CALENDAR_YEAR": "CAST(strftime('%Y', {}) AS INTEGER)",
+    "CALENDAR_MONTH": "CAST(strftime('%m', {}) AS INTEGER)",
+    "DAY_ONLY": "substr({}, 1, 10)",
+}
+_OPS = {"=", "!=", "<>", "<", ">", "<=", ">="}
+
+
+class TranslationError(ValueError):
+    """SOQL outside the subset the local mirror can answer."""
+
+
+def _sql_type(sf_type: str) -> str:
+    if sf_type in ("boolean", "int"):
+        return "INTEGER"
+    if sf_type in ("double", "currency", "percent"):
+        return "REAL"
+    if sf_type in ("date", "datetime", "time"):
+        return "TEXT"
+    # SOQL compares text case-insensitively
+    return "TEXT COLLATE NOCASE"
+
+
+class ObjectSchema:
+    """Mirrored columns of one object and its lookups (relationship name → lookup column, target object)."""
+    def __init__(self, name: str, index: List[Dict[str, Any]]) -> None:
+        self.name = name
+        self.types: Dict[str, str] = {"Id": "id", "SystemModstamp": "datetime"}
+        self.rels: Dict[str, Tuple[str, str, str]] = {}
+        self.indexed: List[str] = ["SystemModstamp"]
+        for f in index:
+            self.types[f["name"]] = f["type"]
+            if f.get("rel") and len(f.get("ref", [])) == 1:
+                self.rels[f["rel"].lower()] = (f["rel"], f["name"], f["ref"][0])
+            if f["type"] in ("reference", "picklist"):
+                self.indexed.append(f["name"])
+        self.columns: Dict[str, str] = {c.lower(): c for c in self.types}
+
+
+# ── SOQL date literals ────────────────────────────────────────────────────
+def _month_start(d: dt.date, offset: int = 0) -> dt.date:
+    m = d.month - 1 + offset
+    return dt.date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def date_range(literal: str, today: dt.date) -> Tuple[str, str]:
+    """[start, end) ISO dates for TODAY, THIS_MONTH, LAST_N_DAYS:30 …; UTC, Sunday-start weeks."""
+    name, _, n = literal.upper().partition(":")
+    day = dt.timedelta(days=1)
+    week = today - dt.timedelta(days=(today.weekday() + 1) % 7)
+    quarter = dt.date(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+    ranges = {
+        "TODAY": (today, today + day),
+        "YESTERDAY": (today - day, today),
+        "TOMORROW": (today + day, today + 2 * day),
+        "THIS_WEEK": (week, week + 7 * day),
+        "LAST_WEEK": (week - 7 * day, week),
+        "NEXT_WEEK": (week + 7 * day, week + 14 * day),
+        "THIS_MONTH": (_month_start(today), _month_start(today, 1)),
+        "LAST_MONTH": (_month_start(today, -1), _month_start(today)),
+        "NEXT_MONTH": (_month_start(today, 1), _month_start(today, 2)),
+        "THIS_QUARTER": (quarter, _month_start(quarter, 3)),
+        "LAST_QUARTER": (_month_start(quarter, -3), quarter),
+        "NEXT_QUARTER": (_month_start(quarter, 3), _month_start(quarter, 6)),
+        "THIS_YEAR": (dt.date(today.year, 1, 1), dt.date(today.year + 1, 1, 1)),
+        "LAST_YEAR": (dt.date(today.year - 1, 1, 1), dt.date(today.year, 1, 1)),
+        "NEXT_YEAR": (dt.date(today.year + 1, 1, 1), dt.date(today.year + 2, 1, 1)),
+    }
+    if n:
+        if not n.isdigit():
+            raise TranslationError(f"bad date literal {literal}")
+        k = int(n)
+        if name == "LAST_N_DAYS":
+            ranges[name] = (today - k * day, today + day)
+        elif name == "NEXT_N_DAYS":
+            ranges[name] = (today + day, today + (k + 1) * day)
+    if name not in ranges:
+        raise TranslationError(f"date literal {literal} is not supported by the local mirror")
+    start, end = ranges[name]
+    return start.isoformat(), end.isoformat()
+
+
+def _datetime_literal(text: str) -> str:
+    """2024-01-01T10:00:00Z → stored form 2024-01-01T10:00:00.000+0000 (UTC)."""
+    try:
+        value = dt.datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise TranslationError(f"bad datetime literal {text}") from None
+    if value.tzinfo is not None:
+        value = value.astimezone(dt.timezone.utc)
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}+0000"
+
+
+# ── SOQL → SQL ────────────────────────────────────────────────────────────
+class _Translator:
+    def __init__(self, toks: List[Token], schemas: Dict[str, ObjectSchema], max_rows: int, today: dt.date) -> None:
+        self.toks = toks
+        self.schemas = schemas
+        self.max_rows = max_rows
+        self.today = today
+        self.i = 0
+        self.params: List[Any] = []
+        self.joins: Dict[str, str] = {}
+        self.aggregate = False
+        self.unnamed = 0
+        self.alias: Optional[str] = None
+        self.base: Optional[ObjectSchema] = None
+
+    # token helpers
+    def _peek(self, k: int = 0) -> Optional[Token]:
+        j = self.i + k
+        return self.toks[j] if j < len(self.toks) else None
+
+    def _word(self, word: str, k: int = 0) -> bool:
+        t = self._peek(k)
+        return t is not None and t.kind == "ident" and t.upper == word
+
+    def _take(self, text: Optional[str] = None) -> Token:
+        t = self._peek()
+        if t is None or (text is not None and (t.upper if t.kind == "ident" else t.text) != text):
+            raise TranslationError(f"expected {text or 'more'} near {t.text if t else 'end of query'}")
+        self.i += 1
+        return t
+
+    # operands
+    def column(self, path: str) -> Tuple[str, str, List[str]]:
+        """(SQL expression, Salesforce type, output key path) for a field path."""
+        parts = path.split(".")
+        if self.alias and len(parts) > 1 and parts[0].lower() == self.alias.lower():
+            parts = parts[1:]
+        base = self.base
+        if len(parts) == 1:
+            name = base.columns.get(parts[0].lower())
+            if name is None:
+                raise TranslationError(f"no column {parts[0]} on {base.name} in the local mirror")
+            return f'b."{name}"', base.types[name], [name]
+        if len(parts) > 2:
+            raise TranslationError("relationship paths deeper than one level aren't mirrored")
+        rel = base.rels.get(parts[0].lower())
+        target = self.schemas.get(rel[2].lower()) if rel else None
+        if rel is None or target is None:
+            raise TranslationError(f"relationship {parts[0]} on {base.name} isn't mirrored")
+        name = target.columns.get(parts[1].lower())
+        if name is None:
+            raise TranslationError(f"no column {parts[1]} on {target.name} in the local mirror")
+        join = f"j_{rel[0]}"
+        self.joins[join] = f'LEFT JOIN "{target.name}" AS "{join}" ON "{join}"."Id" = b."{rel[1]}"'
+        return f'"{join}"."{name}"', target.types[name], [rel[0], name]
+
+    def operand(self) -> Tuple[str, str, List[str], bool]:
+        """Field path or function call → (SQL, type, default key, is aggregate)."""
+        t = self._take()
+        if t.kind != "ident" or t.upper in KEYWORDS:
+            raise TranslationError(f"unexpected {t.text}")
+        if not (self._peek() and self._peek().text == "("):
+            return (*self.column(t.text), False)
+        func = t.upper
+        self._take("(")
+        if func == "COUNT" and self._peek() and self._peek().text == ")":
+            self._take(")")
+            return "COUNT(*)", "int", ["expr"], True
+        inner, inner_type, _, _ = self.operand()
+        self._take(")")
+        if func in _AGGREGATES:
+            sql = f"COUNT(DISTINCT {inner})" if func == "COUNT_DISTINCT" else f"{func}({inner})"
+            out_type = "int" if func.startswith("COUNT") else ("double" if func in ("SUM", "AVG") else inner_type)
+            return sql, out_type, ["expr"], True
+        if func in _DATE_FUNCS:
+            return _DATE_FUNCS[func].format(inner), "int" if func != "DAY_ONLY" else "date", [func], False
+        raise TranslationError(f"function {func} is not supported by the local mirror")
+
+    def literal(self, lhs_type: str) -> Any:
+        t = self._take()
+        if t.kind == "str":
+            return t.text[1:-1].replace("\\'", "'").replace("\\\\", "\\")
+        if t.kind == "num":
+            if "T" in t.text:
+                return _datetime_literal(t.text)
+            if t.text.count("-") == 2 and ":" not in t.text:
+                return t.text                               # date
+            return float(t.text) if any(c in t.text for c in ".eE") else int(t.text)
+        if t.kind == "ident" and t.upper in ("TRUE", "FALSE"):
+            return 1 if t.upper == "TRUE" else 0
+        raise TranslationError(f"unsupported value {t.text}")
+
+    def comparison(self) -> str:
+        lhs, lhs_type, _, agg = self.operand()
+        if agg and not self.aggregate:
+            raise TranslationError("aggregate functions in WHERE aren't allowed")
+        t = self._take()
+        op = t.upper if t.kind == "ident" else t.text
+        if op == "NOT" and self._word("IN"):
+            self._take()
+            op = "NOT IN"
+        if op in ("IN", "NOT IN"):
+            self._take("(")
+            if self._word("SELECT"):
+                raise TranslationError("semi-join subqueries are not supported by the local mirror")
+            values = []
+            while True:
+                values.append(self.literal(lhs_type))
+                if self._peek() and self._peek().text == ",":
+                    self._take()
+                    continue
+                break
+            self._take(")")
+            self.params.extend(values)
+            return f"{lhs} {op} ({', '.join('?' for _ in values)})"
+        if op == "LIKE":
+            t = self._take()
+            if t.kind != "str":
+                raise TranslationError("LIKE needs a string")
+            self.params.append(t.text[1:-1].replace("\\'", "'"))
+            return f"{lhs} LIKE ? ESCAPE '\\'"
+        if op not in _OPS:
+            raise TranslationError(f"operator {t.text} is not supported by the local mirror")
+        op = "!=" if op == "<>" else op
+        nxt = self._peek()
+        if nxt is not None and nxt.kind == "ident" and nxt.upper == "NULL":
+            self._take()
+            if op not in ("=", "!="):
+                raise TranslationError("NULL only compares with = or !=")
+            return f"{lhs} IS {'NOT ' if op == '!=' else ''}NULL"
+        if nxt is not None and nxt.kind == "ident" and nxt.upper not in ("TRUE", "FALSE"):
+            self._take()
+            start, end = date_range(nxt.text, self.today)
+            bounds = {"=": (f"{lhs} >= ? AND {lhs} < ?", [start, end]),
+                      "!=": (f"NOT ({lhs} >= ? AND {lhs} < ?)", [start, end]),
+                      "<": (f"{lhs} < ?", [start]), "<=": (f"{lhs} < ?", [end]),
+                      ">": (f"{lhs} >= ?", [end]), ">=": (f"{lhs} >= ?", [start])}
+            sql, values = bounds[op]
+            self.params.extend(values)
+            return f"({sql})"
+        self.params.append(self.literal(lhs_type))
+        return f"{lhs} {op} ?"
+
+    def condition(self) -> str:
+        parts = [self._conjunction()]
+        while self._word("OR"):
+            self._take()
+            parts.append(self._conjunction())
+        return " OR ".join(parts)
+
+    def _conjunction(self) -> str:
+        parts = [self._negation()]
+        while self._word("AND"):
+            self._take()
+            parts.append(self._negation())
+        return " AND ".join(parts)
+
+    def _negation(self) -> str:
+        if self._word("NOT"):
+            self._take()
+            return f"NOT {self._negation()}"
+        if self._peek() and self._peek().text == "(":
+            self._take("(")
+            inner = self.condition()
+            self._take(")")
+            return f"({inner})"
+        return self.comparison()
+
+    def _list(self, item: Callable[[], str]) -> List[str]:
+        out = [item()]
+        while self._peek() and self._peek().text == ",":
+            self._take()
+            out.append(item())
+        return out
+
+    def translate(self) -> Tuple[str, List[Any], List[Tuple[List[str], str]], ObjectSchema, bool]:
+        # find the FROM object first: SELECT-list fields resolve against it
+        depth, from_at = 0, None
+        for j, t in enumerate(self.toks):
+            depth += t.text == "("
+            depth -= t.text == ")"
+            if depth == 0 and t.kind == "ident" and t.upper == "FROM":
+                from_at = j
+                break
+        if from_at is None or from_at + 1 >= len(self.toks):
+            raise TranslationError("expected FROM <object>")
+        self.base = self.schemas.get(self.toks[from_at + 1].text.lower())
+        if self.base is None:
+            raise TranslationError(f"{self.toks[from_at + 1].text} isn't in the local mirror "
+                                   f"({', '.join(s.name for s in self.schemas.values())})")
+        after = self._peek_at(from_at + 2)
+        if after is not None and after.kind == "ident" and after.upper not in KEYWORDS:
+            self.alias = after.text
+
+        self._take("SELECT")
+        select, outputs = [], []
+        while True:
+            if self._peek() and self._peek().text == "(":
+                raise TranslationError("child subqueries are not supported by the local mirror")
+            if self._word("TYPEOF"):
+                raise TranslationError("TYPEOF is not supported by the local mirror")
+            sql, sf_type, key, agg = self.operand()
+            self.aggregate |= agg
+            nxt = self._peek()
+            if nxt is not None and nxt.kind == "ident" and nxt.upper not in KEYWORDS:
+                key = [self._take().text]
+            elif sql == "COUNT(*)" and not select and self._word("FROM"):
+                key = ["COUNT()"]                           # SELECT COUNT() reports only totalSize
+            elif agg or key[0] in _DATE_FUNCS:
+                key = [f"expr{self.unnamed}"]
+                self.unnamed += 1
+            select.append(f'{sql} AS "{".".join(key)}"')
+            outputs.append((key, sf_type))
+            if self._peek() and self._peek().text == ",":
+                self._take()
+                continue
+            break
+        self._take("FROM")
+        self._take()
+        if self.alias:
+            self._take()
+
+        where = group = having = order = ""
+        limit, offset = self.max_rows + 1, 0
+        while self._peek() is not None:
+            word = self._take().upper
+            if word == "WHERE":
+                where = f" WHERE {self.condition()}"
+            elif word == "GROUP":
+                self._take("BY")
+                if self._word("ROLLUP") or self._word("CUBE"):
+                    raise TranslationError("ROLLUP / CUBE are not supported by the local mirror")
+                group = " GROUP BY " + ", ".join(self._list(lambda: self.operand()[0]))
+                self.aggregate = True
+            elif word == "HAVING":
+                having = f" HAVING {self.condition()}"
+            elif word == "ORDER":
+                self._take("BY")
+                order = " ORDER BY " + ", ".join(self._list(self._order_item))
+            elif word == "LIMIT":
+                limit = min(int(self._take().text), self.max_rows + 1)
+            elif word == "OFFSET":
+                offset = int(self._take().text)
+            else:
+                raise TranslationError(f"{word} is not supported by the local mirror")
+
+        sql = (f"SELECT {', '.join(select)} FROM \"{self.base.name}\" AS b {' '.join(self.joins.values())}"
+               f"{where}{group}{having}{order} LIMIT {limit} OFFSET {offset}")
+        return sql, self.params, outputs, self.base, self.aggregate
+
+    def _peek_at(self, j: int) -> Optional[Token]:
+        return self.toks[j] if j < len(self.toks) else None
+
+    def _order_item(self) -> str:
+        t = self._peek()
+        # ORDER BY an aggregate alias
+        if t is not None and t.kind == "ident" and not (self._peek(1) and self._peek(1).text == "(") \
+                and t.text.lower() not in self.base.columns and "." not in t.text:
+            self._take()
+            sql = f'"{t.text}"'
+        else:
+            sql = self.operand()[0]
+        for word in ("ASC", "DESC"):
+            if self._word(word):
+                self._take()
+                sql += f" {word}"
+        if self._word("NULLS"):
+            self._take()
+            sql += f" NULLS {self._take().upper}"
+        return sql
+
+
+def translate_soql(soql: str, schemas: Dict[str, ObjectSchema], max_rows: int = MIRROR_MAX_ROWS,
+                   today: Optional[dt.date] = None) -> Tuple[str, List[Any], List[Tuple[List[str], str]], ObjectSchema, bool]:
+    """SOQL → (SQL, parameters, output columns, FROM schema, is aggregate); raises TranslationError outside the subset."""
+    try:
+        toks = tokenize(soql)
+    except SoqlSyntaxError as e:
+        raise TranslationError(str(e)) from None
+    tr = _Translator(toks, schemas, max_rows, today or dt.datetime.now(dt.timezone.utc).date())
+    return tr.translate()
+
+
+# ── sync budget ───────────────────────────────────────────────────────────
+class RateBudget:
+    """Token bucket for the sync job's Salesforce calls, independent of interactive traffic."""
+    def __init__(self, per_minute: int) -> None:
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, per_minute)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.calls = 0
+        self.waited_s = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.calls += 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            self.waited_s += wait
+            await asyncio.sleep(wait)
+
+
+# ── mirror ────────────────────────────────────────────────────────────────
+FieldsFor = Callable[[str], Awaitable[List[Dict[str, Any]]]]
+Fetch = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+class SqliteMirror:
+    def __init__(self, path: str = MIRROR_PATH, objects: List[str] = MIRROR_OBJECTS,
+                 interval: float = MIRROR_SYNC_INTERVAL, rate_per_minute: int = MIRROR_RATE_PER_MINUTE,
+                 max_rows: int = MIRROR_MAX_ROWS) -> None:
+        self.path = path
+        self.objects = objects
+        self.interval = interval
+        self.max_rows = max_rows
+        self.budget = RateBudget(rate_per_minute)
+        self.schemas: Dict[str, ObjectSchema] = {}
+        # sync writes and tool reads get their own connection; WAL lets them overlap
+        self._conns: Dict[str, sqlite3.Connection] = {}
+        self._locks = {"write": threading.Lock(), "read": threading.Lock()}
+        self._task: Optional[asyncio.Task] = None
+        self.counters: Dict[str, float] = {
+            "syncs": 0, "sync_errors": 0, "upserted": 0, "deleted": 0,
+            "queries": 0, "untranslatable": 0, "query_ms_total": 0.0,
+        }
+
+    # storage (called from worker threads; each connection is used under its lock)
+    def _db(self, role: str) -> sqlite3.Connection:
+        if role not in self._conns:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS _mirror_sync (object TEXT PRIMARY KEY, watermark TEXT, "
+                         "synced_at REAL, rows INTEGER)")
+            self._conns[role] = conn
+        return self._conns[role]
+
+    def _ensure_table(self, schema: ObjectSchema) -> None:
+        with self._locks["write"]:
+            db = self._db("write")
+            cols = ", ".join(f'"{c}" {_sql_type(t)}' for c, t in schema.types.items() if c != "Id")
+            db.execute(f'CREATE TABLE IF NOT EXISTS "{schema.name}" ("Id" TEXT PRIMARY KEY, {cols})')
+            have = {row[1].lower() for row in db.execute(f'PRAGMA table_info("{schema.name}")')}
+            for c, t in schema.types.items():
+                if c.lower() not in have:
+                    db.execute(f'ALTER TABLE "{schema.name}" ADD COLUMN "{c}" {_sql_type(t)}')
+            for c in schema.indexed:
+                db.execute(f'CREATE INDEX IF NOT EXISTS "ix_{schema.name}_{c}" ON "{schema.name}" ("{c}")')
+
+    def _sync_state(self, name: str) -> Tuple[Optional[str], Optional[float]]:
+        with self._locks["read"]:
+            row = self._db("read").execute("SELECT watermark, synced_at FROM _mirror_sync WHERE object = ?", (name,)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def _apply(self, schema: ObjectSchema, records: List[Dict[str, Any]], watermark: Optional[str]) -> Tuple[int, int]:
+        cols = list(schema.types)
+        quoted = [f'"{c}"' for c in cols]
+        upsert = (f'INSERT INTO "{schema.name}" ({", ".join(quoted)}) VALUES ({", ".join("?" for _ in cols)}) '
+                  'ON CONFLICT ("Id") DO UPDATE SET ' + ", ".join(f"{q} = excluded.{q}" for q in quoted[1:]))
+        rows, deleted = [], []
+        for rec in records:
+            if rec.get("IsDeleted"):
+                deleted.append((rec["Id"],))
+            else:
+                rows.append([int(v) if isinstance(v, bool) else (None if isinstance(v, dict) else v)
+                             for v in (rec.get(c) for c in cols)])
+        with self._locks["write"]:
+            db = self._db("write")
+            db.execute("BEGIN")
+            try:
+                if rows:
+                    db.executemany(upsert, rows)
+                if deleted:
+                    db.executemany(f'DELETE FROM "{schema.name}" WHERE "Id" = ?', deleted)
+                count = db.execute(f'SELECT COUNT(*) FROM "{schema.name}"').fetchone()[0]
+                db.execute("INSERT INTO _mirror_sync (object, watermark, synced_at, rows) VALUES (?, ?, ?, ?) "
+                           "ON CONFLICT (object) DO UPDATE SET watermark = excluded.watermark, "
+                           "synced_at = excluded.synced_at, rows = excluded.rows",
+                           (schema.name, watermark, time.time(), count))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return len(rows), len(deleted)
+
+    def _select(self, sql: str, params: List[Any]) -> List[tuple]:
+        with self._locks["read"]:
+            return self._db("read").execute(sql, params).fetchall()
+
+    # sync
+    async def sync_object(self, name: str, fields_for: FieldsFor, fetch: Fetch, fetch_more: Fetch) -> None:
+        schema = ObjectSchema(name, await fields_for(name))
+        await asyncio.to_thread(self._ensure_table, schema)
+        self.schemas[name.lower()] = schema
+
+        watermark, _ = await asyncio.to_thread(self._sync_state, name)
+        cols = [c for c in schema.types if c not in ("Id",)]
+        soql = f"SELECT Id, IsDeleted, {', '.join(cols)} FROM {name}"
+        if watermark:
+            # >= re-reads rows sharing the boundary stamp; upserts make that harmless
+            soql += f" WHERE SystemModstamp >= {watermark[:19]}Z"
+        soql += " ORDER BY SystemModstamp ASC"
+
+        await self.budget.acquire()
+        page = await fetch(soql)
+        while True:
+            records = page.get("records", [])
+            if records:
+                watermark = max(watermark or "", *(r.get("SystemModstamp") or "" for r in records)) or None
+            upserted, deleted = await asyncio.to_thread(self._apply, schema, records, watermark)
+            self.counters["upserted"] += upserted
+            self.counters["deleted"] += deleted
+            if page.get("done", True) or not page.get("nextRecordsUrl"):
+                return
+            await self.budget.acquire()
+            page = await fetch_more(page["nextRecordsUrl"])
+
+    async def sync_all(self, fields_for: FieldsFor, fetch: Fetch, fetch_more: Fetch) -> None:
+        for name in self.objects:
+            try:
+                await self.sync_object(name, fields_for, fetch, fetch_more)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["sync_errors"] += 1
+                print(f"[mirror] sync of {name} failed: {e}", flush=True)
+        self.counters["syncs"] += 1
+
+    def start(self, fields_for: FieldsFor, fetch: Fetch, fetch_more: Fetch) -> None:
+        async def run() -> None:
+            while True:
+                await self.sync_all(fields_for, fetch, fetch_more)
+                await asyncio.sleep(self.interval)
+        self._task = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # reads
+    async def query(self, soql: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            sql, params, outputs, base, aggregate = translate_soql(soql, self.schemas, self.max_rows)
+        except TranslationError as e:
+            self.counters["untranslatable"] += 1
+            return {"error": f"Not answerable from the local mirror: {e}. Use query_salesforce instead."}
+        try:
+            rows = await asyncio.to_thread(self._select, sql, params)
+        except sqlite3.Error as e:
+            self.counters["untranslatable"] += 1
+            return {"error": f"Not answerable from the local mirror: {e}. Use query_salesforce instead."}
+        _, synced_at = await asyncio.to_thread(self._sync_state, base.name)
+
+        as_of = dt.datetime.fromtimestamp(synced_at, dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if synced_at else "never"
+        self.counters["queries"] += 1
+        self.counters["query_ms_total"] += (time.perf_counter() - started) * 1000
+        if outputs[0][0] == ["COUNT()"]:
+            return {"totalSize": rows[0][0], "done": True, "source": "mirror", "as_of": as_of, "records": []}
+
+        rtype = "AggregateResult" if aggregate else base.name
+        records = []
+        for row in rows[: self.max_rows]:
+            rec: Dict[str, Any] = {"attributes": {"type": rtype}}
+            for (key, sf_type), value in zip(outputs, row):
+                if sf_type == "boolean" and value is not None:
+                    value = bool(value)
+                if len(key) == 2:
+                    rec.setdefault(key[0], {})[key[1]] = value
+                else:
+                    rec[key[0]] = value
+            records.append(rec)
+        return {"totalSize": len(records), "done": len(rows) <= self.max_rows, "source": "mirror",
+                "as_of": as_of, "records": records}
+
+    def stats(self) -> Dict[str, Any]:
+        queries = self.counters["queries"]
+        return {
+            "objects": sorted(s.name for s in self.schemas.values()),
+            "syncs": int(self.counters["syncs"]),
+            "sync_errors": int(self.counters["sync_errors"]),
+            "upserted": int(self.counters["upserted"]),
+            "deleted": int(self.counters["deleted"]),
+            "sync_api_calls": self.budget.calls,
+            "sync_rate_wait_s": round(self.budget.waited_s, 1),
+            "queries": int(queries),
+            "untranslatable": int(self.counters["untranslatable"]),
+            "query_ms_avg": round(self.counters["query_ms_total"] / queries, 2) if queries else 0.0,
+        }
+
+
+MIRROR = SqliteMirror()
@@ -0,0 +1,483 @@
+# ─── replica.py ────────────────────────────────────────────────────────────
+"""
+Optional in-process replica of hot sObjects, kept current by Change Data Capture.
+
+A full snapshot of each REPLICA_OBJECTS object is loaded once; change events
+(CometD /data/<Object>ChangeEvent, or LocalEventSource in tests) are applied
+incrementally. `try_query` answers simple single-object SOQL from the replica
+while the event stream is healthy and returns None for everything else, so the
+caller falls back to live SOQL.
+"""
+import asyncio, os, re, time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from soql_cache import SOQL_CACHE
+
+def _names(value: str) -> List[str]:
+    return [n.strip() for n in value.split(",") if n.strip()]
+
+REPLICA_ENABLED = os.getenv("REPLICA_ENABLED", "false").lower() == "true"
+REPLICA_OBJECTS = _names(os.getenv("REPLICA_OBJECTS", "Opportunity,Account"))
+REPLICA_SOURCE = os.getenv("REPLICA_SOURCE", "cometd")                        # cometd | local
+REPLICA_MAX_RECORDS = int(os.getenv("REPLICA_MAX_RECORDS", "50000"))          # per object; larger objects aren't replicated
+# seconds without confirmed contact with the event stream before queries go live again;
+# a CometD long poll returns at least every ~110 s even when nothing changed
+REPLICA_MAX_STALENESS = float(os.getenv("REPLICA_MAX_STALENESS", "130"))
+
+# normalized change event: {"entity", "change", "ids", "fields", "commit_ts" (epoch ms)}
+ChangeEvent = Dict[str, Any]
+
+
+# ── event sources ─────────────────────────────────────────────────────────
+class LocalEventSource:
+    """In-process stand-in for the Salesforce event stream (tests, demos); always considered live."""
+    def __init__(self) -> None:
+        self._q: "asyncio.Queue[ChangeEvent]" = asyncio.Queue()
+        self.stats: Dict[str, int] = {"reconnects": 0, "errors": 0}
+        self.subscribed = asyncio.Event()
+
+    async def publish(self, event: ChangeEvent) -> None:
+        await self._q.put(event)
+
+    def contact_age(self) -> float:
+        return 0.0
+
+    async def events(self, objects: List[str]) -> AsyncIterator[ChangeEvent]:
+        self.subscribed.set()
+        while True:
+            yield await self._q.get()
+
+
+def _channel(sobject: str) -> str:
+    base = sobject[:-3] + "__" if sobject.endswith("__c") else sobject
+    return f"/data/{base}ChangeEvent"
+
+
+def _change_event(payload: Dict[str, Any]) -> ChangeEvent:
+    header = payload.get("ChangeEventHeader", {})
+    fields = {k: v for k, v in payload.items() if k != "ChangeEventHeader" and not isinstance(v, dict)}
+    for name in header.get("nulledFields", []):
+        fields[name] = None
+    return {
+        "entity": header.get("entityName"),
+        "change": header.get("changeType"),
+        "ids": header.get("recordIds", []),
+        "fields": fields,
+        "commit_ts": header.get("commitTimestamp"),
+    }
+
+
+class CometDSource:
+    """
+    Change Data Capture over the Streaming API (Bayeux long polling) on the
+    async REST client. Re-handshakes on failure and resumes from the last
+    replayId per channel, so short disconnects don't lose events.
+    """
+    def __init__(self, client) -> None:
+        self.client = client
+        self._replay: Dict[str, int] = {}
+        self._last_contact: Optional[float] = None
+        self.stats: Dict[str, int] = {"reconnects": 0, "errors": 0}
+        # set while every channel is subscribed; snapshots wait for it so no change falls in between
+        self.subscribed = asyncio.Event()
+
+    def contact_age(self) -> float:
+        return float("inf") if self._last_contact is None else time.monotonic() - self._last_contact
+
+    async def _handshake(self) -> str:
+        resp = await self.client.cometd([{
+            "channel": "/meta/handshake", "version": "1.0", "minimumVersion": "1.0",
+            "supportedConnectionTypes": ["long-polling"], "ext": {"replay": True},
+        }])
+        meta = resp[0] if resp else {}
+        if not meta.get("successful"):
+            raise RuntimeError(f"CometD handshake failed: {meta.get('error')}")
+        return meta["clientId"]
+
+    async def _subscribe(self, client_id: str, objects: List[str]) -> None:
+        for channel in map(_channel, objects):
+            resp = await self.client.cometd([{
+                "channel": "/meta/subscribe", "clientId": client_id, "subscription": channel,
+                "ext": {"replay": {channel: self._replay.get(channel, -1)}},
+            }])
+            meta = resp[0] if resp else {}
+            if not meta.get("successful"):
+                raise RuntimeError(f"CometD subscribe to {channel} failed: {meta.get('error')}")
+
+    async def events(self, objects: List[str]) -> AsyncIterator[ChangeEvent]:
+        delay = 1.0
+        while True:
+            self.subscribed.clear()
+            try:
+                client_id = await self._handshake()
+                await self._subscribe(client_id, objects)
+                self.subscribed.set()
+                delay = 1.0
+                rehandshake = False
+                while not rehandshake:
+                    messages = await self.client.cometd([{
+                        "channel": "/meta/connect", "clientId": client_id, "connectionType": "long-polling",
+                    }])
+                    self._last_contact = time.monotonic()
+                    for m in messages:
+                        channel = m.get("channel", "")
+                        if channel == "/meta/connect":
+                            if not m.get("successful"):
+                                rehandshake = True
+                            continue
+                        if channel.startswith("/data/") and "data" in m:
+                            self._replay[channel] = m["data"].get("event", {}).get("replayId", -1)
+                            yield _change_event(m["data"].get("payload", {}))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[replica] event stream error: {e}; reconnecting in {delay:.0f}s", flush=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+            self.stats["reconnects"] += 1
+
+
+# ── simple SOQL ───────────────────────────────────────────────────────────
+_SIMPLE_RE = re.compile(
+    r"^\s*select\s+(?P<fields>[\w\s,]+?)\s+from\s+(?P<obj>\w+)"
+    r"(?:\s+where\s+(?P<where>.+?))?"
+    r"(?:\s+order\s+by\s+(?P<order>\w+)(?:\s+(?P<dir>asc|desc))?(?:\s+nulls\s+(?P<nulls>first|last))?)?"
+    r"(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_COND_TOKEN_RE = re.compile(r"'(?:[^'\\]|\\.)*'|!=|<>|<=|>=|=|<|>|\(|\)|,|[^\s'(),=<>!]+")
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_OPS = {"=", "!=", "<>", "<", ">", "<=", ">=", "like", "in", "not in"}
+
+# (field, op, value); value is a list for IN / NOT IN
+Condition = Tuple[str, str, Any]
+
+
+def _literal(tok: str) -> Any:
+    if tok.startswith("'"):
+        return re.sub(r"\\(.)", r"\1", tok[1:-1])
+    low = tok.lower()
+    if low in ("true", "false"):
+        return low == "true"
+    if low == "null":
+        return None
+    if _DATE_RE.match(tok):
+        # date fields compare as ISO strings; datetime literals (offsets, formats) go live
+        return tok
+    try:
+        return float(tok)
+    except ValueError:
+        raise ValueError(f"unsupported literal {tok}") from None
+
+
+def parse_conditions(where: str) -> List[Condition]:
+    """`A = 'x' AND B > 3 AND C IN ('p','q')` → conditions; anything else (OR, NOT, nesting, functions) raises."""
+    toks = _COND_TOKEN_RE.findall(where)
+    conds: List[Condition] = []
+    i = 0
+    while i < len(toks):
+        if conds:
+            if toks[i].lower() != "and":
+                raise ValueError("only AND-ed conditions are served locally")
+            i += 1
+        if i >= len(toks):
+            raise ValueError("incomplete condition")
+        field = toks[i]
+        if not re.match(r"^[A-Za-z_]\w*$", field):
+            raise ValueError(f"unsupported operand {field}")
+        op = toks[i + 1].lower() if i + 1 < len(toks) else ""
+        if op == "not" and i + 2 < len(toks) and toks[i + 2].lower() == "in":
+            op, i = "not in", i + 1
+        if op not in _OPS:
+            raise ValueError(f"unsupported operator {op}")
+        i += 2
+        if op in ("in", "not in"):
+            if i >= len(toks) or toks[i] != "(":
+                raise ValueError("IN needs a parenthesized list")
+            values, i = [], i + 1
+            while i < len(toks) and toks[i] != ")":
+                if toks[i] != ",":
+                    values.append(_literal(toks[i]))
+                i += 1
+            if i >= len(toks):
+                raise ValueError("unterminated IN list")
+            i += 1
+            conds.append((field, op, values))
+        else:
+            if i >= len(toks):
+                raise ValueError("missing value")
+            conds.append((field, "!=" if op == "<>" else op, _literal(toks[i])))
+            i += 1
+    return conds
+
+
+def _fold(v: Any) -> Any:
+    # SOQL text comparisons are case-insensitive
+    return v.casefold() if isinstance(v, str) else v
+
+
+def _matches(value: Any, op: str, lit: Any) -> bool:
+    if op == "=":
+        return value is None if lit is None else _fold(value) == _fold(lit)
+    if op == "!=":
+        return value is not None if lit is None else _fold(value) != _fold(lit)
+    if op == "in":
+        return _fold(value) in {_fold(x) for x in lit}
+    if op == "not in":
+        return _fold(value) not in {_fold(x) for x in lit}
+    if value is None or lit is None:
+        return False
+    if op == "like":
+        pattern = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in str(lit))
+        return re.fullmatch(pattern, str(value), re.IGNORECASE | re.DOTALL) is not None
+    try:
+        return {"<": value < lit, ">": value > lit, "<=": value <= lit, ">=": value >= lit}[op]
+    except TypeError:
+        return False
+
+
+# ── store ─────────────────────────────────────────────────────────────────
+class _Table:
+    """Records of one sObject by Id, plus hash indexes built on first equality lookup and kept up to date."""
+    def __init__(self, sobject: str) -> None:
+        self.sobject = sobject
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.fields: Dict[str, str] = {}               # lower-case name → API name
+        self.indexes: Dict[str, Dict[Any, Set[str]]] = {}
+        self.state = "loading"                         # loading | live | too_large | error
+        self.pending: List[ChangeEvent] = []           # events that arrive while a snapshot loads
+        self.snapshot_at: Optional[float] = None
+        self.counters: Dict[str, float] = {
+            "events": 0, "served": 0, "fallbacks": 0, "snapshot_errors": 0, "lag_ms_total": 0.0, "lag_ms_max": 0.0,
+        }
+        self.last_event_at: Optional[float] = None
+
+    def load(self, records: List[Dict[str, Any]], fields: List[str]) -> None:
+        self.fields = {f.lower(): f for f in ["Id", *fields]}
+        self.rows = {r["Id"]: {f: r.get(f) for f in self.fields.values()} for r in records}
+        self.indexes.clear()
+        self.snapshot_at = time.time()
+
+    def _index_remove(self, rid: str, row: Dict[str, Any]) -> None:
+        for field, idx in self.indexes.items():
+            ids = idx.get(_fold(row.get(field)))
+            if ids is not None:
+                ids.discard(rid)
+
+    def _index_add(self, rid: str, row: Dict[str, Any]) -> None:
+        for field, idx in self.indexes.items():
+            idx.setdefault(_fold(row.get(field)), set()).add(rid)
+
+    def upsert(self, rid: str, values: Dict[str, Any]) -> None:
+        row = self.rows.get(rid)
+        if row is not None:
+            self._index_remove(rid, row)
+        else:
+            row = {f: None for f in self.fields.values()}
+            row["Id"] = rid
+            self.rows[rid] = row
+        for name, value in values.items():
+            api = self.fields.get(name.lower())
+            if api is not None and api != "Id":
+                row[api] = value
+        self._index_add(rid, row)
+
+    def delete(self, rid: str) -> None:
+        row = self.rows.pop(rid, None)
+        if row is not None:
+            self._index_remove(rid, row)
+
+    def index(self, field: str) -> Dict[Any, Set[str]]:
+        idx = self.indexes.get(field)
+        if idx is None:
+            idx = {}
+            for rid, row in self.rows.items():
+                idx.setdefault(_fold(row.get(field)), set()).add(rid)
+            self.indexes[field] = idx
+        return idx
+
+    def select(self, conds: List[Condition]) -> List[Dict[str, Any]]:
+        candidates = None
+        for field, op, lit in conds:
+            if op == "=" or op == "in":
+                idx = self.index(field)
+                keys = [lit] if op == "=" else lit
+                ids: Set[str] = set()
+                for k in keys:
+                    ids |= idx.get(_fold(k), set())
+                candidates = ids if candidates is None else candidates & ids
+        rows = self.rows.values() if candidates is None else (self.rows[i] for i in candidates)
+        return [r for r in rows if all(_matches(r.get(f), op, lit) for f, op, lit in conds)]
+
+
+class Replica:
+    def __init__(self, objects: List[str] = REPLICA_OBJECTS, max_staleness: float = REPLICA_MAX_STALENESS,
+                 max_records: int = REPLICA_MAX_RECORDS) -> None:
+        self.objects = objects
+        self.max_staleness = max_staleness
+        self.max_records = max_records
+        self.tables: Dict[str, _Table] = {o.lower(): _Table(o) for o in objects}
+        self.source = None
+        self._fields_for: Optional[Callable[[str], Awaitable[List[str]]]] = None
+        self._fetch_all: Optional[Callable[[str, int], Awaitable[List[Dict[str, Any]]]]] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._consumer: Optional[asyncio.Task] = None
+        self.event_errors = 0
+
+    # lifecycle
+    def start(self, source, fields_for: Callable[[str], Awaitable[List[str]]],
+              fetch_all: Callable[[str, int], Awaitable[List[Dict[str, Any]]]]) -> None:
+        """Subscribe first, then snapshot, so no change between the two is missed (see _snapshot)."""
+        self.source, self._fields_for, self._fetch_all = source, fields_for, fetch_all
+        self._consumer = asyncio.create_task(self._consume())
+        for table in self.tables.values():
+            self._resync(table)
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._consumer, *self._tasks) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _resync(self, table: _Table) -> None:
+        task = asyncio.create_task(self._snapshot(table))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _snapshot(self, table: _Table) -> None:
+        # retried with backoff like the event stream: a failed first login shouldn't leave the table dark
+        delay = 1.0
+        while True:
+            table.state = "loading"
+            try:
+                # events buffer in table.pending from here on; read only once the stream is subscribed
+                await self.source.subscribed.wait()
+                fields = [f for f in await self._fields_for(table.sobject) if f != "Id"]
+                soql = f"SELECT Id, {', '.join(fields)} FROM {table.sobject}" if fields else f"SELECT Id FROM {table.sobject}"
+                records = await self._fetch_all(soql, self.max_records + 1)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                table.state, table.pending = "error", []
+                table.counters["snapshot_errors"] += 1
+                print(f"[replica] snapshot of {table.sobject} failed: {e}; retrying in {delay:.0f}s", flush=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+        if len(records) > self.max_records:
+            table.state, table.pending = "too_large", []
+            table.rows.clear()
+            print(f"[replica] {table.sobject} has more than {self.max_records} records; not replicated", flush=True)
+            return
+        table.load(records, fields)
+        pending, table.pending = table.pending, []
+        table.state = "live"
+        for event in pending:
+            self._apply(table, event)
+        print(f"[replica] {table.sobject}: {len(table.rows)} records loaded", flush=True)
+
+    async def _consume(self) -> None:
+        async for event in self.source.events(self.objects):
+            try:
+                table = self.tables.get(str(event.get("entity", "")).lower())
+                if table is None:
+                    continue
+                SOQL_CACHE.invalidate(table.sobject)
+                if table.state == "loading":
+                    table.pending.append(event)
+                elif table.state == "live":
+                    self._apply(table, event)
+            except Exception as e:
+                # one malformed event must not stop the consumer while the source still looks live
+                self.event_errors += 1
+                print(f"[replica] skipped bad change event: {e}", flush=True)
+
+    def _apply(self, table: _Table, event: ChangeEvent) -> None:
+        change = str(event.get("change", "")).upper()
+        if change.startswith("GAP_"):
+            # events were lost upstream: the replica can't be trusted until reloaded
+            self._resync(table)
+            return
+        for rid in event.get("ids", []):
+            if change == "DELETE":
+                table.delete(rid)
+            else:
+                table.upsert(rid, event.get("fields", {}))
+        now = time.time()
+        table.counters["events"] += 1
+        table.last_event_at = now
+        if event.get("commit_ts"):
+            lag = max(now * 1000 - float(event["commit_ts"]), 0.0)
+            table.counters["lag_ms_total"] += lag
+            table.counters["lag_ms_max"] = max(table.counters["lag_ms_max"], lag)
+
+    # reads
+    def fresh(self, table: _Table) -> bool:
+        return table.state == "live" and self.source is not None and self.source.contact_age() <= self.max_staleness
+
+    def try_query(self, soql: str) -> Optional[Dict[str, Any]]:
+        """REST-shaped result for simple SOQL on a fresh replicated object; None means: ask Salesforce."""
+        m = _SIMPLE_RE.match(soql)
+        if not m:
+            return None
+        table = self.tables.get(m.group("obj").lower())
+        if table is None:
+            return None
+        if not self.fresh(table):
+            table.counters["fallbacks"] += 1
+            return None
+        try:
+            fields = [table.fields[f.strip().lower()] for f in m.group("fields").split(",")]
+            conds = parse_conditions(m.group("where")) if m.group("where") else []
+            conds = [(table.fields[f.lower()], op, lit) for f, op, lit in conds]
+            order = table.fields[m.group("order").lower()] if m.group("order") else None
+        except (KeyError, ValueError):
+            # a field we don't hold or a filter we don't evaluate
+            table.counters["fallbacks"] += 1
+            return None
+
+        rows = table.select(conds)
+        if order is not None:
+            desc = (m.group("dir") or "asc").lower() == "desc"
+            nulls_first = (m.group("nulls") or ("last" if desc else "first")).lower() == "first"
+            present = sorted((r for r in rows if r.get(order) is not None), key=lambda r: _fold(r[order]), reverse=desc)
+            nulls = [r for r in rows if r.get(order) is None]
+            rows = nulls + present if nulls_first else present + nulls
+        if m.group("limit"):
+            rows = rows[: int(m.group("limit"))]
+        table.counters["served"] += 1
+        records = [{"attributes": {"type": table.sobject}, **{f: r.get(f) for f in fields}} for r in rows]
+        return {"totalSize": len(records), "done": True, "records": records}
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        objects = {}
+        for t in self.tables.values():
+            events = t.counters["events"]
+            objects[t.sobject] = {
+                "state": t.state,
+                "fresh": self.fresh(t),
+                "records": len(t.rows),
+                "indexes": sorted(t.indexes),
+                "snapshot_age_s": round(now - t.snapshot_at, 1) if t.snapshot_at else None,
+                "last_event_age_s": round(now - t.last_event_at, 1) if t.last_event_at else None,
+                "events": int(events),
+                "lag_ms_avg": round(t.counters["lag_ms_total"] / events, 1) if events else 0.0,
+                "lag_ms_max": round(t.counters["lag_ms_max"], 1),
+                "served": int(t.counters["served"]),
+                "fallbacks": int(t.counters["fallbacks"]),
+                "snapshot_errors": int(t.counters["snapshot_errors"]),
+            }
+        contact = self.source.contact_age() if self.source is not None else None
+        return {
+            "enabled": self.source is not None,
+            "stream_contact_age_s": None if contact in (None, float("inf")) else round(contact, 1),
+            "stream_subscribed": self.source is not None and self.source.subscribed.is_set(),
+            "stream": dict(self.source.stats) if self.source is not None else {},
+            "event_errors": self.event_errors,
+            "objects": objects,
+        }
+
+
+REPLICA = Replica()
@@ -0,0 +1,78 @@
+# ─── result_format.py ──────────────────────────────────────────────────────
+import csv, io, json, os
+from typing import Any, Dict, List
+
+RESULT_FORMAT = os.getenv("RESULT_FORMAT", "csv")                 # csv | json (raw dict, as before)
+RESULT_MAX_CHARS = int(os.getenv("RESULT_MAX_CHARS", "16000"))    # budget for one tool result text
+
+
+def flatten_record(rec: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    Drop `attributes` and flatten parent relationships into dotted columns
+    (Account → Account.Name). Child subquery results become a compact JSON cell.
+    """
+    flat: Dict[str, Any] = {}
+    for key, value in rec.items():
+        if key == "attributes":
+            continue
+        col = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if "records" in value:
+                flat[col] = json.dumps([flatten_record(r) for r in value["records"]], default=str, separators=(",", ":"))
+            else:
+                flat.update(flatten_record(value, f"{col}."))
+        else:
+            flat[col] = value
+    return flat
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def format_records(records: List[Dict[str, Any]], max_chars: int = RESULT_MAX_CHARS) -> tuple[str, int]:
+    """CSV text with one header row; returns (text, rows written) within `max_chars`."""
+    rows = [flatten_record(r) for r in records]
+    columns: Dict[str, None] = {}
+    for row in rows:
+        for col in row:
+            columns.setdefault(col, None)
+    # a null parent (Account = None) on some rows shouldn't add a column next to Account.Name
+    parents = {c.rsplit(".", 1)[0] for c in columns if "." in c}
+    columns = {c: None for c in columns if c not in parents}
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+    written = 0
+    for row in rows:
+        mark = buf.tell()
+        writer.writerow([_cell(row.get(col)) for col in columns])
+        if buf.tell() > max_chars and written > 0:
+            buf.seek(mark)
+            buf.truncate()
+            break
+        written += 1
+    return buf.getvalue(), written
+
+
+def format_query_result(result: Dict[str, Any], max_chars: int = RESULT_MAX_CHARS) -> str:
+    """Compact text form of a query result: a one-line summary followed by CSV rows."""
+    records = result.get("records", [])
+    body, written = format_records(records, max_chars)
+    meta = [f"totalSize={result.get('totalSize', len(records))}", f"rows={written}"]
+    if "done" in result:
+        meta.append(f"done={'true' if result['done'] else 'false'}")
+    if result.get("cursor"):
+        meta.append(f"cursor={result['cursor']}")
+    for key in ("source", "scanned", "as_of"):
+        if key in result:
+            meta.append(f"{key}={result[key]}")
+    lines = [" ".join(meta), body.rstrip("\n")]
+    if written < len(records):
+        lines.append(f"[{len(records) - written} more rows omitted to fit the {max_chars}-char budget]")
+    return "\n".join(lines)
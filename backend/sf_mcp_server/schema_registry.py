@@ -0,0 +1,126 @@
+# ─── schema_registry.py ────────────────────────────────────────────────────
+import asyncio, os, sys
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from describe_cache import DESCRIBE_CACHE, DescribeCache
+
+def _names(value: str) -> List[str]:
+    return [n.strip() for n in value.split(",") if n.strip()]
+
+# every object the agent may query (standard or custom, e.g. "Invoice__c")
+SF_SCHEMA_OBJECTS = _names(os.getenv("SF_SCHEMA_OBJECTS", "Contact,Account,Opportunity,Lead,Case,Task"))
+# objects whose fields are rendered into the query_salesforce description; the rest via describe_object
+SF_SCHEMA_PROMPT_OBJECTS = _names(os.getenv("SF_SCHEMA_PROMPT_OBJECTS", "Contact,Account,Opportunity"))
+SF_SCHEMA_MAX_PICKLIST = int(os.getenv("SF_SCHEMA_MAX_PICKLIST", "25"))  # picklist values kept per field
+
+# never useful in a query the agent writes
+SKIP_NAMES = {
+    "IsDeleted", "MasterRecordId", "SystemModstamp", "LastViewedDate", "LastReferencedDate",
+    "PhotoUrl", "Jigsaw", "JigsawContactId", "LastCURequestDate", "LastCUUpdateDate",
+}
+SKIP_TYPES = {"address", "location", "anyType", "base64"}
+
+
+def index_fields(desc: Dict[str, Any], max_picklist: int = SF_SCHEMA_MAX_PICKLIST) -> List[Dict[str, Any]]:
+    """Compact per-field index of a describe: name, type, and only the extras a SOQL author needs."""
+    index = []
+    for f in desc.get("fields", []):
+        if f.get("deprecatedAndHidden") or f["name"] in SKIP_NAMES or f["type"] in SKIP_TYPES:
+            continue
+        entry: Dict[str, Any] = {"name": f["name"], "type": f["type"]}
+        if f.get("custom") and f.get("label"):
+            # custom API names are often cryptic; the label says what the field means
+            entry["label"] = f["label"]
+        if f["type"] == "reference" and f.get("referenceTo"):
+            entry["ref"] = f["referenceTo"]
+            if f.get("relationshipName"):
+                entry["rel"] = f["relationshipName"]
+        if f["type"] in ("picklist", "multipicklist"):
+            values = [p["value"] for p in f.get("picklistValues", []) if p.get("active", True)]
+            entry["values"] = values[:max_picklist]
+            if len(values) > max_picklist:
+                # say so, or the model treats the cut list as complete
+                entry["more"] = len(values) - max_picklist
+        index.append(entry)
+    return index
+
+
+def render_fields(index: List[Dict[str, Any]]) -> str:
+    """One line: `Name:type`, `AccountId:reference->Account(Account)`, `Stage:picklist[a|b|+3 more]`."""
+    parts = []
+    for e in index:
+        text = f"{e['name']}:{e['type']}"
+        if "ref" in e:
+            text += "->" + "|".join(e["ref"])
+            if "rel" in e:
+                text += f"({e['rel']})"
+        if e.get("values"):
+            more = [f"+{e['more']} more"] if e.get("more") else []
+            text += "[" + "|".join([*e["values"], *more]) + "]"
+        if "label" in e:
+            text += f" \"{e['label']}\""
+        parts.append(text)
+    return ", ".join(parts)
+
+
+class SchemaRegistry:
+    """
+    Field indexes for the configured sObjects, built from cached describes.
+    Indexes load lazily; `prompt_objects` are the ones worth paying for on every turn.
+    """
+    def __init__(self, objects: Iterable[str] = SF_SCHEMA_OBJECTS, prompt_objects: Iterable[str] = SF_SCHEMA_PROMPT_OBJECTS,
+                 describes: DescribeCache = DESCRIBE_CACHE) -> None:
+        self.objects = list(dict.fromkeys([*prompt_objects, *objects]))
+        self.prompt_objects = list(prompt_objects)
+        self.describes = describes
+        self._indexes: Dict[str, List[Dict[str, Any]]] = {}
+        self._fetch: Optional[Callable[[str, Optional[str]], Awaitable[Any]]] = None
+
+    def bind(self, fetch: Callable[[str, Optional[str]], Awaitable[Any]]) -> None:
+        """Set the describe call (sf_tools._sf_describe) used on cache misses."""
+        self._fetch = fetch
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Configured object name for `name`, case-insensitively."""
+        lowered = name.strip().lower()
+        return next((o for o in self.objects if o.lower() == lowered), None)
+
+    async def index(self, name: str) -> List[Dict[str, Any]]:
+        if name not in self._indexes:
+            if self._fetch is None:
+                raise RuntimeError("SchemaRegistry.bind() was not called")
+            desc = await self.describes.get(name, self._fetch)
+            self._indexes[name] = index_fields(desc)
+        return self._indexes[name]
+
+    async def load(self, names: Optional[Iterable[str]] = None) -> None:
+        """Index `names` (default: the prompt objects) concurrently; failures are logged, not raised."""
+        names = list(names if names is not None else self.prompt_objects)
+        results = await asyncio.gather(*(self.index(n) for n in names), return_exceptions=True)
+        for name, res in zip(names, results):
+            if isinstance(res, Exception):
+                print(f"[schema] could not index {name}: {res}", flush=True)
+
+    async def render(self, name: str) -> str:
+        """Field list for describe_object: like the index, but with every picklist value."""
+        if self._fetch is None:
+            raise RuntimeError("SchemaRegistry.bind() was not called")
+        desc = await self.describes.get(name, self._fetch)
+        return f"{name}: {render_fields(index_fields(desc, max_picklist=sys.maxsize))}"
+
+    def tool_description(self) -> str:
+        """query_salesforce description from whatever prompt objects are indexed so far."""
+        lines = [
+            "Queries Salesforce with a SOQL query. Fields per object (name:type, ->lookup target(relationship name)):",
+        ]
+        lines += [f"- {o}: {render_fields(self._indexes[o])}" for o in self.prompt_objects if o in self._indexes]
+        others = [o for o in self.objects if o not in self.prompt_objects or o not in self._indexes]
+        if others:
+            lines.append(f"Other queryable objects (call describe_object for their fields): {', '.join(others)}")
+        lines.append("Picklists ending in `+N more` are cut short; describe_object lists every value.")
+        lines.append("Large results are truncated; when `done` is false, call query_salesforce_more with the returned `cursor`.")
+        lines.append("Example SOQL: \"SELECT Id, FirstName, LastName, Email, Account.Name FROM Contact WHERE LastName = 'Doe'\"")
+        return "\n".join(lines)
+
+
+SCHEMA_REGISTRY = SchemaRegistry()
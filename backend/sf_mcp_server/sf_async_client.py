@@ -0,0 +1,209 @@
+# ─── sf_async_client.py ────────────────────────────────────────────────────
+import asyncio, json, os
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import httpx
+
+SF_API_VERSION = os.getenv("SF_API_VERSION", "59.0")
+SF_HTTP2 = os.getenv("SF_HTTP2", "true").lower() == "true"
+SF_MAX_CONNECTIONS = int(os.getenv("SF_MAX_CONNECTIONS", "20"))
+# session id reused across restarts (file is 0600; empty disables)
+SF_SESSION_CACHE = os.getenv("SF_SESSION_CACHE", "./.sf_session.json")
+
+_SOAP_NS = "{urn:partner.soap.sforce.com}"
+_LOGIN_ENVELOPE = """<?xml version="1.0" encoding="utf-8" ?>
+<env:Envelope xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xmlns:env="http://schemas.xmlsoap.org/soap/envelope/"
+    xmlns:urn="urn:partner.soap.sforce.com">
+  <env:Header>
+    <urn:CallOptions><urn:client>sf-mcp-server</urn:client><urn:defaultNamespace>sf</urn:defaultNamespace></urn:CallOptions>
+  </env:Header>
+  <env:Body>
+    <n1:login xmlns:n1="urn:partner.soap.sforce.com">
+      <n1:username>{username}</n1:username>
+      <n1:password>{password}{token}</n1:password>
+    </n1:login>
+  </env:Body>
+</env:Envelope>"""
+
+
+def load_session(username: str, domain: str, path: str = SF_SESSION_CACHE) -> Optional[Dict[str, str]]:
+    """Cached {"session_id", "instance_url"} for this user/domain, if any. It may have expired."""
+    if not path:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("username") != username or cached.get("domain") != domain:
+        return None
+    if not cached.get("session_id") or not cached.get("instance_url"):
+        return None
+    return cached
+
+
+def save_session(username: str, domain: str, session_id: str, instance_url: str, path: str = SF_SESSION_CACHE) -> None:
+    if not path:
+        return
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"username": username, "domain": domain, "session_id": session_id,
+                       "instance_url": instance_url}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[sf] could not cache session: {e}", flush=True)
+
+
+class SalesforceApiError(Exception):
+    def __init__(self, status: int, content: Any) -> None:
+        self.status = status
+        self.content = content
+        super().__init__(f"Salesforce API error {status}: {content}")
+
+
+class AsyncSalesforce:
+    """
+    Thread-free Salesforce REST client on one pooled httpx.AsyncClient
+    (HTTP/2 when available, keep-alive otherwise, gzip responses).
+    Logs in lazily, on the first call, with the same username + password +
+    security token SOAP flow as simple-salesforce and logs in again, once per
+    expiry, when a call gets 401.
+    """
+    def __init__(self, username: Optional[str], password: Optional[str], security_token: Optional[str], domain: str = "login",
+                 version: str = SF_API_VERSION, http2: bool = SF_HTTP2,
+                 max_connections: int = SF_MAX_CONNECTIONS) -> None:
+        self.username = username
+        self.password = password
+        self.security_token = security_token
+        self.domain = domain
+        self.version = version
+        self.session_id: Optional[str] = None
+        self.instance_url: Optional[str] = None
+        self._login_lock = asyncio.Lock()
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"Accept-Encoding": "gzip", "Accept": "application/json"},
+        )
+
+    async def login(self, stale_session: Optional[str] = None) -> None:
+        """
+        Single-flight login: concurrent callers that saw the same stale session share one login.
+        The first login reuses the session cached by a previous process; a 401 on it lands here again.
+        """
+        async with self._login_lock:
+            if self.session_id is not None and self.session_id != stale_session:
+                return
+            if stale_session is None:
+                cached = load_session(self.username, self.domain)
+                if cached is not None:
+                    self.session_id = cached["session_id"]
+                    self.instance_url = cached["instance_url"]
+                    return
+            if not all([self.username, self.password, self.security_token]):
+                raise RuntimeError("Missing SF_USERNAME/SF_PASSWORD/SF_SECURITY_TOKEN in environment")
+            body = _LOGIN_ENVELOPE.format(
+                username=escape(self.username), password=escape(self.password), token=escape(self.security_token)
+            )
+            r = await self._client.post(
+                f"https://{self.domain}.salesforce.com/services/Soap/u/{self.version}",
+                content=body.encode("utf-8"),
+                headers={"Content-Type": "text/xml; charset=UTF-8", "SOAPAction": "login"},
+            )
+            try:
+                root = ElementTree.fromstring(r.content)
+            except ElementTree.ParseError:
+                root = ElementTree.Element("empty")
+            session_id = root.findtext(f".//{_SOAP_NS}sessionId")
+            server_url = root.findtext(f".//{_SOAP_NS}serverUrl")
+            if r.status_code != 200 or not session_id or not server_url:
+                fault = root.findtext(".//faultstring") or r.text
+                raise SalesforceApiError(r.status_code, f"login failed: {fault}")
+            self.session_id = session_id
+            self.instance_url = f"https://{urlparse(server_url).hostname}"
+            save_session(self.username, self.domain, self.session_id, self.instance_url)
+
+    async def _request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None, json_body: Any = None, raw: bool = False,
+                       timeout: Optional[float] = None) -> Any:
+        if self.session_id is None:
+            await self.login()
+        for attempt in range(2):
+            session_id = self.session_id
+            r = await self._client.request(
+                method, f"{self.instance_url}{path}", params=params, json=json_body,
+                headers={**(headers or {}), "Authorization": f"Bearer {session_id}"},
+                timeout=timeout if timeout is not None else self._client.timeout,
+            )
+            if r.status_code == 304:
+                return None
+            if r.status_code == 401 and attempt == 0:
+                # INVALID_SESSION_ID: session expired; refresh and retry once
+                await self.login(stale_session=session_id)
+                continue
+            if r.status_code >= 300:
+                try:
+                    content = r.json()
+                except ValueError:
+                    content = r.text
+                raise SalesforceApiError(r.status_code, content)
+            if raw:
+                return r
+            return r.json() if r.content else None
+
+    def _data_path(self, suffix: str) -> str:
+        return f"/services/data/v{self.version}/{suffix}"
+
+    async def query(self, soql: str, include_deleted: bool = False) -> Dict[str, Any]:
+        """First page of `soql`; `include_deleted` uses queryAll (deleted and archived rows too)."""
+        endpoint = "queryAll/" if include_deleted else "query/"
+        return await self._request("GET", self._data_path(endpoint), params={"q": soql})
+
+    async def query_more(self, next_records: str, identifier_is_url: bool = False) -> Dict[str, Any]:
+        path = next_records if identifier_is_url else self._data_path(f"query/{next_records}")
+        return await self._request("GET", path)
+
+    async def describe(self, sobject: str, if_modified_since: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Describe an sObject; None when `if_modified_since` (an HTTP date) is given and nothing changed."""
+        headers = {"If-Modified-Since": if_modified_since} if if_modified_since else None
+        return await self._request("GET", self._data_path(f"sobjects/{sobject}/describe/"), headers=headers)
+
+    # ── Bulk API 2.0 query jobs ──
+    async def create_query_job(self, soql: str) -> Dict[str, Any]:
+        return await self._request("POST", self._data_path("jobs/query"),
+                                   json_body={"operation": "query", "query": soql})
+
+    async def query_job(self, job_id: str) -> Dict[str, Any]:
+        return await self._request("GET", self._data_path(f"jobs/query/{job_id}"))
+
+    async def abort_query_job(self, job_id: str) -> Dict[str, Any]:
+        return await self._request("PATCH", self._data_path(f"jobs/query/{job_id}"), json_body={"state": "Aborted"})
+
+    async def query_job_results(self, job_id: str, locator: Optional[str] = None,
+                                max_records: Optional[int] = None) -> Tuple[str, Optional[str]]:
+        """One CSV page (with its own header row) and the locator of the next page, None when done."""
+        params: Dict[str, Any] = {}
+        if locator:
+            params["locator"] = locator
+        if max_records:
+            params["maxRecords"] = max_records
+        r = await self._request("GET", self._data_path(f"jobs/query/{job_id}/results"), params=params,
+                                headers={"Accept": "text/csv"}, raw=True)
+        next_locator = r.headers.get("Sforce-Locator")
+        return r.text, (None if next_locator in (None, "", "null") else next_locator)
+
+    # ── Streaming API (CometD long polling, used for Change Data Capture) ──
+    async def cometd(self, messages: List[Dict[str, Any]], timeout: float = 130.0) -> List[Dict[str, Any]]:
+        """POST Bayeux messages; /meta/connect can be held open by the server for ~110 s."""
+        return await self._request("POST", f"/cometd/{self.version}", json_body=messages, timeout=timeout) or []
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
@@ -0,0 +1,117 @@
+# ─── sf_executor.py ────────────────────────────────────────────────────────
+import asyncio, contextlib, functools, os, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict
+
+SF_MAX_WORKERS = int(os.getenv("SF_MAX_WORKERS", "8"))
+# Salesforce counts long-running concurrent API requests per org; keep below that allowance
+SF_MAX_CONCURRENT = int(os.getenv("SF_MAX_CONCURRENT", "8"))
+SF_QUEUE_TIMEOUT = float(os.getenv("SF_QUEUE_TIMEOUT", "30"))   # max seconds a call waits for a slot
+
+
+class SalesforceExecutor:
+    """
+    Dedicated thread pool for blocking simple-salesforce calls, separate from the
+    loop's default executor. A semaphore admits at most `max_concurrent` calls;
+    the rest wait in FIFO order (up to `queue_timeout`) instead of hitting
+    Salesforce and failing with REQUEST_LIMIT_EXCEEDED. Native async calls go
+    through the same admission via `run_async`, so both client modes share one limit.
+    """
+    def __init__(self, max_workers: int = SF_MAX_WORKERS, max_concurrent: int = SF_MAX_CONCURRENT,
+                 queue_timeout: float = SF_QUEUE_TIMEOUT) -> None:
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sf")
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._queued = 0
+        self._in_flight = 0
+        self._counters: Dict[str, float] = {
+            "calls": 0, "rejected": 0, "max_queued": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+        }
+
+    def _give_back(self, acquire: asyncio.Future) -> None:
+        # an abandoned acquire() may still have won a permit: hand it back
+        if not acquire.cancelled() and acquire.exception() is None:
+            self._slots.release()
+
+    async def _acquire(self) -> None:
+        self._queued += 1
+        self._counters["max_queued"] = max(self._counters["max_queued"], self._queued)
+        started = time.perf_counter()
+        # not wait_for: it can cancel the wait after acquire() succeeded and leak the permit
+        acquire = asyncio.ensure_future(self._slots.acquire())
+        try:
+            await asyncio.wait((acquire,), timeout=self.queue_timeout)
+        except BaseException:
+            acquire.add_done_callback(self._give_back)
+            acquire.cancel()
+            raise
+        finally:
+            self._queued -= 1
+        if not acquire.done():
+            acquire.add_done_callback(self._give_back)
+            acquire.cancel()
+            self._counters["rejected"] += 1
+            raise RuntimeError(f"Salesforce request queue timeout after {self.queue_timeout:.0f}s "
+                               f"({self._queued} waiting)")
+
+        waited_ms = (time.perf_counter() - started) * 1000
+        self._counters["calls"] += 1
+        self._counters["wait_ms_total"] += waited_ms
+        self._counters["wait_ms_max"] = max(self._counters["wait_ms_max"], waited_ms)
+        self._in_flight += 1
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._slots.release()
+
+    @contextlib.asynccontextmanager
+    async def _admitted(self) -> AsyncIterator[None]:
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _finished(self, fut: asyncio.Future) -> None:
+        self._release()
+        if not fut.cancelled():
+            fut.exception()         # retrieved, even when the caller gave up on it
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Blocking fn(*args) on the pool, once admitted. The slot is held until the thread
+        finishes: a cancelled caller can't stop the call, so it still counts against the limit.
+        """
+        await self._acquire()
+        try:
+            fut = asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(fn, *args))
+        except BaseException:
+            self._release()
+            raise
+        fut.add_done_callback(self._finished)
+        return await asyncio.shield(fut)
+
+    async def run_async(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """await fn(*args) on the loop, once admitted (the coroutine isn't created until then)."""
+        async with self._admitted():
+            return await fn(*args)
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self._counters["calls"]
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "max_concurrent": self.max_concurrent,
+            "calls": int(calls),
+            "rejected": int(self._counters["rejected"]),
+            "max_queued": int(self._counters["max_queued"]),
+            "wait_ms_avg": round(self._counters["wait_ms_total"] / calls, 2) if calls else 0.0,
+            "wait_ms_max": round(self._counters["wait_ms_max"], 2),
+        }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+SF_EXECUTOR = SalesforceExecutor()
@@ -9,42 +9,102 @@ from fastapi import FastAPI, Request, BackgroundTasks, Response
 from fastapi.responses import StreamingResponse, JSONResponse
 import httpx
 from contextlib import asynccontextmanager
-from tools import REGISTERED_TOOLS, TOOL_FUNCS, tool
+from tools import REGISTERED_TOOLS, TOOL_FUNCS, tool, set_tool_description
 import json, base64
-from sf_tools import async_query_salesforce, get_sf_object_info
-from sse_bus import SESSIONS, sse_event, JSONRPC
+from sf_tools import (async_query_salesforce, describe_sf_object, query_salesforce_page, query_salesforce_next_page,
+                      aclose_salesforce, bulk_query_salesforce_csv, aggregate_salesforce, start_replica, start_mirror)
+from sse_bus import SESSIONS, DAPR, sse_event, JSONRPC, publish_progress, publish_tools_list_changed
+from soql_cache import SOQL_CACHE
+from sf_executor import SF_EXECUTOR
+from describe_cache import DESCRIBE_CACHE
+from schema_registry import SCHEMA_REGISTRY
+from replica import REPLICA, LocalEventSource
+from mirror import MIRROR, MIRROR_ENABLED
+from result_format import RESULT_FORMAT, format_query_result
 
 POD = socket.gethostname()
 REV = os.getenv("CONTAINER_APP_REVISION", "unknown")
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "120"))
+# how long startup waits for the schema index before serving; it finishes in the background
+SCHEMA_STARTUP_WAIT_SECONDS = float(os.getenv("SCHEMA_STARTUP_WAIT_SECONDS", "5"))
 
 
 
 # ───────────────── tools ─────────────────────────────────────
 @tool
 async def query_salesforce(soql: Annotated[str, "SOQL query"]) -> Annotated[dict, "query Result"]:
-    return await async_query_salesforce(soql)
+    return await query_salesforce_page(soql)
+
+@tool
+async def query_salesforce_more(cursor: Annotated[str, "cursor from a previous query result"]) -> Annotated[dict, "query Result"]:
+    """Fetch the next page of a query_salesforce result whose `done` is false, using its `cursor`."""
+    return await query_salesforce_next_page(cursor)
+
+@tool
+async def describe_object(object_name: Annotated[str, "sObject API name, e.g. Lead or Invoice__c"]) -> Annotated[str, "field list"]:
+    """List the queryable fields of a Salesforce object (name:type, lookups, picklist values) before writing SOQL for it."""
+    return await describe_sf_object(object_name)
+
+@tool
+async def bulk_query_salesforce(soql: Annotated[str, "SOQL query"], session_id: str = "") -> Annotated[str, "CSV result"]:
+    """Run a SOQL query as a Bulk API 2.0 job, for analytic questions over large record sets (returns CSV)."""
+    async def progress(job_id: str, processed: int, state: str) -> None:
+        # a running job reports no total, so the fraction only marks completion; the count rides alongside
+        done = 1.0 if state == "JobComplete" else 0.0
+        await publish_progress(session_id, f"bulk:{job_id}", done, {"processed": processed, "state": state})
+    return await bulk_query_salesforce_csv(soql, on_progress=progress if session_id else None)
+
+@tool
+async def aggregate_records(
+    sobject: Annotated[str, "sObject to aggregate, e.g. Opportunity"],
+    metrics: Annotated[str, "comma-separated count(), count(F), sum(F), avg(F), min(F), max(F)"] = "count()",
+    group_by: Annotated[str, "comma-separated fields to group by, e.g. StageName,Account.Industry"] = "",
+    where: Annotated[str, "optional SOQL WHERE condition"] = "",
+    top_k: Annotated[int, "keep only the top k groups (0 = all)"] = 0,
+    order_by: Annotated[str, "metric column to rank by, e.g. sum_Amount (default: first metric)"] = "",
+) -> Annotated[dict, "aggregate table"]:
+    """Totals, counts, averages, min/max and top-k per group, computed server-side; use instead of summing query rows yourself."""
+    return await aggregate_salesforce(sobject, group_by, metrics, where, top_k, order_by)
+
+# only advertised when there is a mirror to answer from
+if MIRROR_ENABLED:
+    @tool
+    async def query_local_mirror(soql: Annotated[str, "SOQL query over the mirrored objects"]) -> Annotated[dict, "query Result"]:
+        """Answer SOQL from the local SQLite mirror without Salesforce API calls (data as of `as_of`); common subset only."""
+        return await MIRROR.query(soql)
 
 # Lifespan event to fetch Salesforce object info
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global contact_info, account_info, opportunity_info
-    contact_info = await get_sf_object_info("Contact")
-    account_info = await get_sf_object_info("Account")
-    opportunity_info = await get_sf_object_info("Opportunity")
-    query_salesforce.__doc__ = f"""
-        The user input needs to be translated into a SOQL query for the below SalesForce entities:
-
-        - Contact
-            {contact_info}
-        - Account
-            {account_info}
-        - Opportunity
-            {opportunity_info}
-
-        Queries Salesforce using the provided SOQL query.
-        Example SOQL: "SELECT Id, FirstName, LastName, Email, Account.Name FROM Contact WHERE LastName = 'Doe'"
-        """
-    yield
+    # only the prompt objects are indexed up front (concurrently, from the on-disk
+    # describe cache when present); everything else loads on describe_object.
+    # A slow first login doesn't hold up /status: the description is refreshed when it lands
+    # and open sessions are told to re-fetch tools/list, so cached catalogs pick it up.
+    notices = set()
+    def refresh_description(_t=None) -> None:
+        if set_tool_description("query_salesforce", SCHEMA_REGISTRY.tool_description()):
+            task = asyncio.create_task(publish_tools_list_changed())
+            notices.add(task)
+            task.add_done_callback(notices.discard)
+
+    schema_load = asyncio.create_task(SCHEMA_REGISTRY.load())
+    schema_load.add_done_callback(refresh_description)
+    try:
+        await asyncio.wait_for(asyncio.shield(schema_load), timeout=SCHEMA_STARTUP_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"[startup] schema index still loading after {SCHEMA_STARTUP_WAIT_SECONDS:.0f}s", flush=True)
+    refresh_description()
+    app.state.replica_source = start_replica()
+    start_mirror()
+    try:
+        yield
+    finally:
+        # flush buffered Dapr notifications before shutdown
+        schema_load.cancel()
+        await REPLICA.stop()
+        await MIRROR.stop()
+        await DAPR.aclose()
+        await aclose_salesforce()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -72,7 +132,14 @@ async def call_tool(name: str, raw_args: dict, tasks: BackgroundTasks, session_i
 def _ensure_calltool_result(obj):
     if isinstance(obj, dict) and "content" in obj:
         return obj
-    return {"content": [{"type": "text", "text": str(obj)}]}
+    if RESULT_FORMAT == "csv" and isinstance(obj, dict) and "records" in obj:
+        # compact header + rows instead of the raw simple_salesforce dict
+        return {"content": [{"type": "text", "text": format_query_result(obj)}]}
+    result = {"content": [{"type": "text", "text": str(obj)}]}
+    # tool-level failures ({"error": …} dicts, "Error: …" strings) are flagged per MCP
+    if (isinstance(obj, dict) and "error" in obj) or (isinstance(obj, str) and obj.startswith("Error:")):
+        result["isError"] = True
+    return result
 
 def _normalize_session_id(raw: str | None, default: str = "default") -> str:
     if not raw:
@@ -92,26 +159,17 @@ async def mcp_sse(request: Request):
         # flush headers immediately (APIM/ACA friendly)
         yield "event: open\ndata: {}\n\n"
 
-        heartbeat_every = 120.0  # seconds
         while True:
             if await request.is_disconnected():
                 break
-            try:
-                # wait up to heartbeat interval for next message
-                #msg = await asyncio.wait_for(session.q.get(), timeout=heartbeat_every)
-                try:
-                    msg = session.q.get_nowait()
-                    print(f"[SSE YIELD] session={session_id} msg={msg}...", flush=True)
-                except asyncio.QueueEmpty:
-                    yield "event: heartbeat\ndata: {}\n\n"
-                    await asyncio.sleep(heartbeat_every)
-                    continue
-                print(f"[SSE YIELD] session={session_id} msg={msg}...", flush=True)
-                yield msg
-                #session.q.task_done()
-            except asyncio.TimeoutError:
-                # heartbeat (SSE comment doesn't disturb clients)
+            # block until a message is published or the heartbeat interval elapses
+            msg = await session.next_message(timeout=SSE_HEARTBEAT_SECONDS)
+            if msg is None:
+                # idle stream: heartbeat (SSE comment doesn't disturb clients)
                 yield ": ping\n\n"
+                continue
+            print(f"[SSE YIELD] session={session_id} msg={msg}...", flush=True)
+            yield msg
 
     return StreamingResponse(
         event_stream(),
@@ -127,6 +185,27 @@ async def mcp_sse(request: Request):
 async def status(request: Request):
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    return {"dapr": DAPR.stats, "soql_cache": SOQL_CACHE.stats(), "sf_executor": SF_EXECUTOR.stats(),
+            "describe_cache": DESCRIBE_CACHE.stats, "replica": REPLICA.stats(),
+            "mirror": MIRROR.stats()}
+
+# ───────────────── local change events (REPLICA_SOURCE=local) ────────────────
+@app.post("/replica/events")
+async def replica_event(request: Request):
+    source = getattr(request.app.state, "replica_source", None)
+    if not isinstance(source, LocalEventSource):
+        return JSONResponse({"error": "replica local event source is not enabled"}, status_code=404)
+    await source.publish(await request.json())
+    return {"accepted": True}
+
+# ───────────────── cache invalidation hook ──────────────────────────────────
+@app.post("/cache/invalidate/{sobject}")
+async def invalidate_cache(sobject: str):
+    dropped = SOQL_CACHE.invalidate(None if sobject == "*" else sobject)
+    return {"sobject": sobject, "dropped": dropped}
+
 # ───────────────── JSON-RPC handler ──────────────────────────────────────────
 @app.post("/mcp")
 async def mcp_post(req: Request, tasks: BackgroundTasks):
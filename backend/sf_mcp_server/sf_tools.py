@@ -1,11 +1,46 @@
 import json
-from simple_salesforce import Salesforce
+from simple_salesforce import Salesforce, SalesforceExpiredSession
 from dotenv import load_dotenv
 import os
+import time
+import uuid
 import asyncio
-from tabulate import tabulate
+import threading
+import csv
+import io
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from soql_cache import SOQL_CACHE, SOQL_CACHE_ENABLED
+from sf_executor import SF_EXECUTOR
+from sf_async_client import AsyncSalesforce, load_session, save_session
+from describe_cache import DESCRIBE_CACHE
+from schema_registry import SCHEMA_REGISTRY
+from result_format import RESULT_MAX_CHARS, flatten_record
+from soql_parser import validate_soql
+from replica import REPLICA, REPLICA_ENABLED, REPLICA_SOURCE, CometDSource, LocalEventSource
+from mirror import MIRROR, MIRROR_ENABLED
+from aggregate import (AGGREGATE_MAX_ROWS, aggregate_columns, aggregate_soql, normalize_aggregate_rows,
+                       parse_fields, parse_metrics, source_soql)
 load_dotenv()
 
+# "async": native httpx client, no threads; "threaded": simple-salesforce on SF_EXECUTOR.
+# Either way calls are admitted through SF_EXECUTOR's concurrency limit.
+SF_CLIENT = os.getenv("SF_CLIENT", "async").lower()
+
+# Page budget for what a single tool result hands to the model
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "200"))
+QUERY_MAX_BYTES = int(os.getenv("QUERY_MAX_BYTES", "16000"))
+# Salesforce keeps a query locator alive ~15 min; expire our cursors before that
+QUERY_CURSOR_TTL = float(os.getenv("QUERY_CURSOR_TTL", "600"))
+QUERY_MAX_CURSORS = int(os.getenv("QUERY_MAX_CURSORS", "1000"))
+# check field / relationship names against describes before sending model-written SOQL
+SOQL_VALIDATE = os.getenv("SOQL_VALIDATE", "true").lower() == "true"
+# Bulk API 2.0 query jobs: poll backoff, overall deadline, rows per results page
+BULK_POLL_INITIAL = float(os.getenv("BULK_POLL_INITIAL", "0.5"))
+BULK_POLL_MAX = float(os.getenv("BULK_POLL_MAX", "5"))
+BULK_TIMEOUT = float(os.getenv("BULK_TIMEOUT", "600"))
+BULK_PAGE_RECORDS = int(os.getenv("BULK_PAGE_RECORDS", "50000"))
+
 def login_with_user_pass_token() -> Salesforce:
     """
     Auth using username + password + security token via simple-salesforce.
@@ -21,14 +56,126 @@ def login_with_user_pass_token() -> Salesforce:
 
     return Salesforce(username=user, password=pwd, security_token=token, domain=domain)
 
-# assuming you already authenticated:
-sf = login_with_user_pass_token()   # or login_with_oauth_password_grant()
+def async_client_from_env() -> AsyncSalesforce:
+    """Same credentials as login_with_user_pass_token; nothing is checked or sent until the first call."""
+    return AsyncSalesforce(
+        username=os.getenv("SF_USERNAME"),
+        password=os.getenv("SF_PASSWORD"),
+        security_token=os.getenv("SF_SECURITY_TOKEN"),
+        domain=os.getenv("SF_DOMAIN", "login"),
+    )
+
+# No login at import: both clients authenticate on the first Salesforce call,
+# starting from the session cached by the previous process when there is one.
+async_sf = async_client_from_env() if SF_CLIENT != "threaded" else None
+sf: Salesforce | None = None
+_sf_lock = threading.Lock()
+
+def get_sf(stale_session: str | None = None) -> Salesforce:
+    """
+    Shared simple-salesforce login (threaded mode). Single-flight across executor
+    threads: callers that saw the same expired session trigger one re-login.
+    """
+    global sf
+    with _sf_lock:
+        if sf is not None and sf.session_id != stale_session:
+            return sf
+        user, domain = os.getenv("SF_USERNAME"), os.getenv("SF_DOMAIN", "login")
+        cached = load_session(user, domain) if stale_session is None else None
+        if cached is not None:
+            sf = Salesforce(instance_url=cached["instance_url"], session_id=cached["session_id"])
+        else:
+            sf = login_with_user_pass_token()
+            save_session(user, domain, sf.session_id, f"https://{sf.sf_instance}")
+        return sf
+
+# Bulk jobs and the change-event stream always use the async client; in threaded
+# mode they get their own (lazy) login.
+_side_sf: AsyncSalesforce | None = None
+
+def _async_client() -> AsyncSalesforce:
+    global _side_sf
+    if async_sf is not None:
+        return async_sf
+    if _side_sf is None:
+        _side_sf = async_client_from_env()
+    return _side_sf
+
+# requests.Session isn't thread-safe: each executor thread gets its own client on the same login
+_local = threading.local()
+
+def _thread_sf() -> Salesforce:
+    shared = get_sf()
+    client = getattr(_local, "sf", None)
+    if client is None or client.session_id != shared.session_id:
+        client = Salesforce(instance_url=f"https://{shared.sf_instance}", session_id=shared.session_id,
+                            version=shared.sf_version)
+        _local.sf = client
+    return client
+
+def _call_with_refresh(fn, *args):
+    client = _thread_sf()
+    try:
+        return fn(client, *args)
+    except SalesforceExpiredSession:
+        get_sf(stale_session=client.session_id)
+        return fn(_thread_sf(), *args)
+
+async def _sf_call(fn, *args):
+    """Run fn(<this thread's Salesforce client>, *args) on the Salesforce executor."""
+    return await SF_EXECUTOR.run(_call_with_refresh, fn, *args)
+
+async def _sf_query(soql: str):
+    if async_sf is not None:
+        return await SF_EXECUTOR.run_async(async_sf.query, soql)
+    return await _sf_call(Salesforce.query, soql)
+
+async def _sf_query_more(next_url: str):
+    if async_sf is not None:
+        return await SF_EXECUTOR.run_async(async_sf.query_more, next_url, True)
+    return await _sf_call(Salesforce.query_more, next_url, True)
+
+async def _sf_describe(object_name: str, if_modified_since: str | None = None):
+    if async_sf is not None:
+        return await SF_EXECUTOR.run_async(async_sf.describe, object_name, if_modified_since)
+    # simple-salesforce raises on 304, so the threaded client always does a full describe
+    return await _sf_call(lambda c: getattr(c, object_name).describe())
+
+SCHEMA_REGISTRY.bind(_sf_describe)
+
+async def describe_sf_object(object_name: str) -> str:
+    """Compact field list of one configured object, for the describe_object tool."""
+    name = SCHEMA_REGISTRY.resolve(object_name)
+    if name is None:
+        return f"Error: unknown object {object_name!r}; configured objects: {', '.join(SCHEMA_REGISTRY.objects)}"
+    try:
+        return await SCHEMA_REGISTRY.render(name)
+    except Exception as e:
+        print(f"Error describing Salesforce object {name}: {e}")
+        return f"Error: {e}"
+
+async def aclose_salesforce() -> None:
+    if async_sf is not None:
+        await async_sf.aclose()
+    if _side_sf is not None:
+        await _side_sf.aclose()
+    SF_EXECUTOR.shutdown()
 
 
 async def async_query_salesforce(soql: str):
+    if REPLICA_ENABLED:
+        local = REPLICA.try_query(soql)
+        if local is not None:
+            return local
+    if SOQL_CACHE_ENABLED:
+        return await SOQL_CACHE.get_or_fetch(soql, _query_salesforce_live)
+    return await _query_salesforce_live(soql)
+
+
+async def _query_salesforce_live(soql: str):
     try:
         #results = await sf.query(soql)
-        results = await asyncio.to_thread(sf.query, soql)
+        results = await _sf_query(soql)
         return results
     except Exception as e:
         print(f"Error querying Salesforce: {e}")
@@ -36,76 +183,277 @@ async def async_query_salesforce(soql: str):
 
 
 
-# Query contacts where LastName = 'Doe'
-#results = sf.query("SELECT Id, FirstName, LastName, Email, Account.Name FROM Contact WHERE LastName = 'Doe'")
+async def stream_query_salesforce(soql: str, max_rows: int | None = None, max_bytes: int | None = None):
+    """
+    Yield record batches as Salesforce returns them, following nextRecordsUrl
+    (queryMore) instead of loading everything like sf.query_all. Stops once
+    `max_rows` records or ~`max_bytes` of JSON have been yielded.
+    """
+    rows = size = 0
+    result = await _sf_query(soql)
+    while True:
+        batch = []
+        for rec in result.get("records", []):
+            rec_size = len(json.dumps(rec, default=str))
+            if (max_rows is not None and rows >= max_rows) or (max_bytes is not None and size + rec_size > max_bytes):
+                if batch:
+                    yield batch
+                return
+            batch.append(rec)
+            rows += 1
+            size += rec_size
+        if batch:
+            yield batch
+        next_url = result.get("nextRecordsUrl")
+        if result.get("done", True) or not next_url:
+            return
+        result = await _sf_query_more(next_url)
+
+
+# cursor id -> (expires_at, leftover records, nextRecordsUrl, totalSize)
+_CURSORS: "OrderedDict[str, tuple[float, list, str | None, int]]" = OrderedDict()
+
+def _register_cursor(leftover: list, next_url: str | None, total: int) -> str | None:
+    if not leftover and not next_url:
+        return None
+    now = time.monotonic()
+    while _CURSORS and (len(_CURSORS) >= QUERY_MAX_CURSORS or next(iter(_CURSORS.values()))[0] < now):
+        _CURSORS.popitem(last=False)
+    cursor = uuid.uuid4().hex
+    _CURSORS[cursor] = (now + QUERY_CURSOR_TTL, leftover, next_url, total)
+    return cursor
 
-async def get_sf_object_info(object_name: str):
+def _page(records: list, next_url: str | None, total: int, max_rows: int, max_bytes: int) -> dict:
+    """Cut `records` to the row/byte budget; anything left over goes behind a cursor."""
+    size, cut = 0, len(records)
+    for i, rec in enumerate(records):
+        size += len(json.dumps(rec, default=str))
+        if i >= max_rows or (size > max_bytes and i > 0):
+            cut = i
+            break
+    page, leftover = records[:cut], records[cut:]
+    cursor = _register_cursor(leftover, next_url, total)
+    return {
+        "totalSize": total,
+        "returned": len(page),
+        "done": cursor is None,
+        "cursor": cursor,
+        "records": page,
+    }
+
+
+async def check_soql(soql: str) -> dict:
+    """Local validation result for `soql` (see soql_parser.validate_soql)."""
+    return await validate_soql(soql, lambda name: DESCRIBE_CACHE.get(name, _sf_describe), SCHEMA_REGISTRY.objects)
+
+async def query_salesforce_page(soql: str, max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES) -> dict:
+    """First page of a query, truncated to the budget, plus a continuation cursor when more rows exist."""
+    if SOQL_VALIDATE:
+        checked = await check_soql(soql)
+        if checked["errors"]:
+            return {"error": "Invalid SOQL (checked locally, not sent): " + " ".join(checked["errors"])}
+        # normalized text: equivalent spellings share one cache entry
+        soql = checked["normalized"]
+    results = await async_query_salesforce(soql)
+    if not isinstance(results, dict) or "error" in results:
+        return results
+    records = list(results.get("records", []))
+    next_url = None if results.get("done", True) else results.get("nextRecordsUrl")
+    return _page(records, next_url, results.get("totalSize", len(records)), max_rows, max_bytes)
+
+
+async def query_salesforce_next_page(cursor: str, max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_BYTES) -> dict:
+    """Next page for a cursor returned by query_salesforce_page."""
+    entry = _CURSORS.pop(cursor, None)
+    if entry is None or entry[0] < time.monotonic():
+        return {"error": "Unknown or expired cursor; re-run the query."}
+    _, records, next_url, total = entry
+    if not records and next_url:
+        try:
+            more = await _sf_query_more(next_url)
+        except Exception as e:
+            print(f"Error fetching more Salesforce records: {e}")
+            return {"error": str(e)}
+        records = list(more.get("records", []))
+        next_url = None if more.get("done", True) else more.get("nextRecordsUrl")
+    return _page(records, next_url, total, max_rows, max_bytes)
+
+
+# ── Bulk API 2.0 ──────────────────────────────────────────────────────────
+# on_progress(job_id, records processed so far, job state)
+BulkProgress = Callable[[str, int, str], Awaitable[None]]
+
+async def run_bulk_query(soql: str, on_progress: BulkProgress | None = None) -> dict:
+    """
+    Submit a Bulk API 2.0 query job and poll it (exponential backoff) until it completes.
+    Returns the final job info. On any failure (timeout, cancellation, a polling or
+    progress error) a job that isn't finished yet is aborted, so it stops using the org's bulk limits.
+    """
+    client = _async_client()
+    job = await SF_EXECUTOR.run_async(client.create_query_job, soql)
+    job_id = job["id"]
+    deadline = time.monotonic() + BULK_TIMEOUT
+    delay, last, state = BULK_POLL_INITIAL, None, job.get("state")
     try:
-        desc = await asyncio.to_thread(sf.__getattr__(object_name).describe)
-        desc = sf.Contact.describe()
-        fields = desc["fields"]
-
-        # System/readonly fields to always skip (extend as you like)
-        SKIP_NAMES = {
-            "IsDeleted","MasterRecordId","CreatedDate","CreatedById","LastModifiedDate",
-            "LastModifiedById","SystemModstamp","LastActivityDate","LastViewedDate",
-            "LastReferencedDate","PhotoUrl","IsEmailBounced","LastCURequestDate","LastCUUpdateDate",
-            "Jigsaw","JigsawContactId","Name"  # "Name" on Contact is a calculated Full Name
-        }
-        # Field types to skip for CSV/data loads (compound/derived)
-        SKIP_TYPES = {"address","location","anyType"}
-
-        def is_useful_for_insert(f):
-            # keep only createable, non-deprecated, not compound/systemy
-            if not f.get("createable", False):
-                return False
-            if f.get("deprecatedAndHidden", False):
-                return False
-            if f["name"] in SKIP_NAMES:
-                return False
-            if f["type"] in SKIP_TYPES:
-                return False
-            return True
-
-        useful = [
-            {
-                #"Id": f["id"],
-                "name": f["name"],
-                "label": f["label"],
-                "type": f["type"],
-            #    "length": f.get("length"),
-            #    "required": not f.get("nillable", True),
-            #    "updateable": f.get("updateable", False),
-            #    "custom": f.get("custom", False),
-            }
-            for f in fields
-            if is_useful_for_insert(f)
-        ]
-
-        return tabulate(useful)
-        #try:
-        #    from tabulate import tabulate  # pip install tabulate
-        #    print(tabulate(
-        #        useful,
-        #        headers={"name":"name","label":"label","type":"type","length":"length","required":"required","updateable":"updateable","custom":"custom"},
-        #        tablefmt="github"
-        #    ))
-        #    return useful
-        #except Exception:
-        #    for f in useful:
-        #        print(f)
-        #    return useful
+        while True:
+            info = await SF_EXECUTOR.run_async(client.query_job, job_id)
+            state, processed = info.get("state"), int(info.get("numberRecordsProcessed") or 0)
+            if on_progress is not None and (processed, state) != last:
+                last = (processed, state)
+                await on_progress(job_id, processed, state)
+            if state == "JobComplete":
+                return info
+            if state in ("Failed", "Aborted"):
+                raise RuntimeError(f"Bulk query job {job_id} {state.lower()}: {info.get('errorMessage')}")
+            if time.monotonic() + delay > deadline:
+                raise TimeoutError(f"Bulk query job {job_id} not complete after {BULK_TIMEOUT:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, BULK_POLL_MAX)
+    except BaseException:
+        if state in ("JobComplete", "Failed", "Aborted"):
+            raise
+        try:
+            await client.abort_query_job(job_id)
+        except Exception as e:
+            print(f"Error aborting bulk query job {job_id}: {e}")
+        raise
+
+async def stream_bulk_query(soql: str, on_progress: BulkProgress | None = None,
+                            page_records: int = BULK_PAGE_RECORDS):
+    """
+    Run `soql` as a bulk job and yield its result as CSV rows (lists of str),
+    header first, fetching one results page at a time.
+    """
+    info = await run_bulk_query(soql, on_progress)
+    client = _async_client()
+    locator, first = None, True
+    while True:
+        text, locator = await SF_EXECUTOR.run_async(client.query_job_results, info["id"], locator, page_records)
+        rows = csv.reader(io.StringIO(text))
+        header = next(rows, None)
+        if first and header is not None:
+            yield header
+            first = False
+        for row in rows:
+            yield row
+        if locator is None:
+            return
+
+async def bulk_query_salesforce_csv(soql: str, on_progress: BulkProgress | None = None,
+                                    max_chars: int = RESULT_MAX_CHARS) -> str:
+    """Bulk query result as a summary line plus CSV, cut to `max_chars`; later pages aren't downloaded."""
+    job: dict = {}
+
+    async def track(job_id: str, processed: int, state: str) -> None:
+        job.update(id=job_id, processed=processed)
+        if on_progress is not None:
+            await on_progress(job_id, processed, state)
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    written, truncated = -1, False
+    stream = stream_bulk_query(soql, track)
+    try:
+        async for row in stream:
+            mark = buf.tell()
+            writer.writerow(row)
+            if buf.tell() > max_chars and written > 0:
+                buf.seek(mark)
+                buf.truncate()
+                truncated = True
+                break
+            written += 1
     except Exception as e:
-        print(f"Error retrieving Salesforce object info: {e}")
+        print(f"Error running Salesforce bulk query: {e}")
+        return f"Error: {e}"
+    finally:
+        await stream.aclose()
+
+    meta = [f"job={job.get('id')}", f"totalSize={job.get('processed', 0)}", f"rows={max(written, 0)}",
+            f"done={'false' if truncated else 'true'}"]
+    lines = [" ".join(meta), buf.getvalue().rstrip("\n")]
+    if truncated:
+        lines.append(f"[rows beyond the {max_chars}-char budget omitted; aggregate in SOQL to see all records]")
+    return "\n".join(lines)
+
+# ── CDC replica ───────────────────────────────────────────────────────────
+async def _replica_fields(object_name: str) -> list[str]:
+    return [f["name"] for f in await SCHEMA_REGISTRY.index(object_name)]
+
+async def _replica_fetch_all(soql: str, max_rows: int) -> list:
+    records: list = []
+    async for batch in stream_query_salesforce(soql, max_rows=max_rows):
+        records.extend(batch)
+    return records
+
+def start_replica():
+    """Start the change-event replica when REPLICA_ENABLED; returns the event source (or None)."""
+    if not REPLICA_ENABLED:
+        return None
+    source = LocalEventSource() if REPLICA_SOURCE == "local" else CometDSource(_async_client())
+    REPLICA.start(source, _replica_fields, _replica_fetch_all)
+    return source
+
+# ── SQLite mirror ─────────────────────────────────────────────────────────
+# the sync job calls the async client directly (queryAll, so deletes show up),
+# paced by the mirror's own rate budget rather than SF_EXECUTOR's
+async def _mirror_fetch(soql: str):
+    return await _async_client().query(soql, include_deleted=True)
+
+async def _mirror_fetch_more(next_url: str):
+    return await _async_client().query_more(next_url, identifier_is_url=True)
+
+def start_mirror() -> None:
+    """Start the incremental SQLite mirror sync when MIRROR_ENABLED."""
+    if MIRROR_ENABLED:
+        MIRROR.start(SCHEMA_REGISTRY.index, _mirror_fetch, _mirror_fetch_more)
+
+
+# ── aggregation ───────────────────────────────────────────────────────────
+async def aggregate_salesforce(sobject: str, group_by: str = "", metrics: str = "count()", where: str = "",
+                               top_k: int = 0, order_by: str = "") -> dict:
+    """
+    Group-by / count / sum / avg / min / max (and top-k) over `sobject`.
+    Tries a SOQL GROUP BY first; if Salesforce rejects it or the result is
+    incomplete, scans up to AGGREGATE_MAX_ROWS rows and aggregates locally.
+    """
+    try:
+        top_k = int(top_k or 0)
+        groups = parse_fields(group_by)
+        parsed = parse_metrics(metrics)
+        if not parse_fields(sobject) or "." in sobject:
+            raise ValueError(f"invalid object name {sobject!r}")
+    except ValueError as e:
         return {"error": str(e)}
+    aliases = {alias for _, _, alias in parsed}
+    order = order_by or (parsed[0][2] if top_k else "")
+    if order and order not in aliases:
+        return {"error": f"order_by must be one of: {', '.join(sorted(aliases))}"}
+
+    pushed = await async_query_salesforce(aggregate_soql(sobject, groups, parsed, where, order or None, top_k))
+    if isinstance(pushed, dict) and "error" not in pushed and pushed.get("done", True):
+        rows = normalize_aggregate_rows(pushed.get("records", []), groups, parsed)
+        return {"totalSize": len(rows), "done": True, "source": "soql", "records": rows}
+    print(f"Aggregate pushdown failed, aggregating locally: {pushed.get('error') if isinstance(pushed, dict) else pushed}")
 
+    rows: list = []
+    try:
+        async for batch in stream_query_salesforce(source_soql(sobject, groups, parsed, where),
+                                                   max_rows=AGGREGATE_MAX_ROWS + 1):
+            rows.extend(flatten_record(r) for r in batch)
+    except Exception as e:
+        print(f"Error querying Salesforce: {e}")
+        return {"error": str(e)}
+    scanned = min(len(rows), AGGREGATE_MAX_ROWS)
+    result = aggregate_columns(rows[:AGGREGATE_MAX_ROWS], groups, parsed, order or None, top_k)
+    # done=false: more rows matched than were scanned, so the aggregates are partial
+    return {"totalSize": len(result), "done": len(rows) <= AGGREGATE_MAX_ROWS, "source": "local",
+            "scanned": scanned, "records": result}
 
-#useful = asyncio.run(get_sf_object_info("Opportunity"))
 
-#print(tabulate(useful))
+# Query contacts where LastName = 'Doe'
+#results = sf.query("SELECT Id, FirstName, LastName, Email, Account.Name FROM Contact WHERE LastName = 'Doe'")
 
-#for uf in useful_fields:
-#    print(uf)
 
 #contact_schema = sf.Contact.describe()
 #account_schema = sf.Account.describe()
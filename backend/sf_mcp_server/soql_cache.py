@@ -0,0 +1,168 @@
+# ─── soql_cache.py ─────────────────────────────────────────────────────────
+import asyncio, os, re, time
+from collections import OrderedDict, defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+SOQL_CACHE_ENABLED = os.getenv("SOQL_CACHE_ENABLED", "true").lower() == "true"
+SOQL_CACHE_TTL = float(os.getenv("SOQL_CACHE_TTL", "120"))                  # default seconds per entry
+SOQL_CACHE_MAX_ENTRIES = int(os.getenv("SOQL_CACHE_MAX_ENTRIES", "500"))
+SOQL_CACHE_MAX_RECORDS = int(os.getenv("SOQL_CACHE_MAX_RECORDS", "50000"))  # total rows held across entries
+# per-sObject overrides, e.g. "Opportunity=60,Account=600"
+SOQL_CACHE_TTLS = {
+    k.strip().lower(): float(v)
+    for k, v in (item.split("=", 1) for item in os.getenv("SOQL_CACHE_TTLS", "").split(",") if "=" in item)
+}
+
+_FROM_RE = re.compile(r"\bfrom\s+([A-Za-z_][\w]*)", re.IGNORECASE)
+_DOTTED_RE = re.compile(r"\b([A-Za-z_]\w*)\.[A-Za-z_]\w*")
+_TOKEN_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\s+|[^'\s]+")
+
+
+def normalize_soql(soql: str) -> str:
+    """Collapse whitespace outside string literals and drop a trailing ';'."""
+    parts = []
+    for tok in _TOKEN_RE.findall(soql.strip().rstrip(";").strip()):
+        parts.append(" " if tok.isspace() else tok)
+    return "".join(parts)
+
+
+def soql_objects(soql: str) -> Tuple[str, Set[str]]:
+    """(primary sObject, every object/relationship name the result depends on), lower-cased."""
+    froms = [m.lower() for m in _FROM_RE.findall(soql)]
+    # the outermost FROM is the last one once subqueries "(SELECT … FROM Contacts)" are skipped
+    outer = re.sub(r"\([^()]*\)", "", soql)
+    primary = (_FROM_RE.findall(outer) or froms or ["unknown"])[-1].lower()
+    deps = set(froms) | {m.lower() for m in _DOTTED_RE.findall(soql)}
+    deps.add(primary)
+    return primary, deps
+
+
+class _LeaderCancelled(Exception):
+    """The request fetching a coalesced query was cancelled before it finished."""
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "sobject", "deps", "records")
+
+    def __init__(self, value: Any, expires: float, sobject: str, deps: Set[str], records: int) -> None:
+        self.value = value
+        self.expires = expires
+        self.sobject = sobject
+        self.deps = deps
+        self.records = records
+
+
+class SoqlCache:
+    """
+    Async TTL + LRU cache for SOQL results.
+    - keyed on normalized SOQL; TTL chosen by the query's primary sObject
+    - bounded by entry count and by total cached records
+    - concurrent identical queries share one in-flight call
+    - `invalidate(sobject)` drops every entry that reads that object, and a fetch that
+      was in flight at the time isn't stored
+    """
+    def __init__(self, default_ttl: float = SOQL_CACHE_TTL, ttls: Optional[Dict[str, float]] = None,
+                 max_entries: int = SOQL_CACHE_MAX_ENTRIES, max_records: int = SOQL_CACHE_MAX_RECORDS) -> None:
+        self.default_ttl = default_ttl
+        self.ttls = ttls if ttls is not None else SOQL_CACHE_TTLS
+        self.max_entries = max_entries
+        self.max_records = max_records
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._records = 0
+        # bumped by invalidate(); a fetch whose dependencies' generations moved isn't stored
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._counters: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0, "invalidations": 0})
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._records -= entry.records
+
+    def _generation(self, deps: Set[str]) -> int:
+        return self._epoch + sum(self._generations.get(d, 0) for d in deps)
+
+    def _store(self, key: str, value: Any, sobject: str, deps: Set[str]) -> None:
+        records = len(value.get("records", [])) if isinstance(value, dict) else 0
+        if records > self.max_records:
+            return
+        self._drop(key)
+        ttl = self.ttls.get(sobject, self.default_ttl)
+        self._entries[key] = _Entry(value, time.monotonic() + ttl, sobject, deps, records)
+        self._records += records
+        while self._entries and (len(self._entries) > self.max_entries or self._records > self.max_records):
+            self._drop(next(iter(self._entries)))
+
+    async def get_or_fetch(self, soql: str, fetch: Callable[[str], Awaitable[Any]]) -> Any:
+        key = normalize_soql(soql)
+        sobject, deps = soql_objects(key)
+        counters = self._counters[sobject]
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                counters["hits"] += 1
+                return entry.value
+            self._drop(key)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except _LeaderCancelled:
+                # the caller that was fetching went away: the first waiter to wake takes over
+                return await self.get_or_fetch(soql, fetch)
+
+        counters["misses"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        generation = self._generation(deps)
+        try:
+            value = await fetch(soql)
+        except asyncio.CancelledError:
+            # waiters must not see the leader's own cancellation as theirs
+            fut.set_exception(_LeaderCancelled())
+            fut.exception()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # mark retrieved so an unobserved failure doesn't log "exception never retrieved"
+            fut.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+        fut.set_result(value)
+        # error dicts from async_query_salesforce are never cached, nor results
+        # fetched across an invalidate() of something they read
+        if not (isinstance(value, dict) and "error" in value) and self._generation(deps) == generation:
+            self._store(key, value, sobject, deps)
+        return value
+
+    def invalidate(self, sobject: Optional[str] = None) -> int:
+        """Drop entries depending on `sobject` (all entries when None); returns how many."""
+        if sobject is None:
+            self._epoch += 1
+            keys = list(self._entries)
+        else:
+            name = sobject.lower()
+            self._generations[name] = self._generations.get(name, 0) + 1
+            keys = [k for k, e in self._entries.items() if name in e.deps]
+            self._counters[name]["invalidations"] += 1
+        for k in keys:
+            self._drop(k)
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "records": self._records,
+            "inflight": len(self._inflight),
+            "objects": {k: dict(v) for k, v in self._counters.items()},
+        }
+
+
+SOQL_CACHE = SoqlCache()
@@ -0,0 +1,349 @@
+# ─── soql_parser.py ────────────────────────────────────────────────────────
+"""
+Local SOQL checks before the network round trip.
+
+`parse` reads enough SOQL structure to find every field path, relationship
+and child-relationship subquery; `validate_soql` resolves them against
+describe metadata and returns precise errors with "did you mean" hints,
+plus a normalized query (keywords upper-cased, canonical field case,
+single spacing) that is stable enough to use as a cache key.
+Anything the parser doesn't understand is passed through unvalidated:
+a false "invalid" would be worse than a live error.
+"""
+import difflib, re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'(?:[^'\\]|\\.)*')
+  | (?P<num>[+-]?\d[\w:.+\-]*                                    # numbers, dates, datetimes,
+           | [A-Z]{3}\d[\d.]*(?![\w.]))                               # and currency amounts (USD5000)
+  | (?P<ident>[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*(?::\d+)?)          # names, paths, LAST_N_DAYS:30
+  | (?P<op>!=|<>|<=|>=|=|<|>)
+  | (?P<punct>[(),])
+  | (?P<bind>:\w+)
+""", re.VERBOSE)
+
+KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "LIKE", "INCLUDES", "EXCLUDES", "NULL", "TRUE",
+    "FALSE", "GROUP", "BY", "HAVING", "ORDER", "ASC", "DESC", "NULLS", "FIRST", "LAST", "LIMIT", "OFFSET",
+    "FOR", "VIEW", "UPDATE", "REFERENCE", "WITH", "TYPEOF", "WHEN", "THEN", "ELSE", "END", "USING",
+    "SCOPE", "ROLLUP", "CUBE", "ALL", "ROWS",
+}
+_FIELDS_ARGS = {"ALL", "STANDARD", "CUSTOM"}                       # FIELDS(STANDARD) etc.
+_CLAUSES = {"WHERE", "WITH", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "FOR", "USING"}
+_DATE_LITERAL_RE = re.compile(r"^(TODAY|YESTERDAY|TOMORROW|(LAST|THIS|NEXT)_\w+|N_\w+)(:\d+)?$", re.IGNORECASE)
+
+Describe = Callable[[str], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class SoqlSyntaxError(ValueError):
+    pass
+
+
+class Token:
+    __slots__ = ("kind", "text")
+
+    def __init__(self, kind: str, text: str) -> None:
+        self.kind = kind
+        self.text = text
+
+    @property
+    def upper(self) -> str:
+        return self.text.upper()
+
+
+def tokenize(soql: str) -> List[Token]:
+    toks, pos = [], 0
+    text = soql.strip().rstrip(";")
+    while pos < len(text):
+        m = _TOKEN_RE.match(text, pos)
+        if not m:
+            raise SoqlSyntaxError(f"unexpected character {text[pos]!r} at {pos}")
+        if m.lastgroup != "ws":
+            toks.append(Token(m.lastgroup, m.group()))
+        pos = m.end()
+    return toks
+
+
+class Query:
+    """One SELECT: its object, field references (token indexes) and nested queries."""
+    def __init__(self, kind: str) -> None:
+        self.kind = kind                    # top | child (FROM <child relationship>) | semi (WHERE … IN (SELECT …))
+        self.obj_index: Optional[int] = None
+        self.alias: Optional[str] = None
+        self.refs: List[int] = []
+        self.aliases: Set[str] = set()      # aggregate aliases usable in HAVING / ORDER BY
+        self.subqueries: List["Query"] = []
+        self.partial = False                # contains syntax (TYPEOF) we don't check
+
+
+class _Parser:
+    def __init__(self, toks: List[Token]) -> None:
+        self.toks = toks
+        self.keyword_at: Set[int] = set()
+
+    def _is(self, i: int, word: str) -> bool:
+        return i < len(self.toks) and self.toks[i].kind == "ident" and self.toks[i].upper == word
+
+    def _kw(self, i: int) -> None:
+        self.keyword_at.add(i)
+
+    def _expect(self, i: int, word: str) -> int:
+        if not self._is(i, word):
+            got = self.toks[i].text if i < len(self.toks) else "end of query"
+            raise SoqlSyntaxError(f"expected {word}, got {got}")
+        self._kw(i)
+        return i + 1
+
+    def _plain_ident(self, i: int) -> bool:
+        t = self.toks[i]
+        date_literal = "." not in t.text and "__" not in t.text and _DATE_LITERAL_RE.match(t.text)
+        return (t.kind == "ident" and t.upper not in KEYWORDS and not date_literal
+                and not (i + 1 < len(self.toks) and self.toks[i + 1].text == "("))
+
+    def query(self, i: int, kind: str) -> Tuple[Query, int]:
+        q = Query(kind)
+        i = self._expect(i, "SELECT")
+        i = self._select_list(i, q)
+        i = self._expect(i, "FROM")
+        if i >= len(self.toks) or self.toks[i].kind != "ident":
+            raise SoqlSyntaxError("expected an object name after FROM")
+        q.obj_index = i
+        i += 1
+        if i < len(self.toks) and self.toks[i].kind == "ident" and self.toks[i].upper not in KEYWORDS:
+            q.alias = self.toks[i].text
+            i += 1
+        while i < len(self.toks) and self.toks[i].text != ")":
+            word = self.toks[i].upper
+            if word not in _CLAUSES:
+                raise SoqlSyntaxError(f"unexpected {self.toks[i].text}")
+            self._kw(i)
+            if word in ("GROUP", "ORDER"):
+                i = self._expect(i + 1, "BY")
+                i = self._scan(i, q, subqueries=False)
+            elif word in ("WHERE", "HAVING"):
+                i = self._scan(i + 1, q, subqueries=True)
+            elif word in ("WITH", "USING", "FOR"):
+                # WITH SECURITY_ENFORCED / DATA CATEGORY …, USING SCOPE x, FOR VIEW: no field references
+                i += 1
+                while i < len(self.toks) and self.toks[i].upper not in _CLAUSES and self.toks[i].text != ")":
+                    if self.toks[i].upper in KEYWORDS:
+                        self._kw(i)
+                    i += 1
+            else:                                       # LIMIT n / OFFSET n
+                i += 2
+        return q, i
+
+    def _select_list(self, i: int, q: Query) -> int:
+        while True:
+            if i >= len(self.toks):
+                raise SoqlSyntaxError("expected FROM")
+            t = self.toks[i]
+            if t.text == "(" and self._is(i + 1, "SELECT"):
+                sub, i = self.query(i + 1, "child")
+                q.subqueries.append(sub)
+                if i >= len(self.toks) or self.toks[i].text != ")":
+                    raise SoqlSyntaxError("unclosed subquery")
+                i += 1
+            elif self._is(i, "TYPEOF"):
+                q.partial = True
+                while i < len(self.toks) and not self._is(i, "END"):
+                    i += 1
+                i += 1
+            elif t.kind == "ident" and i + 1 < len(self.toks) and self.toks[i + 1].text == "(":
+                i = self._function(i, q)
+                if i < len(self.toks) and self.toks[i].kind == "ident" and self.toks[i].upper not in KEYWORDS:
+                    q.aliases.add(self.toks[i].text.lower())
+                    i += 1
+            elif t.kind == "ident":
+                q.refs.append(i)
+                i += 1
+            else:
+                raise SoqlSyntaxError(f"unexpected {t.text} in SELECT list")
+            if i < len(self.toks) and self.toks[i].text == ",":
+                i += 1
+                continue
+            return i
+
+    def _function(self, i: int, q: Query) -> int:
+        """FUNC( … ): references inside, possibly nested functions; returns the index after ')'."""
+        fields = self.toks[i].upper == "FIELDS"
+        depth, i = 0, i + 1
+        while i < len(self.toks):
+            t = self.toks[i]
+            if fields and t.kind == "ident" and t.upper in _FIELDS_ARGS:
+                # FIELDS(ALL | STANDARD | CUSTOM) names a field group, not a column
+                self._kw(i)
+            elif t.text == "(":
+                depth += 1
+            elif t.text == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            elif t.kind == "ident" and self._plain_ident(i):
+                q.refs.append(i)
+            elif t.kind == "ident" and t.upper in KEYWORDS:
+                self._kw(i)
+            i += 1
+        raise SoqlSyntaxError("unclosed parenthesis")
+
+    def _scan(self, i: int, q: Query, subqueries: bool) -> int:
+        """References in a WHERE / HAVING / GROUP BY / ORDER BY clause, up to the next clause."""
+        depth = 0
+        while i < len(self.toks):
+            t = self.toks[i]
+            if depth == 0 and (t.text == ")" or (t.kind == "ident" and t.upper in _CLAUSES)):
+                return i
+            if t.text == "(" and subqueries and self._is(i + 1, "SELECT"):
+                sub, i = self.query(i + 1, "semi")
+                q.subqueries.append(sub)
+                if i >= len(self.toks) or self.toks[i].text != ")":
+                    raise SoqlSyntaxError("unclosed subquery")
+                i += 1
+                continue
+            if t.text == "(":
+                depth += 1
+            elif t.text == ")":
+                depth -= 1
+            elif t.kind == "ident":
+                if t.upper in KEYWORDS:
+                    self._kw(i)
+                elif self._plain_ident(i):
+                    q.refs.append(i)
+            i += 1
+        return i
+
+
+def parse(soql: str) -> Tuple[List[Token], Query, Set[int]]:
+    toks = tokenize(soql)
+    p = _Parser(toks)
+    q, i = p.query(0, "top")
+    if i != len(toks):
+        raise SoqlSyntaxError(f"unexpected {toks[i].text}")
+    return toks, q, p.keyword_at
+
+
+def render(toks: List[Token], keyword_at: Set[int], replace: Optional[Dict[int, str]] = None) -> str:
+    """Tokens back to text: upper-case keywords, canonical names, one space, none inside parentheses."""
+    replace = replace or {}
+    out: List[str] = []
+    for i, t in enumerate(toks):
+        text = replace.get(i, t.upper if i in keyword_at else t.text)
+        call = t.text == "(" and i > 0 and toks[i - 1].kind == "ident" and i - 1 not in keyword_at
+        if out and not (t.text in (")", ",") or out[-1] == "(" or call):
+            out.append(" ")
+        out.append(text)
+    return "".join(out)
+
+
+def _suggest(name: str, candidates: List[str]) -> str:
+    lowered = {c.lower(): c for c in candidates}
+    close = difflib.get_close_matches(name.lower(), list(lowered), n=3, cutoff=0.6)
+    return f" Did you mean: {', '.join(lowered[c] for c in close)}?" if close else ""
+
+
+class _Validator:
+    def __init__(self, toks: List[Token], describe: Describe, known_objects: List[str]) -> None:
+        self.toks = toks
+        self.describe = describe
+        self.known_objects = known_objects
+        self.errors: List[str] = []
+        self.replace: Dict[int, str] = {}
+
+    async def _desc(self, name: str, report_missing: bool = False) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.describe(name)
+        except Exception as e:
+            # only a definite "not found" is reported; other failures just skip the check
+            if report_missing and (getattr(e, "status", None) == 404 or type(e).__name__ == "SalesforceResourceNotFound"):
+                self.errors.append(f"sObject type '{name}' is not supported.{_suggest(name, self.known_objects)}")
+            return None
+
+    async def query(self, q: Query, parent: Optional[Dict[str, Any]] = None) -> None:
+        obj_tok = self.toks[q.obj_index]
+        if q.kind == "child":
+            if parent is None:
+                return
+            rels = {r["relationshipName"].lower(): r for r in parent.get("childRelationships", []) if r.get("relationshipName")}
+            rel = rels.get(obj_tok.text.lower())
+            if rel is None:
+                names = [r["relationshipName"] for r in rels.values()]
+                self.errors.append(f"Didn't understand relationship '{obj_tok.text}' in FROM part of the subquery on "
+                                   f"{parent['name']}; use the child relationship name.{_suggest(obj_tok.text, names)}")
+                return
+            self.replace[q.obj_index] = rel["relationshipName"]
+            desc = await self._desc(rel["childSObject"])
+        else:
+            desc = await self._desc(obj_tok.text, report_missing=True)
+            if desc is not None:
+                self.replace[q.obj_index] = desc["name"]
+        if desc is None:
+            return                                  # can't check what we can't describe
+
+        for idx in q.refs:
+            await self.path(idx, q, desc)
+        for sub in q.subqueries:
+            await self.query(sub, desc)
+
+    async def path(self, idx: int, q: Query, desc: Dict[str, Any]) -> None:
+        text = self.toks[idx].text
+        parts = text.split(".")
+        prefix: List[str] = []
+        if q.alias and len(parts) > 1 and parts[0].lower() == q.alias.lower():
+            prefix, parts = [parts[0]], parts[1:]
+        if len(parts) == 1 and parts[0].lower() in q.aliases:
+            return
+        descs, canonical = [desc], list(prefix)
+        for depth, part in enumerate(parts):
+            fields = [f for d in descs for f in d.get("fields", [])]
+            if depth == len(parts) - 1:
+                match = next((f for f in fields if f["name"].lower() == part.lower()), None)
+                if match is None:
+                    owner = "/".join(d["name"] for d in descs)
+                    self.errors.append(f"No such column '{part}' on {owner} (in '{text}')."
+                                       f"{_suggest(part, [f['name'] for f in fields])}")
+                    return
+                canonical.append(match["name"])
+                break
+            rel = next((f for f in fields if (f.get("relationshipName") or "").lower() == part.lower()), None)
+            if rel is None:
+                owner = "/".join(d["name"] for d in descs)
+                hint = _suggest(part, [f["relationshipName"] for f in fields if f.get("relationshipName")])
+                as_field = next((f for f in fields if f["name"].lower() == part.lower() and f.get("relationshipName")), None)
+                if as_field is not None:
+                    hint = f" '{as_field['name']}' is a field; traverse it as '{as_field['relationshipName']}'."
+                self.errors.append(f"Didn't understand relationship '{part}' in field path '{text}' on {owner}.{hint}")
+                return
+            canonical.append(rel["relationshipName"])
+            targets = rel.get("referenceTo") or []
+            if len(targets) != 1:
+                return                              # polymorphic (What, Who, Owner…): not checked further
+            nxt = await self._desc(targets[0])
+            if nxt is None:
+                return
+            descs = [nxt]
+        self.replace[idx] = ".".join(canonical)
+
+
+async def validate_soql(soql: str, describe: Describe, known_objects: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    {"checked": bool, "errors": [...], "normalized": str}. `checked` is False when
+    the query uses syntax this parser doesn't follow; it is then returned as is.
+    """
+    try:
+        toks, q, keyword_at = parse(soql)
+    except SoqlSyntaxError:
+        return {"checked": False, "errors": [], "normalized": soql}
+    v = _Validator(toks, describe, known_objects or [])
+    await v.query(q)
+    return {"checked": not q.partial, "errors": v.errors, "normalized": render(toks, keyword_at, v.replace)}
+
+
+def normalize(soql: str) -> str:
+    """Describe-free normalization (keywords and spacing only); the input unchanged if it doesn't parse."""
+    try:
+        toks, _, keyword_at = parse(soql)
+    except SoqlSyntaxError:
+        return soql
+    return render(toks, keyword_at)
@@ -1,7 +1,7 @@
 # sse_bus.py
-import asyncio, json
-from typing import Dict, Optional
-import requests
+import asyncio, json, os, time, uuid
+from typing import Dict, List, Optional
+import httpx
 
 JSONRPC = "2.0"
 
@@ -11,6 +11,15 @@ TOPIC_NAME = "sample-topic"
 
 # Use rawPayload so the subscriber receives your JSON as-is (not CloudEvent-wrapped)
 URL = f"http://localhost:{DAPR_HTTP_PORT}/v1.0/publish/{PUBSUB_NAME}/{TOPIC_NAME}?metadata.rawPayload=true"
+BULK_URL = f"http://localhost:{DAPR_HTTP_PORT}/v1.0-alpha1/publish/bulk/{PUBSUB_NAME}/{TOPIC_NAME}?metadata.rawPayload=true"
+
+# Publisher tuning
+DAPR_FLUSH_INTERVAL = float(os.getenv("DAPR_FLUSH_INTERVAL", "0.05"))    # seconds to wait while filling a batch
+DAPR_MAX_BATCH = int(os.getenv("DAPR_MAX_BATCH", "100"))                  # entries per bulk-publish call
+DAPR_MAX_BUFFER = int(os.getenv("DAPR_MAX_BUFFER", "10000"))              # pending entries before backpressure
+DAPR_ENQUEUE_TIMEOUT = float(os.getenv("DAPR_ENQUEUE_TIMEOUT", "0.5"))    # max wait on a full buffer, then drop
+DAPR_MAX_RETRIES = int(os.getenv("DAPR_MAX_RETRIES", "3"))
+
 def sse_event(data: dict, event: str = "message") -> str:
     return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
@@ -24,9 +33,142 @@ class Session:
         if not self.closed:
             await self.q.put(msg)
 
+    async def next_message(self, timeout: float) -> Optional[str]:
+        """Wait for the next queued message; None if the stream stayed idle for `timeout`."""
+        try:
+            return await asyncio.wait_for(self.q.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
     def close(self) -> None:
         self.closed = True
 
+class DaprPublisher:
+    """
+    Async, batched publisher for the Dapr sidecar.
+    Payloads are buffered in a bounded queue and flushed by a background task as
+    bulk-publish calls over one pooled httpx client. When the buffer is full,
+    publish() waits up to `enqueue_timeout` (backpressure) and then drops;
+    publish_nowait() drops straight away, for callers that must not wait on Dapr.
+    """
+    def __init__(self, url: str = BULK_URL, flush_interval: float = DAPR_FLUSH_INTERVAL,
+                 max_batch: int = DAPR_MAX_BATCH, max_buffer: int = DAPR_MAX_BUFFER,
+                 enqueue_timeout: float = DAPR_ENQUEUE_TIMEOUT, max_retries: int = DAPR_MAX_RETRIES) -> None:
+        self.url = url
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._q: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_buffer)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"published": 0, "batches": 0, "dropped": 0, "retried": 0, "failed": 0}
+
+    def _ensure_started(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(5.0),
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+            )
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def publish(self, payload: dict) -> bool:
+        if self.publish_nowait(payload, drop=False):
+            return True
+        try:
+            await asyncio.wait_for(self._q.put(payload), timeout=self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._dropped(payload)
+            return False
+
+    def publish_nowait(self, payload: dict, drop: bool = True) -> bool:
+        self._ensure_started()
+        try:
+            self._q.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            if drop:
+                self._dropped(payload)
+            return False
+
+    def _dropped(self, payload: dict) -> None:
+        self.stats["dropped"] += 1
+        print(f"[dapr] buffer full, dropped payload for session {payload.get('session_id')}", flush=True)
+
+    async def _next_batch(self) -> List[dict]:
+        batch = [await self._q.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._q.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _send(self, batch: List[dict]) -> None:
+        entries: Dict[str, dict] = {}
+        for p in batch:
+            entry_id = str(uuid.uuid4())
+            entries[entry_id] = {"entryId": entry_id, "event": p, "contentType": "application/json"}
+
+        backoff = 0.1
+        for attempt in range(self.max_retries + 1):
+            try:
+                r = await self._client.post(self.url, json=list(entries.values()))
+                if r.status_code < 300:
+                    self.stats["published"] += len(entries)
+                    self.stats["batches"] += 1
+                    return
+                # Dapr reports partial failures per entry; retry only those
+                body = r.json() if r.content else {}
+                if not isinstance(body, dict):
+                    body = {}
+                failed_ids = {e.get("entryId") for e in body.get("failedEntries", [])}
+                if failed_ids:
+                    self.stats["published"] += len(entries) - len(failed_ids & entries.keys())
+                    entries = {k: v for k, v in entries.items() if k in failed_ids}
+                print(f"[dapr] bulk publish status={r.status_code} pending={len(entries)}", flush=True)
+            except (httpx.HTTPError, ValueError) as exc:
+                print(f"[dapr] bulk publish error: {exc}", flush=True)
+            if attempt < self.max_retries:
+                self.stats["retried"] += 1
+                await asyncio.sleep(backoff)
+                backoff *= 2
+        self.stats["failed"] += len(entries)
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send(batch)
+            finally:
+                for _ in batch:
+                    self._q.task_done()
+
+    async def aclose(self) -> None:
+        """Flush whatever is buffered, then stop the flush task and close the client."""
+        if self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._q.join(), timeout=5.0)
+            except asyncio.TimeoutError:
+                print(f"[dapr] shutdown with {self._q.qsize()} unpublished entries", flush=True)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+DAPR = DaprPublisher()
+
 class SessionManager:
     def __init__(self) -> None:
         self._sessions: Dict[str, Session] = {}
@@ -42,10 +184,10 @@ class SessionManager:
 
     async def publish(self, session_id: str, msg: str) -> None:
         s = await self.get_or_create(session_id)
-        payload = {"session_id": session_id, "message": msg}
-        print("Publishing:", payload)
-        r = requests.post(URL, json=payload)
+        # local subscribers first; the Dapr fan-out is batched in the background and never
+        # holds up a frame (a full buffer drops the Dapr copy, counted in DAPR.stats)
         await s.publish(msg)
+        DAPR.publish_nowait({"session_id": session_id, "message": msg})
 
     async def delete(self, session_id: str) -> bool:
         async with self._lock:
@@ -65,6 +207,10 @@ class SessionManager:
         async with self._lock:
             return session_id in self._sessions
 
+    async def session_ids(self) -> List[str]:
+        async with self._lock:
+            return [sid for sid, s in self._sessions.items() if not s.closed]
+
 SESSIONS = SessionManager()
 
 # Optional: map user_id -> session_id for actor lookups
@@ -78,15 +224,24 @@ def session_for_user(user_id: str) -> Optional[str]:
     return _USER_SESSION.get(user_id)
 
 # Convenience publishers
-async def publish_progress(session_id: str, token: str, progress: float) -> None:
+async def publish_progress(session_id: str, token: str, progress: float, extra: dict | None = None) -> None:
+    """`progress` is a 0–1 fraction; anything else (counts, states) goes in `extra`."""
     payload = {
         "jsonrpc": JSONRPC,
         "method": "notifications/progress",
         "params": {"progressToken": token, "progress": float(progress)},
     }
+    if extra:
+        payload["params"].update(extra)
     print(f"Publishing progress: {progress} (token: {token})")
     await SESSIONS.publish(session_id, sse_event(payload))
 
+async def publish_tools_list_changed() -> None:
+    """Tell every open session to re-fetch tools/list (a tool description changed)."""
+    msg = sse_event({"jsonrpc": JSONRPC, "method": "notifications/tools/list_changed"})
+    for session_id in await SESSIONS.session_ids():
+        await SESSIONS.publish(session_id, msg)
+
 async def publish_message(session_id: str, text: str, level: str = "info", extra: dict | None = None) -> None:
     
     payload = {
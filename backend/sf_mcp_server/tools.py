@@ -21,9 +21,17 @@ def _schema_from_signature(sig: inspect.Signature) -> dict:
     for name, p in sig.parameters.items():
         if name in {"self", "cls"}:          # ignore typical non-user args
             continue
+        if name == "session_id":             # injected by call_tool, never sent by the model
+            continue
 
-        t = _SIMPLE_TYPES.get(p.annotation, "string")   # fallback to string
+        ann, doc = p.annotation, None
+        if typing.get_origin(ann) is typing.Annotated:   # Annotated[int, "what it is"]
+            ann, *meta = typing.get_args(ann)
+            doc = next((m for m in meta if isinstance(m, str)), None)
+        t = _SIMPLE_TYPES.get(ann, "string")   # fallback to string
         props[name] = {"type": t}
+        if doc:
+            props[name]["description"] = doc
         if p.default is p.empty:
             required.append(name)
 
@@ -49,4 +57,13 @@ def tool(fn: typing.Callable) -> typing.Callable:
         }
     )
     TOOL_FUNCS[fn.__name__] = fn
-    return fn
\ No newline at end of file
+    return fn
+
+def set_tool_description(name: str, description: str) -> bool:
+    """Replace a registered tool's description (e.g. once schemas are known at startup); True if it changed."""
+    for entry in REGISTERED_TOOLS:
+        if entry["name"] == name:
+            changed = entry["description"] != description
+            entry["description"] = description
+            return changed
+    raise KeyError(name)